@@ -1,12 +1,16 @@
 from pathlib import Path
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd 
+import pandas as pd
 from matplotlib.ticker import MultipleLocator, FuncFormatter
 from matplotlib.cm import get_cmap
 from matplotlib.colors import to_hex, ListedColormap, BoundaryNorm
 from matplotlib.patches import Patch
 
+from radmodel.common import TICK_DURATION, TICKS_PER_DAY
+from radmodel.movement import load_movements
+from radmodel.population import P_ID_IDX
+
 
 class MovementVisualizer:
     def __init__(self, input_dir="data", output_dir="analysis"):
@@ -19,30 +23,34 @@ class MovementVisualizer:
     def load_data(self):
         self.residents_df = pd.read_csv(self.input_dir / "ng_residents.csv")
         self.places_df = pd.read_csv(self.input_dir / "ng_places.csv")
-        self.schedules_df = pd.read_csv(self.input_dir / "ng_schedules.csv")
-        self.movement_df = pd.read_csv(Path("output") / "counts_by_place_5.csv")
-        self.merged_movement = self.movement_df.merge(self.places_df, on="place_id")
+        # the places' rows are in place row idx order
+        self.place_names = self.places_df["name"].to_numpy()
+        self.place_types = self.places_df["type"].to_numpy()
+        self.movements = load_movements(self.input_dir / "ng_schedules.csv", self.input_dir / "ng_places.csv",
+                                        self.input_dir / "ng_residents.csv")
 
     def format_time(self, x, pos):
         return f"{int(x) // 60:02d}:{int(x) % 60:02d}"
 
+    def _sorted_places(self, place_idxs):
+        # cells first, then by name
+        names = self.place_names[place_idxs]
+        return place_idxs[np.lexsort((names, ~np.char.startswith(names.astype(str), "cell")))]
+
     def plot_occupancy(self, place_type):
-        df = self.merged_movement[self.merged_movement["type"] == place_type]
-        
-        if df["name"].nunique() > 1:
-            raise ValueError("This version of plot_occupancy expects only one room.")
+        # total occupancy of the places of the type over the day, from the persons' schedules
+        place_idxs = np.nonzero(self.place_types == place_type)[0]
+        counts = self.movements.occupancy(place_idxs).sum(axis=0)
 
         plt.figure(figsize=(10, 5))
-        room_name = df["name"].unique()[0]
-        
-        # Simple bar plot: x = tick, y = person_count
-        plt.bar(df["tick"], df["person_count"], width=1, align="edge", color="tab:blue")
+        plt.bar(np.arange(TICKS_PER_DAY), counts, width=1, align="edge", color="tab:blue")
 
         plt.xticks(self.hour_ticks, self.hour_labels, rotation=45)
         plt.xlim(0, 96)
         plt.xlabel("Time of Day")
         plt.ylabel("Number of People")
-        plt.title(f"{room_name.title()} Occupancy – First Day Only")
+        title = self.place_names[place_idxs[0]].title() if place_idxs.shape[0] == 1 else place_type.title()
+        plt.title(f"{title} Occupancy")
         plt.grid(True, axis="y")
         plt.tight_layout()
         plt.savefig(self.output_dir / f"{place_type}_occupancy.png")
@@ -50,59 +58,37 @@ class MovementVisualizer:
 
 
     def plot_gantt_for_persons(self, person_ids):
-        person_colors = {pid: to_hex(get_cmap("tab10")(i)) for i, pid in enumerate(person_ids)}
-        place_rows = []
+        person_colors = {pid: to_hex(get_cmap("tab10")(i % 10)) for i, pid in enumerate(person_ids)}
+        stays = self.movements.stays(self.movements.person_idxs(person_ids))
+        stay_person_ids = self.movements.residents[stays["person_idx"], P_ID_IDX]
+
+        unique_places = self._sorted_places(np.unique(stays["place_idx"]))
+        place_to_y = np.zeros(self.place_names.shape[0], dtype=np.int64)
+        place_to_y[unique_places] = np.arange(unique_places.shape[0])
+
+        # persons in the same place at the same time are drawn side by side
+        order = np.lexsort((stay_person_ids, stays["start"], stays["place_idx"]))
+        key = stays["place_idx"][order] * TICKS_PER_DAY + stays["start"][order]
+        first = np.searchsorted(key, key)
+        offsets = np.empty(order.shape[0], dtype=np.int64)
+        offsets[order] = np.arange(order.shape[0]) - first
+        ys = place_to_y[stays["place_idx"]] + (offsets - 1) * 0.2
 
-        for pid in person_ids:
-            row = self.residents_df[self.residents_df["person_id"] == pid].iloc[0]
-            schedule_id = row["schedule_id"]
-            sched = self.schedules_df[self.schedules_df["schedule_id"] == schedule_id].copy()
-            sched["place_id"] = sched["place_type"].apply(lambda pt: row[pt])
-            sched = sched.merge(self.places_df, on="place_id").sort_values("start")
-            sched["duration"] = sched["start"].shift(-1) - sched["start"]
-            sched.loc[sched.index[-1], "duration"] = 1440 - sched["start"].iloc[-1]
-
-            for _, r in sched.iterrows():
-                place_rows.append({
-                    "person_id": pid,
-                    "place_label": r["name"],
-                    "start": r["start"],
-                    "duration": r["duration"]
-                })
-
-        df = pd.DataFrame(place_rows)
-        unique_places = sorted(df["place_label"].unique(), key=lambda x: ("cell" not in x, x))
-        place_to_y = {place: i for i, place in enumerate(unique_places)}
-
-        row_offsets = {}
         plt.figure(figsize=(12, 6))
-        for _, row in df.iterrows():
-            y_base = place_to_y[row["place_label"]]
-            key = (row["place_label"], row["start"])
-            offset = row_offsets.get(key, 0)
-            row_offsets[key] = offset + 1
-            y = y_base + (offset - 1) * 0.2
-
-            label = f"Person {row['person_id']}"
-            if label not in plt.gca().get_legend_handles_labels()[1]:
+        starts = stays["start"] * TICK_DURATION
+        durations = (stays["end"] - stays["start"]) * TICK_DURATION
+        for pid in person_ids:
+            for j, i in enumerate(np.nonzero(stay_person_ids == pid)[0]):
                 plt.broken_barh(
-                    [(row["start"], row["duration"])],
-                    (y - 0.15, 0.3),
-                    facecolors=person_colors[row["person_id"]],
+                    [(starts[i], durations[i])],
+                    (ys[i] - 0.15, 0.3),
+                    facecolors=person_colors[pid],
                     edgecolors="black",
                     alpha=0.7,
-                    label=label
-                )
-            else:
-                plt.broken_barh(
-                    [(row["start"], row["duration"])],
-                    (y - 0.15, 0.3),
-                    facecolors=person_colors[row["person_id"]],
-                    edgecolors="black",
-                    alpha=0.7
+                    label=f"Person {pid}" if j == 0 else None
                 )
 
-        plt.yticks(range(len(unique_places)), unique_places)
+        plt.yticks(range(unique_places.shape[0]), self.place_names[unique_places])
         plt.gca().xaxis.set_major_locator(MultipleLocator(120))
         plt.gca().xaxis.set_major_formatter(FuncFormatter(self.format_time))
         plt.xticks(rotation=45)
@@ -132,68 +118,30 @@ class MovementVisualizer:
         Heatmap of where each person is over the day.
         Rows = people, columns = time bins, color = place.
         """
-        # Build the same per-person schedule as in plot_gantt_for_persons
-        place_rows = []
-        for pid in person_ids:
-            row = self.residents_df[self.residents_df["person_id"] == pid].iloc[0]
-            schedule_id = row["schedule_id"]
-            sched = self.schedules_df[self.schedules_df["schedule_id"] == schedule_id].copy()
-            sched["place_id"] = sched["place_type"].apply(lambda pt: row[pt])
-            sched = sched.merge(self.places_df, on="place_id").sort_values("start")
-            sched["duration"] = sched["start"].shift(-1) - sched["start"]
-            sched.loc[sched.index[-1], "duration"] = 1440 - sched["start"].iloc[-1]
-
-            for _, r in sched.iterrows():
-                place_rows.append({
-                    "person_id": pid,
-                    "place_label": r["name"],
-                    "start": r["start"],
-                    "duration": r["duration"]
-                })
-
-        df = pd.DataFrame(place_rows)
-
-        # Order persons and places in a stable way
         person_ids = list(person_ids)
-        person_to_row = {pid: i for i, pid in enumerate(person_ids)}
-
-        unique_places = sorted(df["place_label"].unique(), key=lambda x: ("cell" not in x, x))
-        place_to_idx = {place: i for i, place in enumerate(unique_places)}
-
-        # Time discretization
-        n_bins = 1440 // bin_minutes
-        mat = np.full((len(person_ids), n_bins), fill_value=-1, dtype=int)
-
-        for _, r in df.iterrows():
-            pid = r["person_id"]
-            if pid not in person_to_row:
-                continue
-            row_idx = person_to_row[pid]
-            place_idx = place_to_idx[r["place_label"]]
-
-            start_min = int(r["start"])
-            end_min = int(r["start"] + r["duration"])
-            start_bin = start_min // bin_minutes
-            end_bin = min(n_bins, (end_min + bin_minutes - 1) // bin_minutes)
-
-            if start_bin < end_bin:
-                mat[row_idx, start_bin:end_bin] = place_idx
+        # place row idx at the start of each time bin
+        locations = self.movements.locations(self.movements.person_idxs(person_ids))
+        locations = locations[:, ::max(bin_minutes // TICK_DURATION, 1)]
+        n_bins = locations.shape[1]
 
-        # Mask "no data" entries
-        mat_masked = np.ma.masked_where(mat < 0, mat)
+        unique_places = self._sorted_places(np.unique(locations))
+        place_to_idx = np.zeros(self.place_names.shape[0], dtype=np.int64)
+        place_to_idx[unique_places] = np.arange(unique_places.shape[0])
+        mat = place_to_idx[locations]
 
         # Categorical colormap for places
-        colors = [get_cmap("tab20")(i % 20) for i in range(len(unique_places))]
+        colors = [get_cmap("tab20")(i % 20) for i in range(unique_places.shape[0])]
         cmap = ListedColormap(colors)
-        bounds = np.arange(len(unique_places) + 1) - 0.5
+        bounds = np.arange(unique_places.shape[0] + 1) - 0.5
         norm = BoundaryNorm(bounds, cmap.N)
 
         fig, ax = plt.subplots(figsize=(12, max(4, len(person_ids) * 0.25)))
-        im = ax.imshow(mat_masked, aspect="auto", cmap=cmap, norm=norm)
+        im = ax.imshow(mat, aspect="auto", cmap=cmap, norm=norm, interpolation="nearest")
 
-        # Y axis: people
-        ax.set_yticks(range(len(person_ids)))
-        ax.set_yticklabels([f"P{pid}" for pid in person_ids])
+        # Y axis: people, labelled if there are few enough to read
+        if len(person_ids) <= 100:
+            ax.set_yticks(range(len(person_ids)))
+            ax.set_yticklabels([f"P{pid}" for pid in person_ids])
 
         # X axis: time of day in hours
         bins_per_hour = 60 // bin_minutes
@@ -212,8 +160,9 @@ class MovementVisualizer:
         ax.set_title("Daily Movement Heatmap")
 
         # Legend for places
-        legend_handles = [Patch(color=colors[i], label=unique_places[i]) for i in range(len(unique_places))]
-        ax.legend(handles=legend_handles, title="Location", bbox_to_anchor=(1.01, 1), loc="upper left")
+        if unique_places.shape[0] <= 40:
+            legend_handles = [Patch(color=colors[i], label=self.place_names[p]) for i, p in enumerate(unique_places)]
+            ax.legend(handles=legend_handles, title="Location", bbox_to_anchor=(1.01, 1), loc="upper left")
 
         plt.tight_layout()
         self.output_dir.mkdir(parents=True, exist_ok=True)
@@ -1,49 +1,84 @@
-from typing import Dict
-from mpi4py import MPI
+import argparse
+import json
 import os
+from typing import Dict
 
-from repast4py.parameters import create_args_parser, init_params
-from . import population
-from . import core
+# numpy, mpi4py, repast4py and the model modules are imported when needed, so that
+# --help and serial runs start quickly and serial runs never initialise MPI
 
 
-def run(params: Dict, comm):
+def create_args_parser():
+    # same arguments as repast4py.parameters.create_args_parser
+    parser = argparse.ArgumentParser(prog="radmodel")
+    parser.add_argument("parameters_file", help="parameters file (yaml format)")
+    parser.add_argument("parameters", nargs="?", default="{}", help="json parameters string")
+    return parser
 
-    fname = params["schedule_file"]
-    schedule_id_map, schedule_data, risks = population.create_schedules(fname)
-    fname = params["places_file"]
-    places: population.Places = population.create_places(fname)
-    fname = params["residents_file"]
-    residents = population.create_residents(fname, places.place_id_map, schedule_id_map)
 
-    duration_matrix = core.create_duration_matrix(params)
-    trans_matrix = core.create_trans_matrix(params["transition_matrix"])
-    stoe = params["stoe"]
+def init_params(parameters_file: str, parameters: str) -> Dict:
+    # reads the parameters file, overriding its values with those in the json parameters string
+    import yaml
+    with open(parameters_file) as fin:
+        params = yaml.safe_load(fin)
+    if parameters != "":
+        params.update(json.loads(parameters))
+    return params
 
-    model = core.Model(comm, schedule_data, residents, places, stoe, trans_matrix, duration_matrix,
-                       params["random_seed"], params)
+
+def run(params: Dict, comm):
+    # comm is None for a serial run
+    from . import core
+
+    model = core.create_model(params, comm)
     model.run()
 
 
-def main():
-    parser = create_args_parser()
-    args = parser.parse_args()
-    params = init_params(args.parameters_file, args.parameters)
-    params_dir = os.path.dirname(args.parameters_file)
+def _substitute(v, params_dir: str, out_dir: str):
+    # replaces the $ variables in string values, including those nested in lists and dicts (e.g. facilities)
+    if isinstance(v, dict):
+        return {k: _substitute(val, params_dir, out_dir) for k, val in v.items()}
+    if isinstance(v, list):
+        return [_substitute(val, params_dir, out_dir) for val in v]
+    if isinstance(v, str):
+        if "$this" in v:
+            v = v.replace("$this", params_dir)
+        if "$outdir" in v:
+            v = v.replace("$outdir", out_dir)
+        if "$HOME" in v:
+            v = v.replace("$HOME", os.getenv("HOME"))
+        if "$JOBNAME" in v:
+            v = v.replace("$JOBNAME", os.getenv("SLURM_JOB_NAME"))
+    return v
+
+
+def resolve_params(params: Dict, parameters_file: str) -> Dict:
+    # substitutes the $ variables and creates the output directory
+    params_dir = os.path.dirname(parameters_file)
     out_dir = params.get("output_dir", "output")
     for k, v in params.items():
-        if isinstance(v, str):
-            if "$this" in v:
-                v = v.replace("$this", params_dir)
-            if "$outdir" in v:
-                v = v.replace("$outdir", out_dir)
-            if "$HOME" in v:
-                v = v.replace("$HOME", os.getenv("HOME"))
-            if "$JOBNAME" in v:
-                v = v.replace("$JOBNAME", os.getenv("SLURM_JOB_NAME"))
-            params[k] = v
+        params[k] = _substitute(v, params_dir, out_dir)
     os.makedirs(out_dir, exist_ok=True)
-    run(params, MPI.COMM_WORLD)
+    return params
+
+
+def init_comm(params: Dict):
+    # MPI.COMM_WORLD, or None for the serial backend. Serial runs don't seed repast4py's default
+    # generator from random.seed, as importing repast4py.random initialises MPI, and the model
+    # draws only from its own generator (random_seed).
+    if params.get("backend", "mpi") == "serial":
+        return None
+    from mpi4py import MPI
+    if "random.seed" in params:
+        from repast4py import random
+        random.init(params["random.seed"])
+    return MPI.COMM_WORLD
+
+
+def main():
+    parser = create_args_parser()
+    args = parser.parse_args()
+    params = resolve_params(init_params(args.parameters_file, args.parameters), args.parameters_file)
+    run(params, init_comm(params))
 
 
 if __name__ == "__main__":
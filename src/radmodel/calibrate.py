@@ -0,0 +1,217 @@
+import csv
+from dataclasses import dataclass
+from typing import Dict, List, Union
+
+import numpy as np
+
+from .common import TICKS_PER_DAY
+
+# Sequential Monte Carlo ABC calibration of model parameters (e.g. stoe and the state durations)
+# against target count series. Candidates run in memory, and the distance to the targets is
+# accumulated as each day's counts are written, so a candidate is stopped as soon as its
+# distance exceeds the generation's acceptance threshold rather than being run to stop.at.
+
+
+class RunningDistance:
+    # Euclidean distance between a run's counts and the target series, which is a dict of tick
+    # and count name (e.g. exposed) -> values. As the distance is accumulated over the target
+    # ticks written so far, it can only grow as the run continues.
+
+    def __init__(self, target: Dict[str, np.array], scales: Dict[str, float] = None):
+        self.ticks = np.asarray(target["tick"])
+        self.names = [name for name in target if name != "tick"]
+        self.target = np.column_stack([target[name] for name in self.names]).astype(np.float64)
+        scales = {} if scales is None else scales
+        self.scales = np.array([scales.get(name, 1.0) for name in self.names], dtype=np.float64)
+        self.n_evaluated = 0
+        self.sum_sq = 0.0
+
+    @property
+    def value(self) -> float:
+        return float(np.sqrt(self.sum_sq))
+
+    def update(self, series: Dict[str, np.array]) -> float:
+        # adds the target ticks that have been written since the last update
+        ticks = series["tick"]
+        if ticks.shape[0] == 0:
+            return self.value
+        end = int(np.searchsorted(self.ticks, ticks[-1], side="right"))
+        new_ticks = self.ticks[self.n_evaluated:end]
+        rows = np.searchsorted(ticks, new_ticks)
+        if np.any(ticks[np.minimum(rows, ticks.shape[0] - 1)] != new_ticks):
+            raise ValueError("Target ticks must be logged ticks")
+        sim = np.column_stack([series[name][rows] for name in self.names])
+        diff = (sim - self.target[self.n_evaluated:end]) / self.scales
+        self.sum_sq += float(np.sum(diff * diff))
+        self.n_evaluated = end
+        return self.value
+
+
+@dataclass
+class Simulation:
+    distance: float
+    # whether the run was stopped early because its distance exceeded the threshold
+    rejected: bool
+    # last tick run
+    tick: float
+
+
+def simulate(params: Dict, target: Dict[str, np.array], threshold: float = np.inf, pop=None,
+             scales: Dict[str, float] = None) -> Simulation:
+    # Runs the model serially with its counts kept in memory, stopping it as soon as the
+    # distance to the target exceeds the threshold
+    from .core import create_model
+    run_params = dict(params, counts_log_format="memory", places_log_format="none")
+    model = create_model(run_params, None, None if pop is None else pop.copy())
+    distance = RunningDistance(target, scales)
+    rejected = False
+
+    def check():
+        nonlocal rejected
+        if distance.update(model.data_set.series()) > threshold:
+            rejected = True
+            model.runner.stop()
+
+    # just after each of the model's daily writes
+    model.runner.schedule_repeating_event(TICKS_PER_DAY + 0.15, TICKS_PER_DAY, check)
+    model.run()
+    distance.update(model.data_set.series())
+    return Simulation(distance.value, rejected, model.runner.tick())
+
+
+class Prior:
+    # Independent uniform or log uniform priors, e.g.
+    #   stoe: [0.01, 0.5]
+    #   exposed_duration_mean: {dist: loguniform, low: 1, high: 10}
+
+    def __init__(self, priors: Dict[str, Union[List[float], Dict]]):
+        self.names = list(priors)
+        self.low = np.zeros(len(priors))
+        self.high = np.zeros(len(priors))
+        self.log = np.zeros(len(priors), dtype=bool)
+        for i, prior in enumerate(priors.values()):
+            if isinstance(prior, dict):
+                self.low[i], self.high[i] = prior["low"], prior["high"]
+                self.log[i] = prior.get("dist", "uniform") == "loguniform"
+            else:
+                self.low[i], self.high[i] = prior
+
+    def sample(self, rng: np.random.Generator, n: int) -> np.array:
+        u = rng.random((n, len(self.names)))
+        lin = self.low + u * (self.high - self.low)
+        log = np.exp(np.log(self.low) + u * (np.log(self.high) - np.log(self.low)))
+        return np.where(self.log, log, lin)
+
+    def density(self, thetas: np.array) -> np.array:
+        # unnormalised density of each row of thetas
+        inside = np.all((thetas >= self.low) & (thetas <= self.high), axis=1)
+        log_density = np.where(self.log, 1 / np.where(thetas > 0, thetas, 1), 1.0)
+        return np.where(inside, np.prod(log_density, axis=1), 0.0)
+
+
+@dataclass
+class Generation:
+    epsilon: float
+    particles: np.array
+    weights: np.array
+    distances: np.array
+    n_simulations: int
+    n_early_rejected: int
+    ticks_simulated: float
+
+
+def smc_abc(params: Dict, target: Dict[str, np.array], priors: Dict, n_particles: int, n_generations: int,
+            quantile: float = 0.5, seed: int = None, pop=None, scales: Dict[str, float] = None,
+            max_simulations: int = None) -> List[Generation]:
+    # Population Monte Carlo ABC (Beaumont et al. 2009). The first generation samples the prior
+    # and runs every candidate to the end, each later generation's threshold is the quantile of
+    # the previous generation's distances, and its candidates are perturbed, weighted
+    # resamples of the previous particles. A generation ends when n_particles are
+    # accepted or after max_simulations runs.
+    from .core import load_population
+    rng = np.random.default_rng(seed)
+    prior = Prior(priors)
+    pop = load_population(params) if pop is None else pop
+    max_simulations = n_particles * 100 if max_simulations is None else max_simulations
+
+    generations = []
+    for _ in range(n_generations):
+        prev = generations[-1] if len(generations) > 0 else None
+        epsilon = np.inf if prev is None else float(np.quantile(prev.distances, quantile))
+        if prev is not None:
+            # Gaussian perturbation kernel with twice the weighted variance of the previous particles
+            mean = np.average(prev.particles, axis=0, weights=prev.weights)
+            sigma = np.sqrt(2 * np.average((prev.particles - mean) ** 2, axis=0, weights=prev.weights))
+            sigma = np.where(sigma > 0, sigma, 1e-12)
+
+        particles, distances = [], []
+        n_simulations = n_early_rejected = 0
+        ticks_simulated = 0.0
+        while len(particles) < n_particles and n_simulations < max_simulations:
+            if prev is None:
+                theta = prior.sample(rng, 1)[0]
+            else:
+                theta = prev.particles[rng.choice(prev.particles.shape[0], p=prev.weights)]
+                theta = theta + rng.normal(0, sigma)
+                if prior.density(theta[None, :])[0] == 0:
+                    continue
+
+            run_params = dict(params, random_seed=int(rng.integers(2 ** 31)), **dict(zip(prior.names, theta)))
+            sim = simulate(run_params, target, epsilon, pop, scales)
+            n_simulations += 1
+            ticks_simulated += sim.tick
+            if sim.rejected:
+                n_early_rejected += 1
+            elif sim.distance <= epsilon:
+                particles.append(theta)
+                distances.append(sim.distance)
+
+        if len(particles) == 0:
+            break
+        particles = np.array(particles)
+        if prev is None:
+            weights = np.ones(particles.shape[0])
+        else:
+            kernel = np.exp(-0.5 * np.sum(((particles[:, None, :] - prev.particles[None, :, :]) / sigma) ** 2,
+                                          axis=2))
+            weights = prior.density(particles) / (kernel @ prev.weights)
+        generations.append(Generation(epsilon, particles, weights / weights.sum(), np.array(distances),
+                                      n_simulations, n_early_rejected, ticks_simulated))
+
+    return generations
+
+
+def read_target(fname: str) -> Dict[str, np.array]:
+    # csv with a tick column and a column per count, e.g. tick,exposed,infected_symp
+    data = np.genfromtxt(fname, delimiter=",", names=True)
+    return {name: data[name] for name in data.dtype.names}
+
+
+def write_generations(fname: str, names: List[str], generations: List[Generation]):
+    with open(fname, "w") as fout:
+        writer = csv.writer(fout)
+        writer.writerow(["generation", "epsilon"] + names + ["weight", "distance"])
+        for g, gen in enumerate(generations):
+            for theta, weight, distance in zip(gen.particles, gen.weights, gen.distances):
+                writer.writerow([g, gen.epsilon] + theta.tolist() + [weight, distance])
+
+
+def main():
+    from .__main__ import create_args_parser, init_params, resolve_params
+    parser = create_args_parser()
+    parser.prog = "radmodel.calibrate"
+    args = parser.parse_args()
+    params = resolve_params(init_params(args.parameters_file, args.parameters), args.parameters_file)
+
+    config = params["calibration"]
+    generations = smc_abc(params, read_target(config["target_file"]), config["priors"], config["n_particles"],
+                          config["n_generations"], config.get("quantile", 0.5), params["random_seed"],
+                          scales=config.get("scales"))
+    for g, gen in enumerate(generations):
+        print(f"generation {g}: epsilon {gen.epsilon:.4g}, {gen.n_simulations} runs, "
+              f"{gen.n_early_rejected} stopped early, {gen.ticks_simulated:.0f} ticks")
+    write_generations(config["posterior_file"], list(config["priors"]), generations)
+
+
+if __name__ == "__main__":
+    main()
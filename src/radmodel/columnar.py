@@ -0,0 +1,213 @@
+import json
+import os
+import struct
+import zlib
+from typing import Dict, List, Tuple, Union, Iterable
+
+import numpy as np
+
+# Chunked, compressed columnar files. Layout:
+#   MAGIC, uint32 header length, json header (columns, encodings, dictionaries)
+#   repeated blocks of: uint32 block header length, json block header, column payloads
+# Each block header records its row count, tick range and the compressed size of each
+# column, so a reader can skip whole blocks and unselected columns without
+# decompressing them.
+
+MAGIC = b"RADCOL1\n"
+
+PLAIN = "plain"
+# store the difference to the previous value, first value kept in the block header
+DELTA = "delta"
+# store codes into a dictionary kept in the file header
+DICT = "dict"
+
+_LEN = struct.Struct("<I")
+
+
+def min_int_dtype(min_val: int, max_val: int) -> np.dtype:
+    # smallest integer dtype that can hold [min_val, max_val]
+    if min_val >= 0:
+        for dt in (np.uint8, np.uint16, np.uint32, np.uint64):
+            if max_val <= np.iinfo(dt).max:
+                return np.dtype(dt)
+    for dt in (np.int8, np.int16, np.int32, np.int64):
+        if min_val >= np.iinfo(dt).min and max_val <= np.iinfo(dt).max:
+            return np.dtype(dt)
+    return np.dtype(np.int64)
+
+
+def _narrow(vals: np.array) -> np.array:
+    if vals.dtype.kind not in "iu" or vals.shape[0] == 0:
+        return vals
+    return vals.astype(min_int_dtype(int(vals.min()), int(vals.max())), copy=False)
+
+
+class ColumnarWriter:
+
+    def __init__(self, fname: Union[str, os.PathLike], columns: Dict[str, Tuple[np.dtype, str]],
+                 dictionaries: Dict[str, np.array] = None, tick_column: str = "tick",
+                 chunk_rows: int = 1 << 16, level: int = 6):
+        """Creates a writer for the specified columns. Each column maps to
+        a (dtype, encoding) tuple. DICT encoded columns must have an entry
+        in dictionaries and are appended as codes into that dictionary.
+        """
+        self.fname = fname
+        self.columns = {name: (np.dtype(dt), enc) for name, (dt, enc) in columns.items()}
+        self.tick_column = tick_column
+        self.chunk_rows = chunk_rows
+        self.level = level
+        self._buffers = {name: [] for name in self.columns}
+        self._n_buffered = 0
+
+        dictionaries = {} if dictionaries is None else dictionaries
+        header = {
+            "tick_column": tick_column,
+            "columns": [{"name": name, "dtype": dt.str, "encoding": enc} for name, (dt, enc) in
+                        self.columns.items()],
+            "dictionaries": {name: {"dtype": np.asarray(vals).dtype.str, "values": np.asarray(vals).tolist()}
+                             for name, vals in dictionaries.items()}
+        }
+        for name, (_, enc) in self.columns.items():
+            if enc == DICT and name not in dictionaries:
+                raise ValueError(f"Column {name} is dictionary encoded, but has no dictionary")
+
+        header_bytes = json.dumps(header).encode()
+        with open(self.fname, "wb") as fout:
+            fout.write(MAGIC)
+            fout.write(_LEN.pack(len(header_bytes)))
+            fout.write(header_bytes)
+
+    def append(self, **cols: np.array):
+        n = None
+        for name in self.columns:
+            vals = np.asarray(cols[name])
+            if n is None:
+                n = vals.shape[0]
+            elif vals.shape[0] != n:
+                raise ValueError(f"Column {name} has {vals.shape[0]} rows, expected {n}")
+            self._buffers[name].append(vals)
+        self._n_buffered += n
+
+        if self._n_buffered >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if self._n_buffered == 0:
+            return
+
+        block = {"n_rows": self._n_buffered, "columns": {}}
+        payloads = []
+        for name, (dt, enc) in self.columns.items():
+            vals = np.concatenate(self._buffers[name]).astype(dt, copy=False)
+            self._buffers[name].clear()
+            if name == self.tick_column:
+                block["tick_min"] = vals.min().item()
+                block["tick_max"] = vals.max().item()
+            col = {}
+            if enc == DELTA:
+                col["base"] = vals[0].item()
+                vals = np.diff(vals, prepend=vals[:1])
+            vals = _narrow(vals)
+            payload = zlib.compress(vals.tobytes(), self.level)
+            col["dtype"] = vals.dtype.str
+            col["nbytes"] = len(payload)
+            block["columns"][name] = col
+            payloads.append(payload)
+
+        block_bytes = json.dumps(block).encode()
+        with open(self.fname, "ab") as fout:
+            fout.write(_LEN.pack(len(block_bytes)))
+            fout.write(block_bytes)
+            for payload in payloads:
+                fout.write(payload)
+
+        self._n_buffered = 0
+
+    def close(self):
+        self.flush()
+
+
+class ColumnarReader:
+
+    def __init__(self, fname: Union[str, os.PathLike]):
+        self.fname = fname
+        self.blocks: List[Dict] = []
+        with open(fname, "rb") as fin:
+            if fin.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{fname} is not a columnar radmodel file")
+            header = json.loads(fin.read(_LEN.unpack(fin.read(_LEN.size))[0]))
+            self.tick_column = header["tick_column"]
+            self.columns = {c["name"]: (np.dtype(c["dtype"]), c["encoding"]) for c in header["columns"]}
+            self.dictionaries = {name: np.array(d["values"], dtype=np.dtype(d["dtype"]))
+                                 for name, d in header["dictionaries"].items()}
+
+            # only the block headers are read here, payloads are skipped over
+            while True:
+                raw_len = fin.read(_LEN.size)
+                if len(raw_len) < _LEN.size:
+                    break
+                block = json.loads(fin.read(_LEN.unpack(raw_len)[0]))
+                offset = fin.tell()
+                for name in self.columns:
+                    block["columns"][name]["offset"] = offset
+                    offset += block["columns"][name]["nbytes"]
+                fin.seek(offset)
+                self.blocks.append(block)
+
+    @property
+    def n_rows(self) -> int:
+        return sum(block["n_rows"] for block in self.blocks)
+
+    def _decode(self, fin, block: Dict, name: str) -> np.array:
+        col = block["columns"][name]
+        fin.seek(col["offset"])
+        vals = np.frombuffer(zlib.decompress(fin.read(col["nbytes"])), dtype=np.dtype(col["dtype"]))
+        dt, enc = self.columns[name]
+        if enc == DELTA:
+            # the first delta is 0, so the cumsum starts at base
+            vals = vals.astype(dt).cumsum(dtype=dt) + np.array(col["base"], dtype=dt)
+        elif enc == DICT:
+            return self.dictionaries[name][vals]
+        return vals.astype(dt, copy=False)
+
+    def read(self, columns: Iterable[str] = None, tick_range: Tuple[float, float] = None) -> Dict[str, np.array]:
+        """Reads the specified columns (all if None), optionally restricted to
+        rows whose tick is in the inclusive tick_range. Blocks outside the
+        range and unselected columns are not decompressed.
+        """
+        columns = list(self.columns) if columns is None else list(columns)
+        for name in columns:
+            if name not in self.columns:
+                raise ValueError(f"Unknown column {name}, expected one of {list(self.columns)}")
+
+        parts = {name: [] for name in columns}
+        with open(self.fname, "rb") as fin:
+            for block in self.blocks:
+                mask = None
+                if tick_range is not None:
+                    if block["tick_max"] < tick_range[0] or block["tick_min"] > tick_range[1]:
+                        continue
+                    if block["tick_min"] < tick_range[0] or block["tick_max"] > tick_range[1]:
+                        ticks = self._decode(fin, block, self.tick_column)
+                        mask = (ticks >= tick_range[0]) & (ticks <= tick_range[1])
+
+                for name in columns:
+                    vals = self._decode(fin, block, name)
+                    parts[name].append(vals if mask is None else vals[mask])
+
+        return {name: np.concatenate(vals) if len(vals) > 0 else np.zeros(0, dtype=self.columns[name][0])
+                for name, vals in parts.items()}
+
+    def read_frame(self, columns: Iterable[str] = None, tick_range: Tuple[float, float] = None):
+        import pandas as pd
+        return pd.DataFrame(self.read(columns, tick_range))
+
+
+def read_columnar(fname: Union[str, os.PathLike], columns: Iterable[str] = None,
+                  tick_range: Tuple[float, float] = None) -> Dict[str, np.array]:
+    return ColumnarReader(fname).read(columns, tick_range)
+
+
+def read_columnar_frame(fname: Union[str, os.PathLike], columns: Iterable[str] = None,
+                        tick_range: Tuple[float, float] = None):
+    return ColumnarReader(fname).read_frame(columns, tick_range)
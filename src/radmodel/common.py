@@ -1,3 +1,4 @@
+from pathlib import Path
 import numpy as np
 
 TICK_DURATION = 15
@@ -24,3 +25,19 @@ STATE_MAP = {
     "H": HOSPITALIZED,
     "D": DEAD
 }
+
+# states in which a person is infectious, indexed by state
+INFECTIOUS_MASK = np.zeros(len(STATE_MAP), dtype=bool)
+INFECTIOUS_MASK[[PRESYMPTOMATIC, INFECTED_SYMP, INFECTED_ASYMP]] = True
+
+
+def find_free_filename(file_path: str) -> Path:
+    # as repast4py.util.find_free_filename: adds a numeric infix (counts_1.csv, counts_2.csv, ...)
+    # to the file name until it doesn't exist, without importing repast4py
+    op = Path(file_path)
+    p = Path(file_path)
+    infix = 1
+    while p.exists():
+        p = op.with_name(f"{op.stem}_{infix}{op.suffix}")
+        infix += 1
+    return p
@@ -1,61 +1,39 @@
-from dataclasses import dataclass
+import copy
+import os
+from dataclasses import dataclass, fields
 import numpy as np
-from typing import Dict
-from mpi4py import MPI
-
-from repast4py import logging, schedule, util
-
-from .common import TICKS_PER_DAY, SUSCEPTIBLE, EXPOSED, PRESYMPTOMATIC, INFECTED_SYMP, INFECTED_ASYMP, \
-    RECOVERED, HOSPITALIZED, STATE_MAP, DEAD
-from .population import P_SCHEDULE_IDX, P_CURRENT_PLACE_IDX, P_STATE_IDX, P_NEXT_STATE_T_IDX
-from .population import Places
-
-
-@dataclass
-class Counts:
-    susceptible: int = 0
-    exposed: int = 0
-    presymp: int = 0
-    infected_symp: int = 0
-    infected_asymp: int = 0
-    recovered: int = 0
-    hospitalized: int = 0
-    dead: int = 0
-
-    newly_susceptible: int = 0
-    newly_exposed: int = 0
-    newly_presymp: int = 0
-    newly_infected_symp: int = 0
-    newly_infected_asymp: int = 0
-    newly_recovered: int = 0
-    newly_hospitalized: int = 0
-    newly_dead: int = 0
-
-    def reset(self):
-        self.susceptible = 0
-        self.exposed = 0
-        self.presymp = 0
-        self.infected_symp = 0
-        self.infected_asymp = 0
-        self.recovered = 0
-        self.hospitalized = 0
-        self.dead = 0
-
-        self.newly_susceptible = 0
-        self.newly_exposed = 0
-        self.newly_presymp = 0
-        self.newly_infected_symp = 0
-        self.newly_infected_asymp = 0
-        self.newly_recovered = 0
-        self.newly_hospitalized = 0
-        self.newly_dead = 0
+from typing import Dict, List
+
+from .common import TICKS_PER_DAY, find_free_filename
+from .population import P_ID_IDX, P_SCHEDULE_IDX, P_CURRENT_PLACE_IDX, P_STATE_IDX, P_NEXT_STATE_T_IDX, \
+    PL_PERSON_COUNT_IDX
+from .population import Places, PersonSet, create_schedule_segments, csr_move, resident_places
+from . import population
+from . import validate
+from .network import FacilityNetwork, FacilityCountsLogger, load_facilities
+from .multipliers import PersonMultipliers, create_person_multipliers
+from .columnar import ColumnarWriter, PLAIN, DELTA, DICT
+from . import crn
+from .exposures import ExposureLogger
+from .linelist import LineListLogger
+from .serial import SerialComm, SerialScheduleRunner, SerialDataSet, create_loggers
+from .interventions import schedule_interventions
+from .overrides import REMOVED, create_overrides
+from .parallel import ChunkPool
+from .mixing import MixingGroups, create_mixing_groups
+from .disease import DiseaseModel, EXPONENTIAL, FIXED, NO_DURATION, DEFAULT_COUNT_NAMES, \
+    make_counts_class, default_disease_model, create_disease_model, create_trans_matrix, create_duration_matrix
+
+
+# counts of the built in disease model's states
+Counts = make_counts_class(list(DEFAULT_COUNT_NAMES.values()))
 
 
 class CountsByPlaceLogger:
 
     def __init__(self, place_id_map, log_fname):
         self.reverse_map = {v: k for k, v in place_id_map.items()}
-        self.log_fname = util.find_free_filename(log_fname)
+        self.log_fname = find_free_filename(log_fname)
 
         with open(self.log_fname, "w") as fin:
             fin.write("tick,place_id,person_count,inf_count\n")
@@ -65,28 +43,215 @@ class CountsByPlaceLogger:
             for idx, vals in enumerate(places.get_all_counts()):
                 fin.write(f"{tick},{self.reverse_map[idx]},{vals[0]},{vals[1]}\n")
 
+    def close(self):
+        pass
+
+
+class ColumnarCountsByPlaceLogger:
+
+    def __init__(self, place_id_map, log_fname, chunk_rows: int = 1 << 16):
+        # place ids are dictionary encoded, the code is the place's row index
+        place_ids = np.zeros(len(place_id_map), dtype=np.int64)
+        for k, v in place_id_map.items():
+            place_ids[v] = k
+        self.codes = np.arange(len(place_id_map), dtype=np.uint32)
+        self.log_fname = find_free_filename(log_fname)
+        self.writer = ColumnarWriter(self.log_fname, {"tick": (np.int64, DELTA),
+                                                      "place_id": (np.uint32, DICT),
+                                                      "person_count": (np.uint32, PLAIN),
+                                                      "inf_count": (np.uint32, PLAIN)},
+                                     dictionaries={"place_id": place_ids}, chunk_rows=chunk_rows)
+
+    def log_counts(self, tick, places):
+        counts = places.get_all_counts()
+        self.writer.append(tick=np.full(self.codes.shape[0], tick, dtype=np.int64), place_id=self.codes,
+                           person_count=counts[:, 0], inf_count=counts[:, 1])
+
+    def close(self):
+        self.writer.close()
+
+
+class ColumnarDataSet:
+    # Drop in replacement for repast4py's logging.ReducingDataSet that writes
+    # the reduced values to a columnar file rather than a csv
+
+    def __init__(self, data_loggers, comm, fpath: str, chunk_rows: int = 1 << 16):
+        self._data_loggers = data_loggers
+        self._comm = comm
+        self._rank = comm.Get_rank()
+        self.ticks = []
+        self.writer = None
+        if self._rank == 0:
+            self.fpath = find_free_filename(fpath)
+            columns = {"tick": (np.int64, DELTA)}
+            for dl in data_loggers:
+                columns[dl.name] = (dl.dtype, PLAIN)
+            self.writer = ColumnarWriter(self.fpath, columns, chunk_rows=chunk_rows)
+
+    def log(self, tick: float):
+        if self._rank == 0:
+            self.ticks.append(tick)
+        for logger in self._data_loggers:
+            logger.log()
+
+    def write(self):
+        vals = {dl.name: dl.reduce(self._comm) for dl in self._data_loggers}
+        if self._rank == 0:
+            vals["tick"] = np.array(self.ticks, dtype=np.int64)
+            self.writer.append(**vals)
+            self.ticks.clear()
+
+    def close(self):
+        self.write()
+        if self._rank == 0:
+            self.writer.close()
+
+
+class MemoryDataSet:
+    # Drop in replacement for repast4py's logging.ReducingDataSet that keeps the
+    # reduced values in memory, e.g. for ensembles that consume each run's series
+
+    def __init__(self, data_loggers, comm):
+        self._data_loggers = data_loggers
+        self._comm = comm
+        self._rank = comm.Get_rank()
+        self.ticks = []
+        self._vals = {dl.name: [] for dl in data_loggers}
+
+    def log(self, tick: float):
+        if self._rank == 0:
+            self.ticks.append(tick)
+        for logger in self._data_loggers:
+            logger.log()
+
+    def write(self):
+        for dl in self._data_loggers:
+            vals = dl.reduce(self._comm)
+            if self._rank == 0:
+                self._vals[dl.name].append(vals)
+
+    def close(self):
+        self.write()
+
+    def series(self) -> Dict[str, np.array]:
+        # tick and each logger's values on rank 0, unwritten values are not included
+        n_written = sum(vals.shape[0] for vals in self._vals[self._data_loggers[0].name])
+        series = {"tick": np.array(self.ticks[:n_written])}
+        for dl in self._data_loggers:
+            vals = self._vals[dl.name]
+            series[dl.name] = np.concatenate(vals) if len(vals) > 0 else np.zeros(0, dtype=dl.dtype)
+        return series
+
+
+def _rank_filename(fname: str, comm):
+    # per rank logs are suffixed with the rank when there is more than one
+    if comm.Get_size() > 1:
+        root, ext = os.path.splitext(fname)
+        fname = f"{root}_{comm.Get_rank()}{ext}"
+    return find_free_filename(fname)
+
+
+class PlaceHazard:
+    # Per place probability that a susceptible in the place is exposed during a tick, given
+    # the numbers of persons and infected persons in the place. Forms are
+    #   constant: beta if any infected are present, otherwise 0
+    #   density: 1 - (1 - beta)^I, each infected person an independent chance of exposure
+    #   frequency: 1 - (1 - beta)^(I / N), scaled by the fraction of persons infected
+    # constant and density are looked up in a table indexed by infected count.
+
+    FORMS = ("constant", "density", "frequency")
+
+    def __init__(self, beta: float, form: str = "constant", max_infected: int = 0):
+        if form not in PlaceHazard.FORMS:
+            raise ValueError(f"Unknown transmission model '{form}', expected one of {PlaceHazard.FORMS}")
+        self.beta = np.float32(beta)
+        self.form = form
+        self.lut = None
+        if form == "constant":
+            self.lut = np.array([0, beta], dtype=np.float32)
+        elif form == "density":
+            # the table is truncated where the probability saturates at 1, larger counts are clipped to its end
+            n = max_infected + 1
+            if 0 < beta < 1:
+                n = min(n, int(np.ceil(np.log(np.finfo(np.float32).eps / 2) / np.log1p(-beta))) + 2)
+            else:
+                n = 2
+            self.lut = (1 - np.power(1 - np.float64(beta), np.arange(max(n, 2)))).astype(np.float32)
+
+    def compute(self, counts: np.array) -> np.array:
+        # counts: (n, 2) array of person counts and infected counts
+        if self.lut is not None:
+            return self.lut[np.minimum(counts[:, 1], self.lut.shape[0] - 1)]
+        frac = counts[:, 1] / np.maximum(counts[:, 0], 1)
+        return (1 - np.power(1 - np.float64(self.beta), frac)).astype(np.float32)
+
 
 class Model:
 
-    def __init__(self, comm: MPI.Intracomm, schedule_data: np.array, person_data: np.array,
+    def __init__(self, comm, schedule_data: np.array, person_data: np.array,
                  place_data: Places, stoe: float, trans_matrix: np.array, duration_matrix: np.array, seed: int,
-                 params: Dict[str, any]):
+                 params: Dict[str, any], risk_data: np.array = None,
+                 person_multipliers: PersonMultipliers = None, facility_network: FacilityNetwork = None,
+                 disease: DiseaseModel = None, mixing_groups: MixingGroups = None):
+        # the disease model, if not given, the built in model from the transition and duration matrices
+        self.disease = default_disease_model(trans_matrix, duration_matrix) if disease is None else disease
+        self.seed = seed
         self.rng: np.random.Generator = np.random.default_rng(seed)
+        # counter based draws so runs with the same seed share them (see crn.py)
+        self.crn = crn.CommonRandomNumbers(seed) if params.get("common_random_numbers", False) else None
         n_schedules = int(schedule_data.shape[0] / TICKS_PER_DAY)
         self.schedule_data = schedule_data
         self.offsets = np.arange(0, n_schedules, dtype=np.int64) * TICKS_PER_DAY
         self.idx = np.zeros((n_schedules), dtype=np.int64)
+        self.schedule_segments = create_schedule_segments(schedule_data)
+        # tick of day of the most recent placement
+        self._placed_tod = None
+        # persons grouped by schedule: schedule s's persons are
+        # schedule_members[schedule_member_offsets[s]:schedule_member_offsets[s + 1]]
+        self.schedule_members = np.argsort(person_data[:, P_SCHEDULE_IDX], kind="stable")
+        self.schedule_member_offsets = np.zeros(n_schedules + 1, dtype=np.int64)
+        np.cumsum(np.bincount(person_data[:, P_SCHEDULE_IDX], minlength=n_schedules),
+                  out=self.schedule_member_offsets[1:])
         # array of indices into resident's place columns, 1 for each schedule
         self.next_place_idxs = np.zeros((n_schedules), dtype=np.uint32)
-        # self.risks = np.zeros((n_schedules))
+        # per tick of day (rows) and schedule (cols) exposure risk multipliers, so the multipliers for
+        # a tick are a contiguous row. None if schedule risk is disabled or all the risks are 1.
+        self.risk_table = None
+        if params.get("schedule_risk", False) and risk_data is not None and np.any(risk_data != 1):
+            self.risk_table = np.ascontiguousarray(risk_data.reshape(n_schedules, TICKS_PER_DAY).T,
+                                                   dtype=np.float32)
         self.person_data = person_data
         self.place_data = place_data
         self.stoe: np.float32 = np.float32(stoe)
-        self.row_idxs = np.arange(len(self.person_data))
-        self.trans_matrix: np.array = trans_matrix.cumsum(axis=1)
-        self.duration_matrix: np.array = duration_matrix
+        self.person_multipliers = person_multipliers
+        self.facility_network = facility_network
+        # mixing groups within places, exposure is per (place, group) cell if set
+        self.mixing = mixing_groups
+        # per person placement overrides (isolation, hospitalisation etc.), None if not used
+        self.overrides = None
+        if "placement_overrides" in params:
+            self.overrides = create_overrides(params["placement_overrides"], place_data.place_id_map,
+                                              self.disease.state_map)
+        # places with at least this many persons resolve exposures with a binomial draw, 0 to disable
+        self.hybrid_threshold = int(params.get("hybrid_exposure_threshold", 0))
+        self.hazard = PlaceHazard(stoe, params.get("transmission_model", "constant"), person_data.shape[0])
+        # full population scans are done this many persons at a time, bounding the size of their temporaries
+        n_threads = int(params.get("threads", 1))
+        self.person_chunk_size = max(int(params.get("person_chunk_size",
+                                                    -(-person_data.shape[0] // n_threads))), 1)
+        # with more than one thread, the chunks are processed in parallel by a pool of threads
+        self.pool = None
+        if n_threads > 1:
+            self.pool = ChunkPool(n_threads, person_data.shape[0], self.person_chunk_size, seed)
+        # currently infectious persons
+        self.infectious = PersonSet(person_data.shape[0])
+        self.infectious.reset(self._scan(lambda chunk: self.disease.infectious[chunk[:, P_STATE_IDX]]))
         self.params = params
-        self.comm = comm
+        # without a communicator the model runs serially, without MPI
+        self.serial = comm is None
+        self.comm = comm = SerialComm() if comm is None else comm
+        if params.get("occupancy_index", False):
+            self.place_data.build_occupancy_index(self.schedule_data, self.person_data)
 
         self._init_logging(comm, params)
         self._init_schedule(comm)
@@ -95,147 +260,467 @@ class Model:
 
     def _init_exposed(self, n_exposed: int):
         idxs = self.rng.choice(self.person_data.shape[0], n_exposed, replace=False)
-        np.put(self.person_data[:, P_STATE_IDX], idxs, EXPOSED)
+        old_states = self.person_data[idxs, P_STATE_IDX]
+        np.put(self.person_data[:, P_STATE_IDX], idxs, self.disease.exposed)
 
-        k, scale = self.duration_matrix[EXPOSED]
-        np.put(self.person_data[:, P_NEXT_STATE_T_IDX], idxs,
-               self.rng.gamma(k, scale, n_exposed) * TICKS_PER_DAY)
+        self._set_next_transitions(0, idxs, np.full(idxs.shape[0], self.disease.exposed))
+        self._states_changed(0, idxs, old_states)
 
-    def _init_logging(self, comm: MPI.Intracomm, params: Dict):
+    def _init_logging(self, comm, params: Dict):
         log_file = params["counts_log_file"]
-        self.counts = Counts()
-        loggers = logging.create_loggers(self.counts, op=MPI.SUM, rank=comm.Get_rank())
-        self.data_set = logging.ReducingDataSet(loggers, comm, log_file)
-
-        place_log_file = params["places_log_file"]
-        self.counts_by_place = CountsByPlaceLogger(self.place_data.place_id_map, place_log_file)
+        self.counts = self.disease.counts_class()
+        # persons entering each state since the last log
+        self.newly = np.zeros(self.disease.n_states, dtype=np.int64)
+        if self.serial:
+            loggers = create_loggers(self.counts)
+        else:
+            from mpi4py import MPI
+            from repast4py import logging
+            loggers = logging.create_loggers(self.counts, op=MPI.SUM, rank=comm.Get_rank())
+        chunk_rows = params.get("log_chunk_rows", 1 << 16)
+        if params.get("counts_log_format", "csv") == "columnar":
+            self.data_set = ColumnarDataSet(loggers, comm, log_file, chunk_rows)
+        elif params.get("counts_log_format", "csv") == "memory":
+            self.data_set = MemoryDataSet(loggers, comm)
+        elif self.serial:
+            self.data_set = SerialDataSet(loggers, log_file)
+        else:
+            self.data_set = logging.ReducingDataSet(loggers, comm, log_file)
+
+        self.facility_counts = None
+        if self.facility_network is not None:
+            self.facility_counts = FacilityCountsLogger(self.facility_network, comm,
+                                                        params["facility_counts_log_file"],
+                                                        [f.name for f in fields(self.counts)], self.disease.n_states)
+
+        self.exposure_log = None
+        if "exposure_log_file" in params:
+            self.exposure_log = ExposureLogger(self.place_data.place_data[:, 0].astype(np.int64),
+                                               _rank_filename(params["exposure_log_file"], comm), chunk_rows,
+                                               self.mixing is not None)
+
+        self.line_list = None
+        if "line_list_file" in params:
+            sample = None
+            if params.get("line_list_sample", 1.0) < 1.0:
+                # separate generator, so sampling doesn't change the model's draws
+                sample_rng = np.random.default_rng(np.random.SeedSequence(self.seed).spawn(1)[0])
+                sample = sample_rng.random(self.person_data.shape[0]) < params["line_list_sample"]
+            self.line_list = LineListLogger(_rank_filename(params["line_list_file"], comm), sample, chunk_rows,
+                                            self.disease.n_states)
+
+        place_log_file = params.get("places_log_file")
+        if params.get("places_log_format", "csv") == "none":
+            self.counts_by_place = None
+        elif params.get("places_log_format", "csv") == "columnar":
+            self.counts_by_place = ColumnarCountsByPlaceLogger(self.place_data.place_id_map, place_log_file,
+                                                               chunk_rows)
+        else:
+            self.counts_by_place = CountsByPlaceLogger(self.place_data.place_id_map, place_log_file)
 
     def _init_schedule(self, comm):
-        self.runner = schedule.init_schedule_runner(comm)
+        if self.serial:
+            self.runner = SerialScheduleRunner()
+        else:
+            from repast4py import schedule
+            self.runner = schedule.init_schedule_runner(comm)
         self.runner.schedule_repeating_event(1, 1, self.step)
         self.runner.schedule_stop(self.params["stop.at"])
         self.runner.schedule_end_event(self.at_end)
         # write at the end of every day (4 * 24)
         self.runner.schedule_repeating_event(96.1, 96, self.data_set.write)
+        if self.facility_network is not None:
+            self.runner.schedule_repeating_event(96.1, 96, self.facility_counts.write)
+            # transfers happen after that tick's step
+            for transfer in self.params.get("facility_transfers", []):
+                evt = (lambda t=transfer: self.facility_network.transfer(self, t["n"], t["from"], t["to"]))
+                at = transfer["day"] * TICKS_PER_DAY + 0.5
+                if "every" in transfer:
+                    self.runner.schedule_repeating_event(at, transfer["every"] * TICKS_PER_DAY, evt)
+                else:
+                    self.runner.schedule_event(at, evt)
+        if "interventions" in self.params:
+            residents_file = ([facility["residents_file"] for facility in self.params["facilities"]]
+                              if "facilities" in self.params else self.params.get("residents_file"))
+            schedule_interventions(self, self.params["interventions"], residents_file)
 
     def at_end(self):
         self.data_set.close()
+        if self.counts_by_place is not None:
+            self.counts_by_place.close()
+        if self.facility_counts is not None:
+            self.facility_counts.close()
+        if self.exposure_log is not None:
+            self.exposure_log.close()
+        if self.line_list is not None:
+            self.line_list.close()
+        if self.pool is not None:
+            self.pool.close()
+
+    def reassign(self, person_idxs: np.array, schedule_idxs: np.array = None,
+                 place_columns: Dict[int, np.array] = None):
+        # Changes the schedules and / or place columns (e.g. P_CAF_IDX) of persons mid-run, patching
+        # the schedule membership, the occupancy index and the place counts for just those persons.
+        track_occupancy = self.place_data.occupancy_offsets is not None
+        if track_occupancy:
+            old_places = resident_places(self.schedule_data, self.person_data, person_idxs)
+
+        if schedule_idxs is not None:
+            old_schedule_idxs = self.person_data[person_idxs, P_SCHEDULE_IDX]
+            self.person_data[person_idxs, P_SCHEDULE_IDX] = schedule_idxs
+            changed = old_schedule_idxs != self.person_data[person_idxs, P_SCHEDULE_IDX]
+            self.schedule_members = csr_move(self.schedule_member_offsets, self.schedule_members,
+                                             person_idxs[changed], old_schedule_idxs[changed],
+                                             self.person_data[person_idxs[changed], P_SCHEDULE_IDX])
+        if place_columns is not None:
+            for col, place_idxs in place_columns.items():
+                self.person_data[person_idxs, col] = place_idxs
+
+        if track_occupancy:
+            new_places = resident_places(self.schedule_data, self.person_data, person_idxs)
+            self.place_data.update_occupancy_index(person_idxs, old_places, new_places)
+        if self.mixing is not None:
+            self.mixing.regroup(self.person_data, person_idxs)
+        if self._placed_tod is not None:
+            # move them to where they now should be at the current tick of the day
+            self._move(person_idxs)
+        if self.overrides is not None:
+            self.overrides.reassigned(self, person_idxs)
+
+    def add_schedules(self, schedules: np.array, risks: np.array = None) -> np.array:
+        # Adds (n, TICKS_PER_DAY) expanded schedules mid-run, returning their schedule idxs. A schedule
+        # identical to an existing one (including its risks) reuses that one's idx. The per schedule
+        # arrays are replaced rather than changed in place, so a shared Population's are unaffected.
+        schedules = schedules.astype(self.schedule_data.dtype)
+        n_old = self.offsets.shape[0]
+        if risks is None:
+            risks = np.ones(schedules.shape, dtype=np.float32)
+        old_risks = (np.ones((TICKS_PER_DAY, n_old), dtype=np.float32) if self.risk_table is None
+                     else self.risk_table)
+        existing = {row.tobytes() + risk.tobytes(): s for s, (row, risk) in
+                    enumerate(zip(self.schedule_data.reshape(-1, TICKS_PER_DAY), old_risks.T))}
+        schedule_idxs = np.zeros(schedules.shape[0], dtype=np.int64)
+        added = []
+        for i, (row, risk) in enumerate(zip(schedules, risks.astype(np.float32))):
+            key = row.tobytes() + risk.tobytes()
+            if key not in existing:
+                existing[key] = n_old + len(added)
+                added.append(i)
+            schedule_idxs[i] = existing[key]
+        if len(added) == 0:
+            return schedule_idxs
+
+        n_schedules = n_old + len(added)
+        self.schedule_data = np.concatenate([self.schedule_data, schedules[added].ravel()])
+        self.offsets = np.arange(0, n_schedules, dtype=np.int64) * TICKS_PER_DAY
+        self.idx = np.zeros((n_schedules), dtype=np.int64)
+        # proportional to the number of schedules rather than persons
+        self.schedule_segments = create_schedule_segments(self.schedule_data)
+        if self.place_data.occupancy_offsets is not None:
+            self.place_data.schedules_added(self.schedule_data, self.person_data)
+        # the new schedules have no members until persons are reassigned to them
+        self.schedule_member_offsets = np.concatenate([self.schedule_member_offsets,
+                                                       np.full(len(added), self.schedule_member_offsets[-1])])
+        next_place_idxs = np.zeros((n_schedules), dtype=np.uint32)
+        next_place_idxs[:n_old] = self.next_place_idxs
+        if self._placed_tod is not None:
+            next_place_idxs[n_old:] = schedules[added, self._placed_tod]
+        self.next_place_idxs = next_place_idxs
+        if self.params.get("schedule_risk", False) and (self.risk_table is not None or np.any(risks[added] != 1)):
+            self.risk_table = np.ascontiguousarray(np.hstack([old_risks, risks[added].T]), dtype=np.float32)
+        return schedule_idxs
 
     def select_next_place(self, tick: int):
+        tod = int(tick) % TICKS_PER_DAY
+        if self._placed_tod is not None and tod == (self._placed_tod + 1) % TICKS_PER_DAY:
+            # Following on from the previous tick of the day, so only the persons whose schedules
+            # change place type at this tick can move, and the counts are updated for just those
+            changed = self.schedule_segments.changes_at(tod)
+            if changed.shape[0] > 0:
+                self.next_place_idxs[changed] = self.schedule_data[self.offsets[changed] + tod]
+                self._move(self._get_schedule_members(changed))
+        else:
+            self._place_all(tod)
+        self._placed_tod = tod
+
+        # infected counts from the infectious persons' current places, so cost is proportional to
+        # prevalence rather than population
+        infected_places = self.person_data[self.infectious.idxs, P_CURRENT_PLACE_IDX]
+        if self.overrides is not None:
+            infected_places = infected_places[infected_places != REMOVED]
+        n_places = self.place_data.place_data.shape[0]
+        self.place_data.set_infected_counts(np.bincount(infected_places, minlength=n_places))
+        if self.mixing is not None:
+            self.mixing.set_infected(self.infectious.idxs,
+                                     self.person_data[self.infectious.idxs, P_CURRENT_PLACE_IDX])
+
+    def _get_schedule_members(self, schedule_idxs: np.array) -> np.array:
+        offsets = self.schedule_member_offsets
+        return np.concatenate([self.schedule_members[offsets[s]:offsets[s + 1]] for s in schedule_idxs])
+
+    def _move(self, person_idxs: np.array):
+        if self.overrides is not None and len(self.overrides) > 0:
+            # overridden persons don't follow their schedules
+            person_idxs = person_idxs[~self.overrides.contains(person_idxs)]
+        next_place_cols = self.next_place_idxs[self.person_data[person_idxs, P_SCHEDULE_IDX]]
+        new_places = self.person_data[person_idxs, next_place_cols]
+        old_places = self.person_data[person_idxs, P_CURRENT_PLACE_IDX]
+        moved = new_places != old_places
+        person_idxs, old_places, new_places = person_idxs[moved], old_places[moved], new_places[moved]
+
+        self.person_data[person_idxs, P_CURRENT_PLACE_IDX] = new_places
+        self.place_data.move_persons(old_places, new_places)
+        if self.mixing is not None:
+            self.mixing.move(person_idxs, old_places, new_places)
+
+    def _place_all(self, tod: int):
         # add tick index to offset to get the schedule inidices
-        np.add(self.offsets, tick % TICKS_PER_DAY, out=self.idx)
+        np.add(self.offsets, tod, out=self.idx)
         # Sets the next place type (person place column idx) for each schedule
         self.next_place_idxs[:] = self.schedule_data[self.idx]
 
-        # Set the current place for each person by
-        # 1. Getting the column idxs for the next places via next_place_idxs and each persons schedule_idx
-        # 2. Set the current place id column to the value in the selected next_place_column idxs
-        residents_next_place_idxs = self.next_place_idxs[self.person_data[:, P_SCHEDULE_IDX]]
-        self.person_data[:, P_CURRENT_PLACE_IDX] = self.person_data[self.row_idxs, residents_next_place_idxs]
-
-        # sets total persons in each place: unique place ids (which are also row indexs in place data),
-        #                                   and how many times they occur
-        places, counts = np.unique(self.person_data[:, P_CURRENT_PLACE_IDX], return_counts=True)
-        # Using the places place row idxs set number of persons in those places
-        self.place_data.update_counts(places, counts)
-        states = self.person_data[:, P_STATE_IDX]
-
-        # Same counts but only for infected persons
-        places, counts = np.unique(self.person_data[(states == PRESYMPTOMATIC)
-                                   | (states == INFECTED_ASYMP)
-                                   | (states == INFECTED_SYMP)][:, P_CURRENT_PLACE_IDX],
-                                   return_counts=True)
-        self.place_data.update_infected_counts(places, counts)
+        n_places = self.place_data.place_data.shape[0]
+        # with the occupancy index, the persons in each place are counted already
+        indexed = self.place_data.occupancy_offsets is not None
+
+        def place_chunk(i, start, end):
+            chunk = self.person_data[start:end]
+            # Set the current place for each person by
+            # 1. Getting the column idxs for the next places via next_place_idxs and each persons schedule_idx
+            # 2. Set the current place id column to the value in the selected next_place_column idxs
+            residents_next_place_idxs = self.next_place_idxs[chunk[:, P_SCHEDULE_IDX]]
+            chunk[:, P_CURRENT_PLACE_IDX] = chunk[np.arange(end - start), residents_next_place_idxs]
+            # total persons in each place
+            return None if indexed else np.bincount(chunk[:, P_CURRENT_PLACE_IDX], minlength=n_places)
+
+        counts = np.zeros(n_places, dtype=np.int64)
+        for chunk_counts in self._map_chunks(place_chunk):
+            if chunk_counts is not None:
+                counts += chunk_counts
+        if indexed:
+            counts += self.place_data.get_occupancy(tod)
+        if self.overrides is not None:
+            self.overrides.correct(self.person_data, counts)
+
+        # Using the occupied places row idxs set number of persons in those places
+        places = np.nonzero(counts)[0]
+        self.place_data.update_counts(places, counts[places])
+        if self.mixing is not None:
+            self.mixing.place_all(self.person_data, self._map_chunks)
+
+        # resync the infectious persons with their states, as these may have been set directly
+        self.infectious.reset(self._scan(lambda chunk: self.disease.infectious[chunk[:, P_STATE_IDX]]))
+
+    def _person_chunks(self):
+        n_persons = self.person_data.shape[0]
+        for start in range(0, n_persons, self.person_chunk_size):
+            yield start, min(start + self.person_chunk_size, n_persons)
+
+    def _map_chunks(self, fn) -> List:
+        # fn(chunk, start, end) of each chunk of persons, in chunk order, in parallel if there is a pool
+        if self.pool is not None:
+            return self.pool.map(fn)
+        return [fn(i, start, end) for i, (start, end) in enumerate(self._person_chunks())]
+
+    def _scan(self, pred) -> np.array:
+        # indices of the persons for which pred(chunk of person_data) is True
+        idxs = self._map_chunks(lambda i, start, end: np.nonzero(pred(self.person_data[start:end]))[0] + start)
+        return np.concatenate(idxs) if len(idxs) > 0 else np.zeros(0, dtype=np.int64)
+
+    def _state_counts(self) -> np.array:
+        # (facility, state) person counts, with a single facility without a facility network
+        n_states = self.disease.n_states
+        n_facilities = 1 if self.facility_network is None else self.facility_network.n_facilities
+
+        def count_chunk(i, start, end):
+            keys = self.person_data[start:end, P_STATE_IDX]
+            if self.facility_network is not None:
+                keys = self.facility_network.person_facility[start:end].astype(np.int64) * n_states + keys
+            return np.bincount(keys, minlength=n_facilities * n_states)
+
+        counts = np.zeros(n_facilities * n_states, dtype=np.int64)
+        for chunk_counts in self._map_chunks(count_chunk):
+            counts += chunk_counts
+        return counts.reshape(n_facilities, n_states)
+
+    def _count_newly(self, person_idxs: np.array, states: np.array):
+        # counts the persons entering the states
+        self.newly += np.bincount(states, minlength=self.disease.n_states)
+        if self.facility_counts is not None:
+            self.facility_counts.entered(person_idxs, states)
 
     def update_disease_state(self, tick: int):
         # row indices of susceptibles - calc if exposed
-        sus_idxs = np.nonzero(self.person_data[:, P_STATE_IDX] == SUSCEPTIBLE)[0]
+        sus_idxs = self._scan(lambda chunk: chunk[:, P_STATE_IDX] == self.disease.susceptible)
+        if self.overrides is not None and len(self.overrides) > 0:
+            # removed persons can't be exposed
+            sus_idxs = sus_idxs[self.person_data[sus_idxs, P_CURRENT_PLACE_IDX] != REMOVED]
         n_sus = sus_idxs.shape[0]
         # get the place row indices for all the susceptibles
         sus_place_idxs = self.person_data[sus_idxs, P_CURRENT_PLACE_IDX]
-        # each row corresponds to person, cols are total person count, infected count
-        # .ix_ applies the column indices to each row index
-        counts = self.place_data.get_counts(sus_place_idxs)
-        # array of n_sus stoe probs - if no one in place, then set prob to 0
-        # TODO: risk and shielding scaling
-        stoe_p = np.full((n_sus, ), self.stoe, dtype=np.float32) * (counts[:, 1] > 0)
-        # if tick >= 317:
-        #     print(self.place_data[:, PL_INFECTED_COUNT_IDX])
-        #     print(counts)
-        #     print(self.stoe)
-        #     print(stoe_p)
-        # sus_idxs[self ...] removes the indexes that don't pass the condition (random draw <= stoe_p)
-        stoe_idxs = sus_idxs[self.rng.random(n_sus) <= stoe_p]
+        # probability of exposure in each place, or each place's mixing group, evaluated once per place
+        # or group and then gathered for each susceptible
+        if self.mixing is None:
+            stoe_p = self.hazard.compute(self.place_data.get_all_counts())[sus_place_idxs]
+            sus_cells = sus_place_idxs
+            sus_cell_sizes = self.place_data.place_data[sus_place_idxs, PL_PERSON_COUNT_IDX]
+        else:
+            stoe_p = self.mixing.hazards(self.hazard, sus_idxs, sus_place_idxs)
+            sus_cells = self.mixing.cells(sus_idxs, sus_place_idxs)
+            sus_cell_sizes = self.mixing.counts[sus_cells, 0]
+        if self.risk_table is not None:
+            # scale by the risk of each susceptible's schedule at this tick of day
+            stoe_p *= self.risk_table[int(tick) % TICKS_PER_DAY][self.person_data[sus_idxs, P_SCHEDULE_IDX]]
+        if self.person_multipliers is not None:
+            # and by each susceptible's vulnerability, shielding etc.
+            stoe_p *= self.person_multipliers.get(sus_idxs)
+        if self.hybrid_threshold > 0:
+            stoe_idxs = sus_idxs[self._hybrid_exposures(tick, sus_idxs, sus_cells, sus_cell_sizes, stoe_p)]
+        elif self.pool is not None and self.crn is None:
+            # each chunk's susceptibles draw from the chunk's generator
+            offsets = self.pool.split(sus_idxs)
+
+            def expose_chunk(i, start, end):
+                chunk = slice(offsets[i], offsets[i + 1])
+                return sus_idxs[chunk][self.pool.rngs[i].random(offsets[i + 1] - offsets[i]) <= stoe_p[chunk]]
+
+            stoe_idxs = np.concatenate(self.pool.map(expose_chunk))
+        else:
+            # sus_idxs[self ...] removes the indexes that don't pass the condition (random draw <= stoe_p)
+            stoe_idxs = sus_idxs[self._uniforms(crn.EXPOSURE, tick, sus_idxs) <= stoe_p]
         # set state to exposed for those that passed
-        np.put(self.person_data[:, P_STATE_IDX], stoe_idxs, EXPOSED)
-        self.counts.newly_exposed += stoe_idxs.shape[0]
+        exposed = self.disease.exposed
+        np.put(self.person_data[:, P_STATE_IDX], stoe_idxs, exposed)
+        if self.exposure_log is not None:
+            exposure_places = self.person_data[stoe_idxs, P_CURRENT_PLACE_IDX]
+            if self.mixing is None:
+                self.exposure_log.log(tick, self.person_data[stoe_idxs, P_ID_IDX], exposure_places,
+                                      self.place_data.place_data[exposure_places, PL_PERSON_COUNT_IDX:])
+            else:
+                # the counts of the cells the hazards were computed from
+                self.exposure_log.log(tick, self.person_data[stoe_idxs, P_ID_IDX], exposure_places,
+                                      self.mixing.counts[self.mixing.cells(stoe_idxs, exposure_places)],
+                                      self.mixing.groups[stoe_idxs])
+        self._count_newly(stoe_idxs, np.full(stoe_idxs.shape[0], exposed))
 
         # set the how long to stay exposed
-        k, scale = self.duration_matrix[EXPOSED]
-        np.put(self.person_data[:, P_NEXT_STATE_T_IDX], stoe_idxs,
-               tick + self.rng.gamma(k, scale, stoe_idxs.shape[0]) * TICKS_PER_DAY)
+        self._set_next_transitions(tick, stoe_idxs, np.full(stoe_idxs.shape[0], exposed))
+        self._states_changed(tick, stoe_idxs, np.full(stoe_idxs.shape[0], self.disease.susceptible))
 
         # get non_susceptibles whose next transition time == tick
-        candidates_idxs = np.nonzero((self.person_data[:, P_STATE_IDX] != SUSCEPTIBLE)
-                                     & (self.person_data[:, P_NEXT_STATE_T_IDX] == tick))[0]
-        n_candidates = candidates_idxs.shape[0]
+        candidates_idxs = self._scan(lambda chunk: (chunk[:, P_STATE_IDX] != self.disease.susceptible)
+                                     & (chunk[:, P_NEXT_STATE_T_IDX] == tick))
 
-        # Compute n_candidates updated states from the transition matrix
-        updated_states = (self.trans_matrix[self.person_data[candidates_idxs, P_STATE_IDX]]
-                          > self.rng.random((n_candidates, 1))).argmax(1)
+        # Sample the candidates' next states from the disease model's alias tables
+        current_states = self.person_data[candidates_idxs, P_STATE_IDX]
+        updated_states = self.disease.sample_next_states(current_states,
+                                                         self._uniforms(crn.TRANSITION, tick, candidates_idxs))
         # Update the states
         np.put(self.person_data[:, P_STATE_IDX], candidates_idxs, updated_states)
 
-        # Set next transition tick for candidates
-        duration_candidates = candidates_idxs[self.person_data[candidates_idxs, P_STATE_IDX] == PRESYMPTOMATIC]
-        k, scale = self.duration_matrix[PRESYMPTOMATIC]
-        np.put(self.person_data[:, P_NEXT_STATE_T_IDX],
-               duration_candidates, tick + self.rng.gamma(k, scale, duration_candidates.shape[0]) * TICKS_PER_DAY)
-        self.counts.newly_presymp += duration_candidates.shape[0]
-
-        duration_candidates = candidates_idxs[self.person_data[candidates_idxs, P_STATE_IDX] == INFECTED_SYMP]
-        k, scale = self.duration_matrix[INFECTED_SYMP]
-        np.put(self.person_data[:, P_NEXT_STATE_T_IDX],
-               duration_candidates, tick + self.rng.gamma(k, scale, duration_candidates.shape[0]) * TICKS_PER_DAY)
-        self.counts.newly_infected_symp += duration_candidates.shape[0]
-
-        duration_candidates = candidates_idxs[self.person_data[candidates_idxs, P_STATE_IDX] == INFECTED_ASYMP]
-        k, scale = self.duration_matrix[INFECTED_ASYMP]
-        np.put(self.person_data[:, P_NEXT_STATE_T_IDX],
-               duration_candidates, tick + self.rng.gamma(k, scale, duration_candidates.shape[0]) * TICKS_PER_DAY)
-        self.counts.newly_infected_asymp += duration_candidates.shape[0]
-
-        duration_candidates = candidates_idxs[self.person_data[candidates_idxs, P_STATE_IDX] == HOSPITALIZED]
-        k, scale = self.duration_matrix[HOSPITALIZED]
-        np.put(self.person_data[:, P_NEXT_STATE_T_IDX],
-               duration_candidates, tick + self.rng.gamma(k, scale, duration_candidates.shape[0]) * TICKS_PER_DAY)
-        self.counts.newly_hospitalized += duration_candidates.shape[0]
-
-        duration_candidates = candidates_idxs[self.person_data[candidates_idxs, P_STATE_IDX] == RECOVERED]
-        k, scale = self.duration_matrix[RECOVERED]
-        np.put(self.person_data[:, P_NEXT_STATE_T_IDX],
-               duration_candidates, tick + self.rng.gamma(k, scale, duration_candidates.shape[0]) * TICKS_PER_DAY)
-        self.counts.newly_recovered += duration_candidates.shape[0]
-
-        self.counts.newly_dead += candidates_idxs[self.person_data[candidates_idxs, P_STATE_IDX] == DEAD].shape[0]
+        # update the infectious persons with those becoming or no longer infectious
+        was_infected = self.disease.infectious[current_states]
+        is_infected = self.disease.infectious[updated_states]
+        self.infectious.add(candidates_idxs[is_infected & ~was_infected])
+        self.infectious.remove(candidates_idxs[was_infected & ~is_infected])
+
+        # Set next transition tick for candidates, counting only those whose state has changed
+        changed = updated_states != current_states
+        self._count_newly(candidates_idxs[changed], updated_states[changed])
+        self._set_next_transitions(tick, candidates_idxs, updated_states)
+        self._states_changed(tick, candidates_idxs, current_states)
+
+    def _hybrid_exposures(self, tick: float, sus_idxs: np.array, sus_cells: np.array, sus_cell_sizes: np.array,
+                          stoe_p: np.array) -> np.array:
+        # Whether each susceptible is exposed, with a draw per susceptible in places (or mixing group
+        # cells) with fewer than hybrid_threshold persons, and in larger ones, a binomial number of
+        # exposures at the place's highest probability, p_max, among its susceptibles. Those exposed are
+        # sampled from the place's susceptibles and then, if their probabilities differ, each kept with
+        # probability p / p_max. The large places' draws come from the model's generator, even with
+        # common random numbers. sus_cells and sus_cell_sizes are each susceptible's place or cell
+        # and its number of persons.
+        exposed = np.zeros(sus_idxs.shape[0], dtype=bool)
+        large = sus_cell_sizes >= self.hybrid_threshold
+        small = np.nonzero(~large)[0]
+        exposed[small] = self._uniforms(crn.EXPOSURE, tick, sus_idxs[small]) <= stoe_p[small]
+
+        large = np.nonzero(large & (stoe_p > 0))[0]
+        if large.shape[0] == 0:
+            return exposed
+        large = large[np.argsort(sus_cells[large], kind="stable")]
+        _, starts, n = np.unique(sus_cells[large], return_index=True, return_counts=True)
+        p = stoe_p[large]
+        p_max = np.maximum.reduceat(p, starts)
+        p_min = np.minimum.reduceat(p, starts)
+        n_exposed = self.rng.binomial(n, p_max)
+        for start, n_sus, k, hi, lo in zip(starts, n, n_exposed, p_max, p_min):
+            if k == 0:
+                continue
+            chosen = start + self.rng.choice(n_sus, k, replace=False)
+            if lo < hi:
+                chosen = chosen[self.rng.random(k) * hi <= p[chosen]]
+            exposed[large[chosen]] = True
+        return exposed
+
+    def _states_changed(self, tick: float, person_idxs: np.array, old_states: np.array):
+        # called once the persons' new states and next transition ticks have been set
+        if self.overrides is not None:
+            self.overrides.states_changed(self, person_idxs, old_states)
+        if self.line_list is not None:
+            self.line_list.log(tick, person_idxs, self.person_data, old_states, P_ID_IDX, P_STATE_IDX,
+                               P_NEXT_STATE_T_IDX)
+
+    def _uniforms(self, stream: int, tick: float, person_idxs: np.array) -> np.array:
+        # a uniform draw per person, from the common random numbers if enabled
+        if self.crn is None:
+            return self.rng.random(person_idxs.shape[0])
+        return self.crn.uniform(stream, tick, person_idxs)
+
+    def _set_next_transitions(self, tick: float, person_idxs: np.array, states: np.array):
+        # sets the next transition ticks of persons entering states, sampling the durations
+        # of each state's persons together. Persons entering states without a duration stay in them.
+        order = np.argsort(states, kind="stable")
+        sorted_states = states[order]
+        group_states, starts = np.unique(sorted_states, return_index=True)
+        for state, start, end in zip(group_states, starts, np.append(starts[1:], order.shape[0])):
+            if self.disease.duration_kinds[state] == NO_DURATION:
+                continue
+            idxs = person_idxs[order[start:end]]
+            np.put(self.person_data[:, P_NEXT_STATE_T_IDX], idxs,
+                   tick + self._durations(state, tick, idxs) * TICKS_PER_DAY)
+
+    def _durations(self, state: int, tick: float, person_idxs: np.array) -> np.array:
+        # days in the state for each person
+        kind = self.disease.duration_kinds[state]
+        a, b = self.disease.duration_params[state]
+        if kind == FIXED:
+            return np.full(person_idxs.shape[0], a)
+        if kind == EXPONENTIAL:
+            if self.crn is None:
+                return self.rng.exponential(a, person_idxs.shape[0])
+            return -a * np.log1p(-self.crn.uniform(crn.DURATION, tick, person_idxs))
+        # gamma, shape a and scale b
+        if self.crn is None:
+            return self.rng.gamma(a, b, person_idxs.shape[0])
+        return self.crn.gamma(a, b, crn.DURATION, tick, person_idxs)
 
     def run(self):
         self.runner.execute()
 
     def _log(self, tick):
-        # sum of persons in categories with np.count_nonzero
-        # np.count_nonzero(self.person_data[:, P_STATE_IDX] == SUSCEPTIBLE)
-        self.counts.susceptible += np.count_nonzero(self.person_data[:, P_STATE_IDX] == SUSCEPTIBLE)
-        self.counts.exposed += np.count_nonzero(self.person_data[:, P_STATE_IDX] == EXPOSED)
-        self.counts.presymp += np.count_nonzero(self.person_data[:, P_STATE_IDX] == PRESYMPTOMATIC)
-        self.counts.infected_symp += np.count_nonzero(self.person_data[:, P_STATE_IDX] == INFECTED_SYMP)
-        self.counts.infected_asymp += np.count_nonzero(self.person_data[:, P_STATE_IDX] == INFECTED_ASYMP)
-        self.counts.recovered += np.count_nonzero(self.person_data[:, P_STATE_IDX] == RECOVERED)
-        self.counts.hospitalized += np.count_nonzero(self.person_data[:, P_STATE_IDX] == HOSPITALIZED)
-        self.counts.dead += np.count_nonzero(self.person_data[:, P_STATE_IDX] == DEAD)
+        # sum of persons in each state
+        facility_state_counts = self._state_counts()
+        state_counts = facility_state_counts.sum(axis=0)
+        for name, count, newly in zip(self.disease.count_names, state_counts, self.newly):
+            setattr(self.counts, name, int(count))
+            setattr(self.counts, f"newly_{name}", int(newly))
+        self.newly[:] = 0
 
         self.data_set.log(tick)
-        self.counts_by_place.log_counts(tick, self.place_data)
+        if self.counts_by_place is not None:
+            self.counts_by_place.log_counts(tick, self.place_data)
+        if self.facility_counts is not None:
+            self.facility_counts.log(tick, facility_state_counts)
 
     def step(self):
         self.counts.reset()
@@ -247,31 +732,80 @@ class Model:
         self._log(tick)
 
 
-def create_duration_matrix(params: Dict[str, float]):
-    # 8 states, but we won"t use all of them (e.g. dead duration)
-    durations = np.zeros((len(STATE_MAP), 2), dtype=np.float32)
-    durations[EXPOSED] = params["exposed_duration_k"], \
-        params["exposed_duration_mean"] / params["exposed_duration_k"]
-    durations[INFECTED_ASYMP] = params["asymptomatic_duration_k"], \
-        params["asymptomatic_duration_mean"] / params["asymptomatic_duration_k"]
-    durations[INFECTED_SYMP] = params["symptomatic_duration_k"], \
-        params["symptomatic_duration_mean"] / params["symptomatic_duration_k"]
-    durations[PRESYMPTOMATIC] = params["presymptomatic_duration_k"], \
-        params["presymptomatic_duration_mean"] / params["presymptomatic_duration_k"]
-    durations[HOSPITALIZED] = params["hospital_duration_k"], \
-        params["hospital_duration_mean"] / params["hospital_duration_k"]
-    durations[RECOVERED] = params["recovered_duration_k"], \
-        params["recovered_duration_mean"] / params["recovered_duration_k"]
-    return durations
-
-
-def create_trans_matrix(transition_matrix: Dict[str, Dict[str, float]]):
-    n_states = len(STATE_MAP)
-    trans_matrix = np.zeros((n_states, n_states), dtype=np.float32)
-    for i_key, v in transition_matrix.items():
-        i = STATE_MAP[i_key]
-        for j_key, prob in v.items():
-            j = STATE_MAP[j_key]
-            trans_matrix[i, j] = prob
-
-    return trans_matrix
+@dataclass
+class Population:
+    schedule_data: np.array
+    risks: np.array
+    places: Places
+    residents: np.array
+    person_multipliers: PersonMultipliers = None
+    facility_network: FacilityNetwork = None
+    mixing_groups: MixingGroups = None
+
+    def copy(self) -> "Population":
+        # copies the state that a run changes, so the population can be reused for another run
+        facility_network = None
+        if self.facility_network is not None:
+            facility_network = copy.copy(self.facility_network)
+            facility_network.person_facility = self.facility_network.person_facility.copy()
+        # the groups' counts are per run
+        mixing_groups = None if self.mixing_groups is None else copy.copy(self.mixing_groups)
+        # a person store is reopened, a new copy on write map, rather than read into memory
+        if isinstance(self.residents, np.memmap):
+            residents = population.open_person_store(self.residents.filename)
+        else:
+            residents = np.array(self.residents)
+        return Population(self.schedule_data, self.risks,
+                          Places(self.places.place_id_map, self.places.place_data.copy(), self.places.type_names,
+                                 self.places.type_codes),
+                          residents, self.person_multipliers, facility_network, mixing_groups)
+
+
+def load_population(params: Dict) -> Population:
+    # loads the schedules, places and residents (and any person multipliers
+    # and facility network) specified in the params
+    n_workers = params.get("csv_workers", 1)
+    facility_network = None
+    if "facilities" in params:
+        schedule_data, risks, places, residents, facility_network = load_facilities(params["facilities"],
+                                                                                    n_workers)
+        residents_file = [facility["residents_file"] for facility in params["facilities"]]
+    else:
+        schedule_id_map, schedule_data, risks = population.create_schedules(params["schedule_file"])
+        places = population.create_places(params["places_file"], n_workers)
+        residents_file = params["residents_file"]
+        store_file = params.get("person_store_file")
+        if store_file is None:
+            residents = population.create_residents(residents_file, places.place_id_map, schedule_id_map, n_workers)
+        else:
+            residents = population.load_person_store(store_file, residents_file, params["schedule_file"],
+                                                     params["places_file"], places.place_id_map, schedule_id_map)
+
+    if places.type_codes is not None:
+        place_columns = {name: residents[:, col] for name, col in population.SCHEDULE_PLACE_TYPE_MAP.items()}
+        validate.check(validate.place_type_problems(place_columns, places.type_codes, places.type_names,
+                                                    params.get("place_type_columns")))
+
+    person_multipliers = None
+    if "person_multipliers" in params:
+        person_multipliers = create_person_multipliers(params["person_multipliers"], residents.shape[0],
+                                                       residents_file,
+                                                       np.random.default_rng(params["random_seed"]))
+
+    mixing_groups = None
+    if "mixing_groups" in params:
+        # separate generator from the multipliers', so adding groups doesn't change their levels
+        mixing_groups = create_mixing_groups(params["mixing_groups"], residents, places, residents_file,
+                                             np.random.default_rng(np.random.SeedSequence(params["random_seed"],
+                                                                                          spawn_key=(2,))))
+
+    return Population(schedule_data, risks, places, residents, person_multipliers, facility_network, mixing_groups)
+
+
+def create_model(params: Dict, comm=None, pop: Population = None) -> Model:
+    # creates the model from the params, loading the population if one isn't given.
+    # comm is None for a serial run.
+    pop = load_population(params) if pop is None else pop
+    return Model(comm, pop.schedule_data, pop.residents, pop.places, params["stoe"], None, None,
+                 params["random_seed"], params, pop.risks, pop.person_multipliers, pop.facility_network,
+                 create_disease_model(params), pop.mixing_groups)
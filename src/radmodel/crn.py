@@ -0,0 +1,169 @@
+import os
+from typing import Dict, Sequence, Union
+
+import numpy as np
+
+from .columnar import ColumnarWriter, PLAIN, DELTA, DICT
+from .ensemble import Moments
+
+# Common random numbers: each person's exposure, transition and duration draws are
+# a hash of (seed, stream, tick, person) rather than the next values of a sequential
+# generator. Runs with the same seed but different parameters (e.g. stoe or an
+# intervention) then use the same random numbers for the same persons at the same
+# ticks, so the paired differences between their counts have much lower variance.
+
+EXPOSURE = 0
+TRANSITION = 1
+DURATION = 2
+
+_MASK = (1 << 64) - 1
+
+
+def _mix(z: int) -> int:
+    # splitmix64 of a python int
+    z = (z + 0x9E3779B97F4A7C15) & _MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK
+    return z ^ (z >> 31)
+
+
+def _mix_array(z: np.array) -> np.array:
+    # splitmix64 of a uint64 array, wrapping on overflow
+    with np.errstate(over="ignore"):
+        z = z + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+# Acklam's rational approximation of the standard normal quantile function
+_A = (-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02, 1.383577518672690e+02,
+      -3.066479806614716e+01, 2.506628277459239e+00)
+_B = (-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02, 6.680131188771972e+01,
+      -1.328068155288572e+01, 1.0)
+_C = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00, -2.549732539343734e+00,
+      4.374664141464968e+00, 2.938163982698783e+00)
+_D = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00, 3.754408661907416e+00, 1.0)
+_P_LOW = 0.02425
+
+
+def norm_ppf(u: np.array) -> np.array:
+    u = np.asarray(u, dtype=np.float64)
+    tail = np.minimum(u, 1 - u)
+    q = np.sqrt(-2 * np.log(np.where(tail < _P_LOW, tail, _P_LOW)))
+    tails = np.polyval(_C, q) / np.polyval(_D, q)
+    tails = np.where(u < 0.5, tails, -tails)
+    q = u - 0.5
+    r = q * q
+    central = np.polyval(_A, r) * q / np.polyval(_B, r)
+    return np.where(tail < _P_LOW, tails, central)
+
+
+class CommonRandomNumbers:
+
+    def __init__(self, seed: int):
+        self.seed = seed
+
+    def uniform(self, stream: int, tick: float, person_idxs: np.array) -> np.array:
+        # uniforms in (0, 1), one per person
+        key = _mix(_mix(_mix(self.seed & _MASK) ^ stream) ^ int(tick))
+        h = _mix_array(np.asarray(person_idxs, dtype=np.uint64) ^ np.uint64(key))
+        return ((h >> np.uint64(11)).astype(np.float64) + 0.5) * 2.0 ** -53
+
+    def gamma(self, k: float, scale: float, stream: int, tick: float, person_idxs: np.array) -> np.array:
+        # gamma variates by inversion with the Wilson-Hilferty approximation, which is accurate
+        # for the shapes (k of about 3 or more) used for the state durations
+        z = norm_ppf(self.uniform(stream, tick, person_idxs))
+        c = 1 / (9 * k)
+        return k * scale * np.power(np.maximum(1 - c + z * np.sqrt(c), 0), 3)
+
+
+class PairedSummary:
+    # Per tick moments of the differences between paired runs' counts
+
+    def __init__(self, names: Sequence[str]):
+        self.names = list(names)
+        self.ticks = None
+        self.moments = None
+
+    @property
+    def n(self) -> int:
+        return 0 if self.moments is None else self.moments.n
+
+    def add(self, series_a: Dict[str, np.array], series_b: Dict[str, np.array]):
+        # adds a pair's series (e.g. MemoryDataSet.series()), the difference is b - a
+        if not np.array_equal(series_a["tick"], series_b["tick"]):
+            raise ValueError("Paired runs must log the same ticks")
+        if self.ticks is None:
+            self.ticks = np.asarray(series_a["tick"])
+            self.moments = Moments((self.ticks.shape[0], len(self.names)))
+        diffs = np.column_stack([series_b[name].astype(np.float64) - series_a[name] for name in self.names])
+        self.moments.add(diffs)
+
+    def merge(self, other: "PairedSummary"):
+        if other.ticks is None:
+            return
+        if self.ticks is None:
+            self.ticks = other.ticks
+            self.moments = Moments(other.moments.mean.shape)
+        self.moments.merge(other.moments)
+
+    def summary(self, z: float = 1.96) -> Dict[str, np.array]:
+        # long format, a row per tick and name, with the mean difference, its standard error and
+        # the normal approximation confidence interval
+        n_ticks, n_names = self.moments.mean.shape
+        se = np.sqrt(self.moments.variance / max(self.n, 1))
+        mean = self.moments.mean
+        return {"tick": np.repeat(self.ticks, n_names),
+                "name": np.tile(np.arange(n_names, dtype=np.uint32), n_ticks),
+                "n": np.full(n_ticks * n_names, self.n, dtype=np.int64),
+                "mean_diff": mean.ravel(),
+                "var_diff": self.moments.variance.ravel(),
+                "se": se.ravel(),
+                "ci_low": (mean - z * se).ravel(),
+                "ci_high": (mean + z * se).ravel()}
+
+    def write(self, fname: Union[str, os.PathLike], z: float = 1.96):
+        summary = self.summary(z)
+        columns = {"tick": (np.int64, DELTA), "name": (np.uint32, DICT), "n": (np.int64, PLAIN)}
+        for key in list(summary)[3:]:
+            columns[key] = (np.float64, PLAIN)
+        writer = ColumnarWriter(fname, columns, dictionaries={"name": np.array(self.names)})
+        writer.append(**summary)
+        writer.close()
+
+
+def run_pairs(params: Dict, overrides_a: Dict, overrides_b: Dict, seeds: Sequence[int]) -> PairedSummary:
+    # Runs each seed with both sets of parameter overrides, with common random numbers so
+    # the runs of a pair share their draws, and summarises the differences
+    from dataclasses import fields
+    from .core import load_population, create_model, create_disease_model
+    paired = PairedSummary([f.name for f in fields(create_disease_model(params).counts_class)])
+    pop = load_population(params)
+    for seed in seeds:
+        series = []
+        for overrides in (overrides_a, overrides_b):
+            run_params = dict(params, **overrides, random_seed=int(seed), common_random_numbers=True,
+                              counts_log_format="memory", places_log_format="none")
+            model = create_model(run_params, None, pop.copy())
+            model.run()
+            series.append(model.data_set.series())
+        paired.add(*series)
+    return paired
+
+
+def main():
+    from .__main__ import create_args_parser, init_params, resolve_params
+    parser = create_args_parser()
+    parser.prog = "radmodel.crn"
+    args = parser.parse_args()
+    params = resolve_params(init_params(args.parameters_file, args.parameters), args.parameters_file)
+
+    config = params["paired"]
+    seeds = params["random_seed"] + np.arange(config["replicates"])
+    paired = run_pairs(params, config.get("a", {}), config.get("b", {}), seeds)
+    paired.write(config["summary_file"])
+
+
+if __name__ == "__main__":
+    main()
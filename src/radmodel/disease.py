@@ -0,0 +1,236 @@
+from dataclasses import make_dataclass, fields
+from typing import Dict, List
+
+import numpy as np
+
+from .common import STATE_MAP, INFECTIOUS_MASK, DEAD, EXPOSED, SUSCEPTIBLE, PRESYMPTOMATIC, INFECTED_SYMP, \
+    INFECTED_ASYMP, RECOVERED, HOSPITALIZED
+
+# Disease models: the states, which of them are infectious, the probabilities of the transitions
+# between them and the distribution of the days spent in each. A model is compiled into per state
+# alias tables, so sampling a person's next state takes a single uniform and a constant amount of
+# work whatever the number of states.
+#
+# The model is either the built in one, from the transition_matrix and *_duration params, or one
+# defined by the disease_model param, e.g.
+#
+# disease_model:
+#   # state entered on exposure
+#   exposed: E
+#   # states in code order, the first is the state of the loaded population
+#   states:
+#     S: {}
+#     E:
+#       duration: {distribution: gamma, mean: 3.5, k: 6}
+#       transitions: {I: 1.0}
+#     I:
+#       infectious: true
+#       duration: {distribution: exponential, mean: 7}
+#       transitions: {R: 0.99, D: 0.01}
+#     R: {count: recovered}
+#     D: {dead: true}
+#
+# Each state's count (the name of its series in the counts log, with a newly_ series of the
+# persons entering it from another state) defaults to its lower case name. Durations are gamma (mean and k),
+# exponential (mean) or fixed (days). States without transitions are absorbing.
+
+NO_DURATION = 0
+GAMMA = 1
+EXPONENTIAL = 2
+FIXED = 3
+
+# count names of the built in model's states, in state code order
+DEFAULT_COUNT_NAMES = {SUSCEPTIBLE: "susceptible", EXPOSED: "exposed", PRESYMPTOMATIC: "presymp",
+                       INFECTED_SYMP: "infected_symp", INFECTED_ASYMP: "infected_asymp", RECOVERED: "recovered",
+                       HOSPITALIZED: "hospitalized", DEAD: "dead"}
+
+
+def make_counts_class(count_names: List[str]):
+    # dataclass of the per tick counts of the persons in each state, and newly in each state,
+    # logged by the model
+    def reset(self):
+        for f in fields(self):
+            setattr(self, f.name, 0)
+
+    return make_dataclass("Counts", [(name, int, 0) for name in count_names]
+                          + [(f"newly_{name}", int, 0) for name in count_names], namespace={"reset": reset})
+
+
+def _alias_table(probs: np.array):
+    # Vose's alias table of the probabilities: column i is chosen uniformly, and then i itself
+    # with probability accept[i], else alias[i]
+    n = probs.shape[0]
+    scaled = probs * n / probs.sum()
+    accept = np.ones(n)
+    alias = np.arange(n)
+    small = [i for i in range(n) if scaled[i] < 1]
+    large = [i for i in range(n) if scaled[i] >= 1]
+    while len(small) > 0 and len(large) > 0:
+        s, g = small.pop(), large.pop()
+        accept[s] = scaled[s]
+        alias[s] = g
+        scaled[g] -= 1 - scaled[s]
+        (small if scaled[g] < 1 else large).append(g)
+    # any left over are 1 up to rounding, and keep accept 1
+    return accept, alias
+
+
+class DiseaseModel:
+
+    def __init__(self, names: List[str], transitions: np.array, duration_kinds: np.array,
+                 duration_params: np.array, infectious: np.array, dead: np.array, exposed: int,
+                 count_names: List[str] = None):
+        # names: state names in state code order, the first the susceptible state, transitions: (state, next state)
+        # probabilities, duration_kinds: distribution of the days in each state, duration_params: its (k, scale)
+        # if gamma, (mean, 0) if exponential, or (days, 0) if fixed
+        self.names = list(names)
+        self.state_map = {name: np.int32(i) for i, name in enumerate(self.names)}
+        self.n_states = len(self.names)
+        self.susceptible = np.int32(0)
+        self.exposed = np.int32(exposed)
+        self.infectious = np.asarray(infectious, dtype=bool)
+        self.dead = np.asarray(dead, dtype=bool)
+        self.duration_kinds = np.array(duration_kinds, dtype=np.int32)
+        self.duration_params = np.asarray(duration_params, dtype=np.float64)
+        self.count_names = [name.lower() for name in self.names] if count_names is None else list(count_names)
+        self.counts_class = make_counts_class(self.count_names)
+        self._compile(np.asarray(transitions, dtype=np.float64))
+        # persons never leave absorbing states, so no transition is scheduled for them
+        self.duration_kinds[self.absorbing] = NO_DURATION
+
+    def _compile(self, transitions: np.array):
+        # each state's next states padded to the most of any state, so sampling is a gather
+        # from (state, column) tables
+        targets = [np.nonzero(row > 0)[0] for row in transitions]
+        n_cols = max(max(t.shape[0] for t in targets), 1)
+        self.n_next = np.ones(self.n_states, dtype=np.int64)
+        self.next_states = np.repeat(np.arange(self.n_states, dtype=np.int32)[:, None], n_cols, axis=1)
+        self.aliases = self.next_states.copy()
+        self.accept = np.ones((self.n_states, n_cols))
+        self.absorbing = np.array([t.shape[0] == 0 for t in targets], dtype=bool)
+        for state, target in enumerate(targets):
+            if target.shape[0] == 0:
+                # absorbing, the next state is always the state itself
+                continue
+            accept, alias = _alias_table(transitions[state, target])
+            n = target.shape[0]
+            self.n_next[state] = n
+            self.next_states[state, :n] = target
+            self.aliases[state, :n] = target[alias]
+            self.accept[state, :n] = accept
+
+    def sample_next_states(self, states: np.array, uniforms: np.array) -> np.array:
+        # the next state of persons in states, from a uniform per person: the integer part of
+        # u * n_next selects the column, and the fractional part the column's state or its alias
+        n_next = self.n_next[states]
+        x = uniforms * n_next
+        cols = np.minimum(x.astype(np.int64), n_next - 1)
+        return np.where(x - cols < self.accept[states, cols], self.next_states[states, cols],
+                        self.aliases[states, cols])
+
+    def transition_probs(self) -> np.array:
+        # the (state, next state) probabilities the alias tables sample from
+        probs = np.zeros((self.n_states, self.n_states))
+        rows = np.repeat(np.arange(self.n_states), self.accept.shape[1])
+        valid = (np.arange(self.accept.shape[1])[None, :] < self.n_next[:, None]).ravel()
+        share = (1 / np.repeat(self.n_next, self.accept.shape[1]))[valid]
+        accept = self.accept.ravel()[valid]
+        np.add.at(probs, (rows[valid], self.next_states.ravel()[valid]), share * accept)
+        np.add.at(probs, (rows[valid], self.aliases.ravel()[valid]), share * (1 - accept))
+        return probs
+
+
+def create_duration_matrix(params: Dict[str, float]):
+    # 8 states, but we won"t use all of them (e.g. dead duration)
+    durations = np.zeros((len(STATE_MAP), 2), dtype=np.float32)
+    durations[EXPOSED] = params["exposed_duration_k"], \
+        params["exposed_duration_mean"] / params["exposed_duration_k"]
+    durations[INFECTED_ASYMP] = params["asymptomatic_duration_k"], \
+        params["asymptomatic_duration_mean"] / params["asymptomatic_duration_k"]
+    durations[INFECTED_SYMP] = params["symptomatic_duration_k"], \
+        params["symptomatic_duration_mean"] / params["symptomatic_duration_k"]
+    durations[PRESYMPTOMATIC] = params["presymptomatic_duration_k"], \
+        params["presymptomatic_duration_mean"] / params["presymptomatic_duration_k"]
+    durations[HOSPITALIZED] = params["hospital_duration_k"], \
+        params["hospital_duration_mean"] / params["hospital_duration_k"]
+    durations[RECOVERED] = params["recovered_duration_k"], \
+        params["recovered_duration_mean"] / params["recovered_duration_k"]
+    return durations
+
+
+def create_trans_matrix(transition_matrix: Dict[str, Dict[str, float]]):
+    n_states = len(STATE_MAP)
+    trans_matrix = np.zeros((n_states, n_states), dtype=np.float32)
+    for i_key, v in transition_matrix.items():
+        i = STATE_MAP[i_key]
+        for j_key, prob in v.items():
+            j = STATE_MAP[j_key]
+            trans_matrix[i, j] = prob
+
+    return trans_matrix
+
+
+def default_disease_model(trans_matrix: np.array, duration_matrix: np.array) -> DiseaseModel:
+    # the built in model, from create_trans_matrix and create_duration_matrix's (k, scale) gamma durations
+    names = sorted(STATE_MAP, key=lambda name: STATE_MAP[name])
+    kinds = np.where(duration_matrix[:, 0] > 0, GAMMA, NO_DURATION)
+    dead = np.zeros(len(names), dtype=bool)
+    dead[DEAD] = True
+    return DiseaseModel(names, trans_matrix, kinds, duration_matrix, INFECTIOUS_MASK, dead, EXPOSED,
+                        [DEFAULT_COUNT_NAMES[STATE_MAP[name]] for name in names])
+
+
+def _duration(state_name: str, duration: Dict) -> tuple:
+    # (kind, params) of a state's duration entry
+    distribution = duration.get("distribution", "gamma")
+    if distribution == "gamma":
+        return GAMMA, (duration["k"], duration["mean"] / duration["k"])
+    if distribution == "exponential":
+        return EXPONENTIAL, (duration["mean"], 0)
+    if distribution == "fixed":
+        return FIXED, (duration["days"], 0)
+    raise ValueError(f"Disease state {state_name} has unknown duration distribution {distribution}, "
+                     "expected gamma, exponential or fixed")
+
+
+def parse_disease_model(spec: Dict) -> DiseaseModel:
+    # a model from the disease_model param, see above
+    states = spec["states"]
+    names = list(states)
+    index = {name: i for i, name in enumerate(names)}
+    if spec.get("exposed") not in index:
+        raise ValueError(f"Disease model's exposed state {spec.get('exposed')} is not one of its states {names}")
+
+    n_states = len(names)
+    transitions = np.zeros((n_states, n_states))
+    kinds = np.zeros(n_states, dtype=np.int32)
+    params = np.zeros((n_states, 2))
+    for name, state in states.items():
+        state = state or {}
+        i = index[name]
+        for next_name, p in (state.get("transitions") or {}).items():
+            if next_name not in index:
+                raise ValueError(f"Disease state {name} has a transition to unknown state {next_name}")
+            transitions[i, index[next_name]] = p
+        total = transitions[i].sum()
+        if total > 0 and not np.isclose(total, 1.0):
+            raise ValueError(f"Disease state {name}'s transition probabilities sum to {total:g} rather than 1")
+        if "duration" in state:
+            kinds[i], params[i] = _duration(name, state["duration"])
+        elif total > 0:
+            raise ValueError(f"Disease state {name} has transitions but no duration")
+        if "duration" in state and total == 0:
+            raise ValueError(f"Disease state {name} has a duration but no transitions")
+
+    return DiseaseModel(names, transitions, kinds, params,
+                        [bool((states[name] or {}).get("infectious", False)) for name in names],
+                        [bool((states[name] or {}).get("dead", False)) for name in names],
+                        index[spec["exposed"]],
+                        [(states[name] or {}).get("count", name.lower()) for name in names])
+
+
+def create_disease_model(params: Dict) -> DiseaseModel:
+    # the disease_model param's model if there is one, otherwise the built in model
+    if "disease_model" in params:
+        return parse_disease_model(params["disease_model"])
+    return default_disease_model(create_trans_matrix(params["transition_matrix"]), create_duration_matrix(params))
@@ -0,0 +1,223 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import fields
+from typing import Dict, List, Sequence, Union
+
+import numpy as np
+
+from .columnar import ColumnarWriter, PLAIN, DELTA, DICT
+
+# Streaming per tick statistics of the Counts fields across the replicate runs of a
+# parameter set. Each replicate's in memory count series is folded into an
+# EnsembleAggregator as it finishes, and the partial aggregators of process pool
+# workers or MPI ranks are merged, so no per run files are written.
+
+
+class Moments:
+    # Welford running mean and sum of squared deviations, elementwise over arrays of values
+
+    def __init__(self, shape):
+        self.n = 0
+        self.mean = np.zeros(shape, dtype=np.float64)
+        self.m2 = np.zeros(shape, dtype=np.float64)
+
+    def add(self, vals: np.array):
+        self.n += 1
+        delta = vals - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (vals - self.mean)
+
+    def merge(self, other: "Moments"):
+        # Chan et al. pairwise combination
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * (other.n / n)
+        self.m2 += other.m2 + delta * delta * (self.n * other.n / n)
+        self.n = n
+
+    @property
+    def variance(self) -> np.array:
+        # sample variance
+        return self.m2 / (self.n - 1) if self.n > 1 else np.zeros_like(self.m2)
+
+
+class LogSketch:
+    # Mergeable quantile sketch of non-negative values, elementwise over arrays of values. Values
+    # are counted in logarithmically sized buckets, (gamma^(k - 1), gamma^k] for bucket k + 1 and 0
+    # for bucket 0, so a quantile is estimated with a relative error of at most alpha.
+
+    def __init__(self, shape, alpha: float = 0.05):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.shape = tuple(np.atleast_1d(shape))
+        self.counts = np.zeros(self.shape + (1,), dtype=np.uint32)
+
+    def _grow(self, n_buckets: int):
+        if n_buckets > self.counts.shape[-1]:
+            pad = [(0, 0)] * len(self.shape) + [(0, n_buckets - self.counts.shape[-1])]
+            self.counts = np.pad(self.counts, pad)
+
+    def buckets(self, vals: np.array) -> np.array:
+        vals = np.asarray(vals, dtype=np.float64)
+        buckets = np.zeros(vals.shape, dtype=np.int64)
+        pos = vals > 0
+        buckets[pos] = np.ceil(np.log(vals[pos]) / np.log(self.gamma)).astype(np.int64) + 1
+        return np.maximum(buckets, 0)
+
+    def add(self, vals: np.array):
+        buckets = self.buckets(vals)
+        self._grow(int(buckets.max()) + 1)
+        n_buckets = self.counts.shape[-1]
+        flat = np.arange(buckets.size) * n_buckets + buckets.ravel()
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(self.counts.shape).astype(np.uint32)
+
+    def merge(self, other: "LogSketch"):
+        if other.gamma != self.gamma:
+            raise ValueError("Only sketches with the same accuracy can be merged")
+        self._grow(other.counts.shape[-1])
+        self.counts[..., :other.counts.shape[-1]] += other.counts
+
+    def quantile(self, q: float) -> np.array:
+        n = self.counts.sum(axis=-1)
+        cum = np.cumsum(self.counts, axis=-1)
+        rank = np.floor(q * (n - 1))
+        buckets = np.argmax(cum > rank[..., None], axis=-1)
+        # midpoint (relative to the error) of each bucket's range
+        vals = 2 * np.power(self.gamma, buckets - 1.0) / (self.gamma + 1)
+        return np.where(buckets == 0, 0.0, vals)
+
+
+class EnsembleAggregator:
+
+    def __init__(self, names: List[str], alpha: float = 0.05):
+        # names are the series to aggregate, e.g. the Counts fields
+        self.names = list(names)
+        self.alpha = alpha
+        self.ticks = None
+        self.moments = None
+        self.sketch = None
+
+    @property
+    def n(self) -> int:
+        return 0 if self.moments is None else self.moments.n
+
+    def _init(self, ticks: np.array):
+        self.ticks = np.asarray(ticks)
+        shape = (self.ticks.shape[0], len(self.names))
+        self.moments = Moments(shape)
+        self.sketch = LogSketch(shape, self.alpha)
+
+    def add(self, series: Dict[str, np.array]):
+        # adds a replicate's series, a dict of tick and name -> per tick values (e.g. MemoryDataSet.series())
+        if self.ticks is None:
+            self._init(series["tick"])
+        elif not np.array_equal(self.ticks, series["tick"]):
+            raise ValueError("Replicate ticks differ from those of the ensemble")
+        vals = np.column_stack([series[name] for name in self.names]).astype(np.float64)
+        self.moments.add(vals)
+        self.sketch.add(vals)
+
+    def merge(self, other: "EnsembleAggregator"):
+        if other.ticks is None:
+            return
+        if self.ticks is None:
+            self._init(other.ticks)
+        elif not np.array_equal(self.ticks, other.ticks):
+            raise ValueError("Ensemble ticks differ")
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+
+    def summary(self, quantiles: Sequence[float] = (0.05, 0.5, 0.95)) -> Dict[str, np.array]:
+        # long format, a row per tick and name
+        n_ticks, n_names = self.moments.mean.shape
+        summary = {"tick": np.repeat(self.ticks, n_names),
+                   "name": np.tile(np.arange(n_names, dtype=np.uint32), n_ticks),
+                   "n": np.full(n_ticks * n_names, self.n, dtype=np.int64),
+                   "mean": self.moments.mean.ravel(),
+                   "var": self.moments.variance.ravel()}
+        for q in quantiles:
+            summary[_quantile_name(q)] = self.sketch.quantile(q).ravel()
+        return summary
+
+    def write(self, fname: Union[str, os.PathLike], quantiles: Sequence[float] = (0.05, 0.5, 0.95)):
+        # writes the summary as a columnar file, names are dictionary encoded
+        summary = self.summary(quantiles)
+        columns = {"tick": (np.int64, DELTA), "name": (np.uint32, DICT), "n": (np.int64, PLAIN)}
+        for key in list(summary)[3:]:
+            columns[key] = (np.float64, PLAIN)
+        writer = ColumnarWriter(fname, columns, dictionaries={"name": np.array(self.names)})
+        writer.append(**summary)
+        writer.close()
+
+
+def _quantile_name(q: float) -> str:
+    return f"q{round(q * 100):02d}" if round(q * 100) == q * 100 else f"q{q}"
+
+
+def reduce_ensemble(aggregator: EnsembleAggregator, comm) -> EnsembleAggregator:
+    # merges the ranks' aggregators, the merged aggregator is returned on rank 0, None elsewhere
+    parts = comm.gather(aggregator, root=0)
+    if comm.Get_rank() != 0:
+        return None
+    for part in parts[1:]:
+        aggregator.merge(part)
+    return aggregator
+
+
+def _replicate_params(params: Dict, seed: int) -> Dict:
+    # replicates keep their counts in memory and don't log places
+    return dict(params, random_seed=int(seed), counts_log_format="memory", places_log_format="none")
+
+
+def run_replicates(params: Dict, seeds: Sequence[int]) -> EnsembleAggregator:
+    # runs a serial replicate per seed, loading the population once
+    from .core import load_population, create_model, create_disease_model
+    aggregator = EnsembleAggregator([f.name for f in fields(create_disease_model(params).counts_class)],
+                                    params.get("ensemble_alpha", 0.05))
+    pop = None
+    for seed in seeds:
+        replicate_params = _replicate_params(params, seed)
+        pop = load_population(replicate_params) if pop is None else pop
+        model = create_model(replicate_params, None, pop.copy())
+        model.run()
+        aggregator.add(model.data_set.series())
+    return aggregator
+
+
+def run_ensemble(params: Dict, n_replicates: int, n_workers: int = 1, comm=None) -> EnsembleAggregator:
+    # Runs n_replicates with seeds random_seed, random_seed + 1, ... split across n_workers
+    # processes, and, if comm is given, across its ranks. Returns the merged
+    # aggregator (on rank 0 only, if comm is given).
+    seeds = params["random_seed"] + np.arange(n_replicates)
+    if comm is not None:
+        seeds = np.array_split(seeds, comm.Get_size())[comm.Get_rank()]
+
+    if n_workers <= 1:
+        aggregator = run_replicates(params, seeds)
+    else:
+        with ProcessPoolExecutor(n_workers) as pool:
+            parts = list(pool.map(run_replicates, [params] * n_workers, np.array_split(seeds, n_workers)))
+        aggregator = parts[0]
+        for part in parts[1:]:
+            aggregator.merge(part)
+
+    return aggregator if comm is None else reduce_ensemble(aggregator, comm)
+
+
+def main():
+    from .__main__ import create_args_parser, init_params, resolve_params, init_comm
+    parser = create_args_parser()
+    parser.prog = "radmodel.ensemble"
+    args = parser.parse_args()
+    params = resolve_params(init_params(args.parameters_file, args.parameters), args.parameters_file)
+
+    aggregator = run_ensemble(params, params["ensemble_replicates"], params.get("ensemble_workers", 1),
+                              init_comm(params))
+    if aggregator is not None:
+        aggregator.write(params["ensemble_summary_file"], params.get("ensemble_quantiles", (0.05, 0.5, 0.95)))
+
+
+if __name__ == "__main__":
+    main()
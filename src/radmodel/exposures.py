@@ -0,0 +1,92 @@
+import os
+from typing import Dict, Tuple, Union
+
+import numpy as np
+
+from .columnar import ColumnarWriter, ColumnarReader, PLAIN, DELTA, DICT
+
+# Log of every exposure event, (tick, person, place, infected count, person count), with
+# the counts being those of the place when the exposure happened. With mixing groups the
+# counts are those of the person's group within the place, the cell the hazard was computed
+# from, and the group is logged in a group column. Events are appended to preallocated
+# buffers and written as compressed columnar blocks when they fill.
+
+
+class ExposureLogger:
+
+    def __init__(self, place_ids: np.array, fname: Union[str, os.PathLike], chunk_rows: int = 1 << 16,
+                 groups: bool = False):
+        # place_ids: id of the place in each place row, groups: whether to log each exposure's mixing group
+        self.fname = fname
+        self.chunk_rows = chunk_rows
+        columns = {"tick": (np.int64, DELTA),
+                   "person_id": (np.uint32, PLAIN),
+                   "place_id": (np.uint32, DICT),
+                   "infected_count": (np.uint32, PLAIN),
+                   "person_count": (np.uint32, PLAIN)}
+        if groups:
+            columns["group"] = (np.uint16, PLAIN)
+        self.writer = ColumnarWriter(fname, columns, dictionaries={"place_id": place_ids}, chunk_rows=chunk_rows)
+        self._ticks = np.zeros(chunk_rows, dtype=np.int64)
+        self._persons = np.zeros(chunk_rows, dtype=np.uint32)
+        self._places = np.zeros(chunk_rows, dtype=np.uint32)
+        self._infected = np.zeros(chunk_rows, dtype=np.uint32)
+        self._counts = np.zeros(chunk_rows, dtype=np.uint32)
+        self._groups = np.zeros(chunk_rows, dtype=np.uint16) if groups else None
+        self._n = 0
+
+    def log(self, tick: float, person_ids: np.array, place_idxs: np.array, counts: np.array,
+            groups: np.array = None):
+        # counts: (n, 2) person and infected counts of each exposure's place, or cell with groups
+        start = 0
+        n = person_ids.shape[0]
+        while start < n:
+            m = min(n - start, self.chunk_rows - self._n)
+            buf = slice(self._n, self._n + m)
+            self._ticks[buf] = tick
+            self._persons[buf] = person_ids[start:start + m]
+            self._places[buf] = place_idxs[start:start + m]
+            self._counts[buf] = counts[start:start + m, 0]
+            self._infected[buf] = counts[start:start + m, 1]
+            if self._groups is not None:
+                self._groups[buf] = groups[start:start + m]
+            self._n += m
+            start += m
+            if self._n == self.chunk_rows:
+                self.flush()
+
+    def flush(self):
+        if self._n > 0:
+            n = self._n
+            cols = {} if self._groups is None else {"group": self._groups[:n]}
+            self.writer.append(tick=self._ticks[:n], person_id=self._persons[:n], place_id=self._places[:n],
+                               infected_count=self._infected[:n], person_count=self._counts[:n], **cols)
+            self.writer.flush()
+            self._n = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def read_exposures(fname: Union[str, os.PathLike], tick_range: Tuple[float, float] = None) -> Dict[str, np.array]:
+    return ColumnarReader(fname).read(tick_range=tick_range)
+
+
+def exposures_by_place(fname: Union[str, os.PathLike],
+                       tick_range: Tuple[float, float] = None) -> Dict[str, np.array]:
+    # number of exposures in each place where any happened, and the mean number of
+    # infected persons present at those exposures
+    data = ColumnarReader(fname).read(["place_id", "infected_count"], tick_range)
+    place_ids, inverse, n = np.unique(data["place_id"], return_inverse=True, return_counts=True)
+    infected = np.bincount(inverse, weights=data["infected_count"], minlength=place_ids.shape[0])
+    return {"place_id": place_ids, "exposures": n, "mean_infected": infected / np.maximum(n, 1)}
+
+
+def exposures_by_tick(fname: Union[str, os.PathLike], tick_range: Tuple[float, float] = None,
+                      place_id: int = None) -> Dict[str, np.array]:
+    # number of exposures at each tick where any happened, optionally in a single place
+    data = ColumnarReader(fname).read(["tick", "place_id"], tick_range)
+    ticks = data["tick"] if place_id is None else data["tick"][data["place_id"] == place_id]
+    ticks, n = np.unique(ticks, return_counts=True)
+    return {"tick": ticks, "exposures": n}
@@ -0,0 +1,117 @@
+import os
+from typing import Dict, List, Union
+
+import numpy as np
+
+from .common import TICKS_PER_DAY
+from .population import SCHEDULE_PLACE_TYPE_MAP, P_SCHEDULE_IDX, read_resident_columns
+
+# Timed changes to the schedules and place columns of a subset of persons, e.g. module closures
+# ("from day 10, mod 3's cafeteria time is spent in their cells"), lockdowns, or cafeteria
+# staggering. Changes are applied to the running model through Model.reassign, which patches the
+# schedule membership, occupancy index and place counts for just the affected persons, so an
+# intervention costs time proportional to the persons it changes rather than the population.
+#
+# interventions:
+#   - day: 10
+#     end_day: 24            # optional, the persons' schedules and places are restored
+#     persons: {column: mod, values: [3]}
+#     replace_place_type: {from: cafeteria, to: cell, window: [420, 480]}   # window in minutes, optional
+#   - day: 5
+#     persons: {place_type: cafeteria, place_ids: [500]}
+#     set_place: {place_type: cafeteria, place_id: 501}
+
+
+def replace_place_type(model, person_idxs: np.array, from_col: int, to_col: int, ticks: slice = slice(None)):
+    # Replaces the from_col place type (person place column idx) with to_col within the ticks of day
+    # of the persons' schedules. The changed schedules are forked, so persons sharing a
+    # schedule with the affected ones keep the original.
+    sched_idxs, inverse = np.unique(model.person_data[person_idxs, P_SCHEDULE_IDX], return_inverse=True)
+    rows = model.schedule_data.reshape(-1, TICKS_PER_DAY)[sched_idxs].copy()
+    # a view, so the replacement changes rows
+    window = rows[:, ticks]
+    window[window == from_col] = to_col
+
+    changed = np.any(rows != model.schedule_data.reshape(-1, TICKS_PER_DAY)[sched_idxs], axis=1)
+    new_idxs = sched_idxs.astype(np.int64)
+    if np.any(changed):
+        risks = None if model.risk_table is None else model.risk_table[:, sched_idxs[changed]].T
+        new_idxs[changed] = model.add_schedules(rows[changed], risks)
+    model.reassign(person_idxs, new_idxs[inverse])
+
+
+def set_place(model, person_idxs: np.array, col: int, place_idx: int):
+    # assigns the persons to a place (row idx) for a place type, e.g. a different cafeteria
+    model.reassign(person_idxs, place_columns={col: np.full(person_idxs.shape[0], place_idx, dtype=np.uint32)})
+
+
+def select_persons(model, persons: Dict = None,
+                   residents_file: Union[str, os.PathLike, List] = None) -> np.array:
+    # person row idxs by residents file column values, e.g. {column: mod, values: [3]}, or by
+    # place ids of a place type, e.g. {place_type: cell, place_ids: [0, 1, 2]}. All persons if None.
+    n_persons = model.person_data.shape[0]
+    if persons is None:
+        return np.arange(n_persons)
+    if "column" in persons:
+        fnames = residents_file if isinstance(residents_file, (list, tuple)) else [residents_file]
+        col = np.concatenate([read_resident_columns(fname, [persons["column"]])[persons["column"]]
+                              for fname in fnames])
+        if col.shape[0] != n_persons:
+            raise ValueError(f"Intervention column {persons['column']} has {col.shape[0]} rows, expected {n_persons}")
+        return np.nonzero(np.isin(col, persons["values"]))[0]
+    if "place_type" in persons:
+        place_idxs = _place_idxs(model, persons["place_ids"])
+        return np.nonzero(np.isin(model.person_data[:, SCHEDULE_PLACE_TYPE_MAP[persons["place_type"]]],
+                                  place_idxs))[0]
+    raise ValueError(f"Intervention persons {persons} require either a column or a place_type")
+
+
+def _place_idxs(model, place_ids: List[int]) -> np.array:
+    unknown = [place_id for place_id in place_ids if place_id not in model.place_data.place_id_map]
+    if len(unknown) > 0:
+        raise ValueError(f"Intervention has unknown place ids {unknown}")
+    return np.array([model.place_data.place_id_map[place_id] for place_id in place_ids], dtype=np.uint32)
+
+
+def _window_ticks(window: List[int]) -> slice:
+    # minutes of the day, [start, end), to ticks of the day
+    if window is None:
+        return slice(None)
+    return slice(window[0] // (24 * 60 // TICKS_PER_DAY), -(-window[1] // (24 * 60 // TICKS_PER_DAY)))
+
+
+def _action(model, intervention: Dict):
+    if "replace_place_type" in intervention:
+        change = intervention["replace_place_type"]
+        from_col, to_col = SCHEDULE_PLACE_TYPE_MAP[change["from"]], SCHEDULE_PLACE_TYPE_MAP[change["to"]]
+        ticks = _window_ticks(change.get("window"))
+        return [], lambda idxs: replace_place_type(model, idxs, from_col, to_col, ticks)
+    if "set_place" in intervention:
+        change = intervention["set_place"]
+        col = SCHEDULE_PLACE_TYPE_MAP[change["place_type"]]
+        place_idx = int(_place_idxs(model, [change["place_id"]])[0])
+        return [col], lambda idxs: set_place(model, idxs, col, place_idx)
+    raise ValueError(f"Intervention {intervention} has no replace_place_type or set_place change")
+
+
+def schedule_interventions(model, interventions: List[Dict], residents_file: Union[str, os.PathLike, List] = None):
+    # Schedules each intervention just before the first tick of its day, and its restoration,
+    # if it has an end_day, just before the first tick of that day.
+    for intervention in interventions:
+        person_idxs = select_persons(model, intervention.get("persons"), residents_file)
+        place_cols, apply = _action(model, intervention)
+
+        def evt(person_idxs=person_idxs, place_cols=place_cols, apply=apply, end_day=intervention.get("end_day")):
+            if end_day is not None:
+                saved = model.person_data[person_idxs][:, [P_SCHEDULE_IDX] + place_cols]
+                restore = (lambda: model.reassign(person_idxs, saved[:, 0],
+                                                  {col: saved[:, i + 1] for i, col in enumerate(place_cols)}))
+                model.runner.schedule_event(_day_start(end_day), restore)
+            apply(person_idxs)
+
+        model.runner.schedule_event(_day_start(intervention["day"]), evt)
+
+
+def _day_start(day: float) -> float:
+    # tick 0 is the initial state, the first step is at tick 1
+    return max(day * TICKS_PER_DAY - 0.5, 0.5)
@@ -0,0 +1,65 @@
+import os
+from typing import Dict, Tuple, Union
+
+import numpy as np
+
+from .columnar import ColumnarWriter, ColumnarReader, PLAIN, DELTA
+
+# Line list of persons' state changes, (tick, person id, from state, to state, next transition tick),
+# for all persons or a sampled subset, written in compressed columnar blocks.
+
+
+class LineListLogger:
+
+    def __init__(self, fname: Union[str, os.PathLike], sample: np.array = None, chunk_rows: int = 1 << 16,
+                 n_states: int = 256):
+        # sample: optional bool mask over person rows of the persons to record, n_states: the disease
+        # model's number of states, the states are stored in the smallest unsigned type that holds them
+        self.sample = sample
+        state_dtype = np.min_scalar_type(max(n_states - 1, 0))
+        self.writer = ColumnarWriter(fname, {"tick": (np.int64, DELTA),
+                                             "person_id": (np.uint32, PLAIN),
+                                             "from_state": (state_dtype, PLAIN),
+                                             "to_state": (state_dtype, PLAIN),
+                                             "next_tick": (np.uint32, PLAIN)}, chunk_rows=chunk_rows)
+
+    def log(self, tick: float, person_idxs: np.array, person_data: np.array, from_states: np.array,
+            id_col: int, state_col: int, next_col: int):
+        if self.sample is not None:
+            keep = self.sample[person_idxs]
+            person_idxs, from_states = person_idxs[keep], from_states[keep]
+        if person_idxs.shape[0] > 0:
+            self.writer.append(tick=np.full(person_idxs.shape[0], tick, dtype=np.int64),
+                               person_id=person_data[person_idxs, id_col], from_state=from_states,
+                               to_state=person_data[person_idxs, state_col],
+                               next_tick=person_data[person_idxs, next_col])
+
+    def close(self):
+        self.writer.close()
+
+
+def read_line_list(fname: Union[str, os.PathLike], tick_range: Tuple[float, float] = None) -> Dict[str, np.array]:
+    return ColumnarReader(fname).read(tick_range=tick_range)
+
+
+def timelines(fname: Union[str, os.PathLike]) -> Dict[str, np.array]:
+    # The records grouped by person, in tick order within each person. Person
+    # person_ids[i]'s records are rows offsets[i]:offsets[i + 1] of the other columns.
+    data = read_line_list(fname)
+    order = np.argsort(data["person_id"], kind="stable")
+    data = {name: vals[order] for name, vals in data.items()}
+    person_ids, counts = np.unique(data["person_id"], return_counts=True)
+    offsets = np.zeros(person_ids.shape[0] + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return dict(data, person_ids=person_ids, offsets=offsets)
+
+
+def state_durations(fname: Union[str, os.PathLike], state: int) -> Dict[str, np.array]:
+    # the person and number of ticks of each completed spell in the state
+    lines = timelines(fname)
+    entered = np.nonzero(lines["to_state"][:-1] == state)[0]
+    # a spell ends with the person's next record
+    entered = entered[lines["person_id"][entered + 1] == lines["person_id"][entered]]
+    return {"person_id": lines["person_id"][entered],
+            "start": lines["tick"][entered],
+            "duration": lines["tick"][entered + 1] - lines["tick"][entered]}
@@ -0,0 +1,140 @@
+import os
+from typing import Dict, List, Union
+import numpy as np
+
+from .population import Places, read_resident_columns, P_SCHEDULE_IDX, P_CURRENT_PLACE_IDX, P_CELL_IDX
+from .overrides import REMOVED
+
+# Mixing groups (tables, tiers, shifts etc.) within places. Persons in a grouped place only mix
+# with the persons of their own group, so exposure is computed per (place, group) cell rather
+# than per place, with the same place hazard. Each grouped place has n_groups cells, and each
+# other place a single cell, so the cells' person and infected counts are a flat array alongside
+# the places' counts, updated with them as persons move. A person's group is the same in all the
+# grouped places, and is assigned from a residents file column or by rule, e.g.
+#   mixing_groups:
+#     place_types: [cafeteria, yard]
+#     n_groups: 4
+#     # random, or cell or schedule: persons sharing a cell or schedule are in the same group
+#     rule: cell
+# or
+#   mixing_groups:
+#     place_types: [cafeteria]
+#     column: table
+
+RULES = ("random", "cell", "schedule")
+
+
+class MixingGroups:
+
+    def __init__(self, groups: np.array, grouped_places: np.array, n_groups: int, rule: str = None):
+        # groups: the group of each person, grouped_places: whether each place is split into the groups,
+        # rule: the rule the groups were assigned by, if any
+        self.groups = groups
+        self.rule = rule
+        self.grouped = grouped_places.astype(np.int64)
+        self.n_groups = n_groups
+        # first cell of each place, and total number of cells at the end
+        self.cell_offsets = np.zeros(grouped_places.shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.where(grouped_places, n_groups, 1), out=self.cell_offsets[1:])
+        # (person count, infected count) of each cell, set by place_all
+        self.counts = None
+
+    @property
+    def n_cells(self) -> int:
+        return int(self.cell_offsets[-1])
+
+    def cells(self, person_idxs: np.array, place_idxs: np.array) -> np.array:
+        # cells of the persons in the places, which mustn't be REMOVED
+        return self.cell_offsets[place_idxs] + self.groups[person_idxs] * self.grouped[place_idxs]
+
+    def _placed_cells(self, person_idxs: np.array, place_idxs: np.array) -> np.array:
+        placed = place_idxs != REMOVED
+        return self.cells(person_idxs[placed], place_idxs[placed])
+
+    def place_all(self, person_data: np.array, map_chunks=None):
+        # counts the persons in each cell from their current places, a chunk of persons at a time
+        # with the model's map_chunks
+        def count_chunk(i, start, end):
+            cells = self._placed_cells(np.arange(start, end), person_data[start:end, P_CURRENT_PLACE_IDX])
+            return np.bincount(cells, minlength=self.n_cells)
+
+        n_persons = person_data.shape[0]
+        self.counts = np.zeros((self.n_cells, 2), dtype=np.int64)
+        for chunk_counts in ([count_chunk(0, 0, n_persons)] if map_chunks is None else map_chunks(count_chunk)):
+            self.counts[:, 0] += chunk_counts
+
+    def move(self, person_idxs: np.array, old_places: np.array, new_places: np.array):
+        # updates the person counts for persons moving from old_places to new_places, either may be REMOVED
+        np.subtract.at(self.counts[:, 0], self._placed_cells(person_idxs, old_places), 1)
+        np.add.at(self.counts[:, 0], self._placed_cells(person_idxs, new_places), 1)
+
+    def regroup(self, person_data: np.array, person_idxs: np.array):
+        # reassigns the groups of persons whose cell or schedule has changed (e.g. transferred between
+        # facilities) under the cell and schedule rules, moving them to their new group's cell of their
+        # current place. The groups are replaced rather than changed in place, so a shared Population's
+        # are unaffected.
+        if self.rule not in ("cell", "schedule"):
+            return
+        col = P_CELL_IDX if self.rule == "cell" else P_SCHEDULE_IDX
+        new_groups = (person_data[person_idxs, col] % self.n_groups).astype(np.uint16)
+        changed = new_groups != self.groups[person_idxs]
+        person_idxs, new_groups = person_idxs[changed], new_groups[changed]
+        if person_idxs.shape[0] == 0:
+            return
+        places = person_data[person_idxs, P_CURRENT_PLACE_IDX]
+        if self.counts is not None:
+            np.subtract.at(self.counts[:, 0], self._placed_cells(person_idxs, places), 1)
+        self.groups = self.groups.copy()
+        self.groups[person_idxs] = new_groups
+        if self.counts is not None:
+            np.add.at(self.counts[:, 0], self._placed_cells(person_idxs, places), 1)
+
+    def set_infected(self, person_idxs: np.array, place_idxs: np.array):
+        # infected counts from the infectious persons and their current places
+        self.counts[:, 1] = np.bincount(self._placed_cells(person_idxs, place_idxs), minlength=self.n_cells)
+
+    def hazards(self, hazard, person_idxs: np.array, place_idxs: np.array) -> np.array:
+        # exposure probability of each of the persons, from their cell's hazard
+        return hazard.compute(self.counts)[self.cells(person_idxs, place_idxs)]
+
+
+def create_mixing_groups(spec: Dict, residents: np.array, places: Places,
+                         residents_file: Union[str, os.PathLike, List] = None,
+                         rng: np.random.Generator = None) -> MixingGroups:
+    # groups from the mixing_groups param, see above. residents_file can be a list of
+    # files (e.g. one per facility) whose rows are concatenated.
+    if places.type_codes is None:
+        raise ValueError("Mixing groups require a type column in the places file")
+    unknown = sorted(set(spec["place_types"]) - set(places.type_names.tolist()))
+    if len(unknown) > 0:
+        raise ValueError(f"Mixing groups have unknown place types {unknown}, "
+                         f"expected some of {places.type_names.tolist()}")
+    grouped_places = np.isin(places.type_names, spec["place_types"])[places.type_codes]
+
+    n_persons = residents.shape[0]
+    if "column" in spec:
+        fnames = residents_file if isinstance(residents_file, (list, tuple)) else [residents_file]
+        groups = np.concatenate([read_resident_columns(fname, [spec["column"]])[spec["column"]] for fname in fnames])
+        if groups.shape[0] != n_persons:
+            raise ValueError(f"Mixing group column {spec['column']} has {groups.shape[0]} rows, expected {n_persons}")
+        if np.any(groups < 0):
+            raise ValueError(f"Mixing group column {spec['column']} has {np.count_nonzero(groups < 0)} "
+                             f"negative groups, e.g. row {np.nonzero(groups < 0)[0][0]}")
+        n_groups = int(spec.get("n_groups", groups.max() + 1 if n_persons > 0 else 1))
+        if np.any(groups >= n_groups):
+            raise ValueError(f"Mixing group column {spec['column']} has groups outside 0 - {n_groups - 1}")
+    else:
+        rule = spec.get("rule", "random")
+        n_groups = int(spec["n_groups"])
+        if rule == "random":
+            groups = rng.integers(0, n_groups, n_persons)
+        elif rule == "cell":
+            groups = residents[:, P_CELL_IDX] % n_groups
+        elif rule == "schedule":
+            groups = residents[:, P_SCHEDULE_IDX] % n_groups
+        else:
+            raise ValueError(f"Unknown mixing group rule {rule}, expected one of {RULES}")
+    if n_groups > np.iinfo(np.uint16).max:
+        raise ValueError(f"Mixing groups have {n_groups} groups, at most {np.iinfo(np.uint16).max} are allowed")
+
+    return MixingGroups(groups.astype(np.uint16), grouped_places, n_groups, None if "column" in spec else rule)
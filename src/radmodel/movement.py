@@ -0,0 +1,88 @@
+import os
+from typing import Dict, Union
+
+import numpy as np
+
+from .common import TICKS_PER_DAY
+from .population import Places, P_ID_IDX, P_SCHEDULE_IDX, create_schedules, create_places, create_residents, \
+    create_schedule_segments, resident_places, map_ids
+
+# Where persons are at each tick of the day according to their schedules, for analysis, e.g. heatmaps
+# and Gantt charts of persons' days and occupancy of sets of places. Locations are gathered from the
+# expanded schedules and residents' place columns for all the persons of a subset at once.
+
+
+class MovementQuery:
+
+    def __init__(self, schedule_data: np.array, residents: np.array, places: Places, chunk_size: int = 1 << 16):
+        # chunk_size: persons whose locations are gathered at once when counting occupancy
+        self.schedule_data = schedule_data
+        self.residents = residents
+        self.places = places
+        self.chunk_size = chunk_size
+        self.segments = create_schedule_segments(schedule_data)
+        self.person_id_map = dict(zip(residents[:, P_ID_IDX].tolist(), range(residents.shape[0])))
+
+    @property
+    def place_ids(self) -> np.array:
+        # the place id of each place row idx
+        return self.places.place_data[:, 0]
+
+    def person_idxs(self, person_ids) -> np.array:
+        return map_ids(np.asarray(person_ids, dtype=np.int64), self.person_id_map, "person")
+
+    def place_idxs(self, place_ids) -> np.array:
+        return map_ids(np.asarray(place_ids, dtype=np.int64), self.places.place_id_map, "place")
+
+    def locations(self, person_idxs: np.array = None) -> np.array:
+        # place row idx of each person (all if None) at each tick of the day, (n persons, TICKS_PER_DAY)
+        return resident_places(self.schedule_data, self.residents, person_idxs)
+
+    def occupancy(self, place_idxs: np.array, person_idxs: np.array = None) -> np.array:
+        # number of the persons (all if None) in each of the places at each tick of the day,
+        # (n places, TICKS_PER_DAY)
+        n_places = self.places.place_data.shape[0]
+        # position of each place in place_idxs, or one past the end for the other places
+        place_pos = np.full(n_places, place_idxs.shape[0], dtype=np.int64)
+        place_pos[place_idxs] = np.arange(place_idxs.shape[0])
+        if person_idxs is None:
+            person_idxs = np.arange(self.residents.shape[0])
+
+        counts = np.zeros((place_idxs.shape[0] + 1) * TICKS_PER_DAY, dtype=np.int64)
+        tods = np.arange(TICKS_PER_DAY)
+        for start in range(0, person_idxs.shape[0], self.chunk_size):
+            pos = place_pos[self.locations(person_idxs[start:start + self.chunk_size])]
+            counts += np.bincount((pos * TICKS_PER_DAY + tods).ravel(), minlength=counts.shape[0])
+        # the last row counts the persons in none of the places
+        return counts.reshape(-1, TICKS_PER_DAY)[:-1]
+
+    def stays(self, person_idxs: np.array) -> Dict[str, np.array]:
+        # Each person's day as stays in places, in order of person_idxs and then start, a stay being
+        # a segment of their schedule (a place type) merged with the following ones in the same place.
+        # Ticks are ticks of the day, the stay spanning [start, end).
+        offsets = self.segments.offsets
+        sched_idxs = self.residents[person_idxs, P_SCHEDULE_IDX]
+        n_segments = offsets[sched_idxs + 1] - offsets[sched_idxs]
+        rows = np.repeat(np.arange(person_idxs.shape[0]), n_segments)
+        first = np.repeat(offsets[sched_idxs], n_segments)
+        row_starts = np.repeat(np.cumsum(n_segments) - n_segments, n_segments)
+        segs = first + np.arange(rows.shape[0]) - row_starts
+        starts = self.segments.starts[segs].astype(np.int64)
+        places = self.residents[person_idxs[rows], self.segments.place_types[segs]]
+
+        # a stay starts with a person's first segment or a change of place
+        keep = np.ones(rows.shape[0], dtype=bool)
+        keep[1:] = (rows[1:] != rows[:-1]) | (places[1:] != places[:-1])
+        rows, starts, places = rows[keep], starts[keep], places[keep]
+        ends = np.full(rows.shape[0], TICKS_PER_DAY, dtype=np.int64)
+        same = rows[1:] == rows[:-1]
+        ends[:-1][same] = starts[1:][same]
+        return {"person_idx": person_idxs[rows], "place_idx": places, "start": starts, "end": ends}
+
+
+def load_movements(schedule_file: Union[str, os.PathLike], places_file: Union[str, os.PathLike],
+                   residents_file: Union[str, os.PathLike]) -> MovementQuery:
+    schedule_id_map, schedule_data, _ = create_schedules(schedule_file)
+    places = create_places(places_file)
+    residents = create_residents(residents_file, places.place_id_map, schedule_id_map)
+    return MovementQuery(schedule_data, residents, places)
@@ -0,0 +1,72 @@
+import os
+from typing import Dict, List, Union
+import numpy as np
+
+from .population import read_resident_columns
+
+
+class PersonMultipliers:
+    # Per person exposure probability multipliers (vulnerability, shielding, masking etc.)
+    # stored as a uint8 class per person, indexing a lookup table of the combined
+    # multiplier of all the factors for that class.
+
+    def __init__(self, classes: np.array, lut: np.array):
+        self.classes = classes
+        self.lut = lut
+
+    def get(self, person_idxs: np.array) -> np.array:
+        return self.lut[self.classes[person_idxs]]
+
+
+def create_person_multipliers(factors: Dict[str, Dict], n_persons: int,
+                              residents_file: Union[str, os.PathLike, List] = None,
+                              rng: np.random.Generator = None) -> PersonMultipliers:
+    # Each factor has a list of multiplier values, one per level, and gets each person's
+    # level either from a residents file column or at random according to level probabilities:
+    #   vulnerability:
+    #     values: [1.0, 1.5, 2.0]
+    #     column: vulnerability
+    #   masking:
+    #     values: [1.0, 0.5]
+    #     probs: [0.6, 0.4]
+    #
+    # residents_file can be a list of files (e.g. one per facility) whose rows are concatenated.
+    columns = [f["column"] for f in factors.values() if "column" in f]
+    col_data = {}
+    if len(columns) > 0:
+        fnames = residents_file if isinstance(residents_file, (list, tuple)) else [residents_file]
+        parts = [read_resident_columns(fname, columns) for fname in fnames]
+        col_data = {name: np.concatenate([part[name] for part in parts]) for name in columns}
+
+    n_classes = 1
+    for factor in factors.values():
+        n_classes *= len(factor["values"])
+    if n_classes > 256:
+        raise ValueError(f"Person multiplier factors have {n_classes} combined levels, at most 256 are allowed")
+
+    # mixed radix: class = sum of level * product of the number of levels of the preceding factors
+    classes = np.zeros(n_persons, dtype=np.uint8)
+    lut = np.ones(n_classes, dtype=np.float32)
+    stride = 1
+    for name, factor in factors.items():
+        values = np.asarray(factor["values"], dtype=np.float32)
+        n_levels = values.shape[0]
+        if "column" in factor:
+            levels = col_data[factor["column"]]
+            if levels.shape[0] != n_persons:
+                raise ValueError(f"Person multiplier column {factor['column']} has {levels.shape[0]} rows, "
+                                 f"expected {n_persons}")
+            bad = (levels < 0) | (levels >= n_levels)
+            if np.any(bad):
+                raise ValueError(f"Person multiplier {name} has {np.count_nonzero(bad)} levels outside "
+                                 f"0 - {n_levels - 1}, e.g. row {np.nonzero(bad)[0][0]}")
+        elif "probs" in factor:
+            levels = rng.choice(n_levels, n_persons, p=factor["probs"])
+        else:
+            raise ValueError(f"Person multiplier {name} requires either a column or probs")
+
+        classes += (levels * stride).astype(np.uint8)
+        lut *= np.repeat(np.tile(values, n_classes // (stride * n_levels)), stride)
+        stride *= n_levels
+
+    return PersonMultipliers(classes, lut)
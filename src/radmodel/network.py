@@ -0,0 +1,162 @@
+import csv
+import os
+from typing import Dict, List, Tuple
+import numpy as np
+
+from .common import find_free_filename
+from .population import create_schedules, create_places, create_residents, Places, SCHEDULE_PLACE_TYPE_MAP, \
+    P_SCHEDULE_IDX, P_CURRENT_PLACE_IDX, P_STATE_IDX
+
+# resident columns that hold place row indices
+PLACE_COLUMNS = sorted(set(SCHEDULE_PLACE_TYPE_MAP.values()))
+
+
+class FacilityNetwork:
+    # Facilities concatenated into a single person and place store. Facility f's places are rows
+    # place_offsets[f]:place_offsets[f + 1] of the combined places, and its schedules are
+    # schedule_offsets[f]:schedule_offsets[f + 1]. Persons can transfer between facilities
+    # so person_facility records each person's current facility.
+    #
+    # Place ids are only unique within a facility, so the combined place ids are
+    # facility index * place_id_stride + place id.
+
+    def __init__(self, names: List[str], person_offsets: np.array, place_offsets: np.array,
+                 schedule_offsets: np.array, place_id_stride: int):
+        self.names = names
+        self.person_offsets = person_offsets
+        self.place_offsets = place_offsets
+        self.schedule_offsets = schedule_offsets
+        self.place_id_stride = place_id_stride
+        self.person_facility = np.repeat(np.arange(len(names), dtype=np.uint16), np.diff(person_offsets))
+
+    @property
+    def n_facilities(self) -> int:
+        return len(self.names)
+
+    def facility_idx(self, facility) -> int:
+        # facility name or index to index
+        return self.names.index(facility) if isinstance(facility, str) else int(facility)
+
+    def split_place_ids(self, place_ids: np.array) -> Tuple[np.array, np.array]:
+        # combined place ids to facility indices and facility place ids
+        return np.divmod(place_ids, self.place_id_stride)
+
+    def transfer_persons(self, model, person_idxs: np.array, to_facility):
+        # Transfers the persons to the facility as a single batch. Each transferred person takes
+        # the schedule and place assignments of a randomly selected resident of the destination,
+        # and reassign moves them to their new places, mixing groups and place_type overrides.
+        dest = self.facility_idx(to_facility)
+        dest_members = np.nonzero(self.person_facility == dest)[0]
+        templates = model.rng.choice(dest_members, person_idxs.shape[0])
+        model.reassign(person_idxs, model.person_data[templates, P_SCHEDULE_IDX],
+                       {col: model.person_data[templates, col] for col in PLACE_COLUMNS})
+        self.person_facility[person_idxs] = dest
+
+    def transfer(self, model, n: int, from_facility, to_facility):
+        # transfers n randomly selected, living residents between the facilities. Persons with placement
+        # overrides (e.g. hospitalised or isolated) stay where they are.
+        src = self.facility_idx(from_facility)
+        candidates = np.nonzero((self.person_facility == src)
+                                & ~model.disease.dead[model.person_data[:, P_STATE_IDX]])[0]
+        if model.overrides is not None and len(model.overrides) > 0:
+            candidates = candidates[~model.overrides.contains(candidates)]
+        person_idxs = model.rng.choice(candidates, min(n, candidates.shape[0]), replace=False)
+        self.transfer_persons(model, person_idxs, to_facility)
+
+
+def load_facilities(facilities: List[Dict], n_workers: int = 1) -> Tuple[np.array, np.array, Places, np.array, FacilityNetwork]:
+    # Loads each facility's schedules, places and residents (schedule_file, places_file, and
+    # residents_file entries, plus an optional name) into a single store, returning
+    # the combined schedule data, schedule risks, places and residents, and the network.
+    schedules, risks, place_datas, place_types, residents = [], [], [], [], []
+    names = []
+    person_offsets = [0]
+    place_offsets = [0]
+    schedule_offsets = [0]
+    for i, facility in enumerate(facilities):
+        names.append(str(facility.get("name", i)))
+        schedule_id_map, schedule_data, schedule_risks = create_schedules(facility["schedule_file"])
+        places = create_places(facility["places_file"], n_workers)
+        facility_residents = create_residents(facility["residents_file"], places.place_id_map, schedule_id_map,
+                                              n_workers)
+
+        facility_residents[:, P_SCHEDULE_IDX] += schedule_offsets[-1]
+        facility_residents[:, PLACE_COLUMNS + [P_CURRENT_PLACE_IDX]] += place_offsets[-1]
+
+        schedules.append(schedule_data)
+        risks.append(schedule_risks)
+        place_datas.append(places.place_data)
+        if places.type_names is not None:
+            place_types.append(places.type_names[places.type_codes])
+        residents.append(facility_residents)
+        person_offsets.append(person_offsets[-1] + facility_residents.shape[0])
+        place_offsets.append(place_offsets[-1] + places.place_data.shape[0])
+        schedule_offsets.append(schedule_offsets[-1] + len(set(schedule_id_map.values())))
+
+    place_data = np.concatenate(place_datas)
+    place_id_stride = 10 ** len(str(int(place_data[:, 0].max())))
+    if place_id_stride * len(facilities) > np.iinfo(place_data.dtype).max:
+        raise ValueError(f"Too many facilities ({len(facilities)}) for the range of place ids")
+    facility_idxs = np.repeat(np.arange(len(facilities)), np.diff(place_offsets))
+    place_data[:, 0] += (facility_idxs * place_id_stride).astype(place_data.dtype)
+    place_id_map = {int(place_id): i for i, place_id in enumerate(place_data[:, 0])}
+
+    type_names = type_codes = None
+    if len(place_types) == len(facilities):
+        type_names, type_codes = np.unique(np.concatenate(place_types), return_inverse=True)
+        type_codes = type_codes.astype(np.int32)
+
+    network = FacilityNetwork(names, np.array(person_offsets), np.array(place_offsets),
+                              np.array(schedule_offsets), place_id_stride)
+    return np.concatenate(schedules), np.concatenate(risks), Places(place_id_map, place_data, type_names, type_codes), \
+        np.concatenate(residents), network
+
+
+class FacilityCountsLogger:
+    # Logs the number of persons in each state, and newly in each state, per facility. Newly in state
+    # counts are the persons entering each state since the previous log, by their facility then.
+
+    def __init__(self, network: FacilityNetwork, comm, log_fname: str, headers: List[str], n_states: int):
+        self.network = network
+        self.comm = comm
+        self.rank = comm.Get_rank()
+        self.n_states = n_states
+        self.newly = np.zeros((network.n_facilities, n_states), dtype=np.int64)
+        self.ticks = []
+        self.rows = []
+        if self.rank == 0:
+            self.log_fname = find_free_filename(log_fname)
+            with open(self.log_fname, "w") as fout:
+                csv.writer(fout).writerow(["tick", "facility"] + headers)
+
+    def entered(self, person_idxs: np.array, states: np.array):
+        # counts the persons entering the states
+        np.add.at(self.newly, (self.network.person_facility[person_idxs], states), 1)
+
+    def log(self, tick: float, counts: np.array):
+        # counts: (facility, state) person counts
+        self.ticks.append(tick)
+        self.rows.append(np.hstack([counts, self.newly]))
+        self.newly[:] = 0
+
+    def write(self):
+        if len(self.rows) == 0:
+            return
+        data = np.array(self.rows, dtype=np.int64)
+        if self.comm.Get_size() > 1:
+            from mpi4py import MPI
+            totals = np.empty_like(data) if self.rank == 0 else None
+            self.comm.Reduce(data, totals, MPI.SUM, 0)
+        else:
+            totals = data
+        if self.rank == 0:
+            with open(self.log_fname, "a") as fout:
+                writer = csv.writer(fout)
+                for tick, vals in zip(self.ticks, totals):
+                    for name, facility_vals in zip(self.network.names, vals):
+                        writer.writerow([tick, name] + facility_vals.tolist())
+        self.ticks.clear()
+        self.rows.clear()
+
+    def close(self):
+        self.write()
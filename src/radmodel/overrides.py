@@ -0,0 +1,149 @@
+from typing import Dict, Union
+
+import numpy as np
+
+from .common import STATE_MAP
+from .population import SCHEDULE_PLACE_TYPE_MAP, P_SCHEDULE_IDX, P_CURRENT_PLACE_IDX, P_STATE_IDX, \
+    PL_PERSON_COUNT_IDX
+
+# Per person placement overrides, e.g. isolation, hospitalisation or removal of the dead. An
+# overridden person stays in a fixed place, or is REMOVED from all places (not counted in any
+# place's occupancy and can't be exposed), rather than following their schedule. The overrides
+# are a sparse map applied as a correction on top of the bulk, schedule based placement, so
+# their cost is proportional to the number of overridden persons.
+#
+# Rules set a person's override when they enter a state and clear it when they leave the rule
+# states, e.g.
+#   placement_overrides:
+#     H: {place_id: 900}        # a medical place
+#     I_S: {place_type: cell}   # isolated in their own cell
+#     D: removed
+#
+# The occupancy index (occupancy_index param) describes the schedule based placement and
+# doesn't include the overrides.
+
+# current place of removed persons
+REMOVED = np.uint32(np.iinfo(np.uint32).max)
+
+
+class PlacementOverrides:
+
+    def __init__(self, rules: Dict[int, Dict[str, int]] = None):
+        # rules: state -> {"place_idx": place row idx} or {"place_col": person place column idx},
+        # or {} for removed
+        self.rules = {} if rules is None else rules
+        self.rule_states = np.array(sorted(self.rules), dtype=np.int64)
+        # sorted overridden person idxs and their places
+        self.persons = np.zeros(0, dtype=np.int64)
+        self.places = np.zeros(0, dtype=np.uint32)
+
+    def __len__(self):
+        return self.persons.shape[0]
+
+    def _positions(self, person_idxs: np.array):
+        pos = np.searchsorted(self.persons, person_idxs)
+        found = pos < self.persons.shape[0]
+        found[found] = self.persons[pos[found]] == person_idxs[found]
+        return pos, found
+
+    def contains(self, person_idxs: np.array) -> np.array:
+        return self._positions(person_idxs)[1]
+
+    def get(self, person_idxs: np.array) -> np.array:
+        # the override places of overridden persons
+        return self.places[self._positions(person_idxs)[0]]
+
+    def set(self, model, person_idxs: np.array, place_idxs: np.array):
+        # overrides the persons' places with place_idxs (row idxs or REMOVED), moving them
+        # now if the model has placed persons
+        place_idxs = np.broadcast_to(np.asarray(place_idxs, dtype=np.uint32), np.shape(person_idxs))
+        person_idxs, first = np.unique(person_idxs, return_index=True)
+        place_idxs = place_idxs[first]
+        keep = ~np.isin(self.persons, person_idxs)
+        persons = np.concatenate([self.persons[keep], person_idxs])
+        order = np.argsort(persons, kind="stable")
+        self.persons = persons[order]
+        self.places = np.concatenate([self.places[keep], place_idxs])[order]
+        if model._placed_tod is not None:
+            _relocate(model, person_idxs, place_idxs)
+
+    def clear(self, model, person_idxs: np.array):
+        # returns the persons to their schedules
+        person_idxs = np.unique(person_idxs)
+        person_idxs = person_idxs[self.contains(person_idxs)]
+        if person_idxs.shape[0] == 0:
+            return
+        keep = ~np.isin(self.persons, person_idxs)
+        self.persons, self.places = self.persons[keep], self.places[keep]
+        if model._placed_tod is not None:
+            place_cols = model.next_place_idxs[model.person_data[person_idxs, P_SCHEDULE_IDX]]
+            _relocate(model, person_idxs, model.person_data[person_idxs, place_cols])
+
+    def reassigned(self, model, person_idxs: np.array):
+        # re-resolves the overrides of persons whose place columns have changed (e.g. transferred
+        # between facilities), so those from place_type rules follow them to their new places
+        overridden = person_idxs[self.contains(person_idxs)]
+        if overridden.shape[0] == 0:
+            return
+        states = model.person_data[overridden, P_STATE_IDX]
+        for state, rule in self.rules.items():
+            if "place_col" in rule:
+                idxs = overridden[states == state]
+                if idxs.shape[0] > 0:
+                    self.set(model, idxs, model.person_data[idxs, rule["place_col"]])
+
+    def correct(self, person_data: np.array, counts: np.array):
+        # applies the overrides after all the persons have been placed by their schedules,
+        # counts being the person count of each place
+        if len(self) == 0:
+            return
+        np.subtract.at(counts, person_data[self.persons, P_CURRENT_PLACE_IDX], 1)
+        person_data[self.persons, P_CURRENT_PLACE_IDX] = self.places
+        np.add.at(counts, self.places[self.places != REMOVED], 1)
+
+    def states_changed(self, model, person_idxs: np.array, old_states: np.array):
+        # applies the rules to persons whose states have changed
+        if len(self.rules) == 0 or person_idxs.shape[0] == 0:
+            return
+        new_states = model.person_data[person_idxs, P_STATE_IDX]
+        for state, rule in self.rules.items():
+            entering = person_idxs[(new_states == state) & (old_states != state)]
+            if entering.shape[0] > 0:
+                if "place_col" in rule:
+                    places = model.person_data[entering, rule["place_col"]]
+                else:
+                    places = rule.get("place_idx", REMOVED)
+                self.set(model, entering, places)
+        leaving = np.isin(old_states, self.rule_states) & ~np.isin(new_states, self.rule_states)
+        self.clear(model, person_idxs[leaving])
+
+
+def _relocate(model, person_idxs: np.array, new_places: np.array):
+    # moves placed persons to new_places, either of which may be REMOVED
+    old_places = model.person_data[person_idxs, P_CURRENT_PLACE_IDX]
+    model.person_data[person_idxs, P_CURRENT_PLACE_IDX] = new_places
+    counts = model.place_data.place_data[:, PL_PERSON_COUNT_IDX]
+    np.subtract.at(counts, old_places[old_places != REMOVED], 1)
+    np.add.at(counts, new_places[new_places != REMOVED], 1)
+    if model.mixing is not None:
+        model.mixing.move(person_idxs, old_places, new_places)
+
+
+def create_overrides(rules: Dict[str, Union[str, Dict]], place_id_map: Dict[int, int],
+                     state_map: Dict[str, int] = STATE_MAP) -> PlacementOverrides:
+    # rules from the placement_overrides param, see above, state_map: the disease model's state codes
+    parsed = {}
+    for state_name, rule in rules.items():
+        if state_name not in state_map:
+            raise ValueError(f"Placement override has unknown state {state_name}")
+        if rule == "removed":
+            parsed[int(state_map[state_name])] = {}
+        elif "place_id" in rule:
+            if rule["place_id"] not in place_id_map:
+                raise ValueError(f"Placement override for {state_name} has unknown place id {rule['place_id']}")
+            parsed[int(state_map[state_name])] = {"place_idx": place_id_map[rule["place_id"]]}
+        elif "place_type" in rule:
+            parsed[int(state_map[state_name])] = {"place_col": SCHEDULE_PLACE_TYPE_MAP[rule["place_type"]]}
+        else:
+            raise ValueError(f"Placement override for {state_name} requires removed, a place_id or a place_type")
+    return PlacementOverrides(parsed)
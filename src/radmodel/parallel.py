@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+import numpy as np
+
+# Thread parallel execution of the model's per person work (placement, state scans and exposure
+# draws) over contiguous chunks of the person arrays. The numpy operations on each chunk release
+# the GIL, so the chunks run on multiple cores within a single process. Each chunk has its own
+# random generator, a substream of the model's seed, so results depend on the number of chunks
+# but not on how the threads are scheduled.
+
+
+class ChunkPool:
+
+    def __init__(self, n_threads: int, n_persons: int, chunk_size: int, seed: int):
+        self.starts = np.arange(0, max(n_persons, 1), chunk_size, dtype=np.int64)
+        self.ends = np.minimum(self.starts + chunk_size, n_persons)
+        # spawn key (1, chunk), distinct from other substreams of the seed, e.g. the line list sample's (0,)
+        seeds = np.random.SeedSequence(seed, spawn_key=(1,)).spawn(self.starts.shape[0])
+        self.rngs = [np.random.default_rng(s) for s in seeds]
+        self.executor = ThreadPoolExecutor(n_threads, thread_name_prefix="radmodel")
+
+    @property
+    def n_chunks(self) -> int:
+        return self.starts.shape[0]
+
+    def map(self, fn: Callable[[int, int, int], any]) -> List:
+        # fn(chunk, start, end) of each chunk, in chunk order
+        futures = [self.executor.submit(fn, i, int(start), int(end))
+                   for i, (start, end) in enumerate(zip(self.starts, self.ends))]
+        return [future.result() for future in futures]
+
+    def split(self, person_idxs: np.array) -> np.array:
+        # offsets of each chunk's persons in sorted person_idxs, chunk i's are
+        # person_idxs[offsets[i]:offsets[i + 1]]
+        return np.searchsorted(person_idxs, np.append(self.starts, self.ends[-1]))
+
+    def close(self):
+        self.executor.shutdown()
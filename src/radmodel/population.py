@@ -1,10 +1,16 @@
 import csv
+import io
+import itertools
+import json
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from typing import Union, Dict, List, Tuple
 import os
 import numpy as np
 from dataclasses import dataclass
 
 from .common import TICKS_PER_DAY, TICK_DURATION, MIDNIGHT, SUSCEPTIBLE
+from . import validate
 
 P_DATA_ID_IDX = 0
 P_DATA_SCHEDULE_IDX = 1
@@ -47,86 +53,305 @@ SCHEDULE_PLACE_TYPE_MAP = {
 }
 
 
-@dataclass
-class ScheduleRow:
-    id: int
-    start: int
-    end: int
-    place_type: int
-    risk: float
-
-
-def _validate_row(row: ScheduleRow):
-    if row.start < 0 or row.start > MIDNIGHT:
-        raise ValueError(f"Schedule {row.id} is invalid: {row}")
-
-
-def _schedule_rows_to_array(rows: List[ScheduleRow]):
-    np_data = np.zeros((TICKS_PER_DAY), dtype=np.int32)
-    risks = np.zeros((TICKS_PER_DAY), dtype=np.float32)
-    rows_index = 0
-    row = rows[rows_index]
-    for idx in range(0, TICKS_PER_DAY):
-        t = idx * TICK_DURATION
-        # sorted so can ignore start
-        while t >= row.end:
-            rows_index += 1
-            row = rows[rows_index]
-
-        np_data[idx] = row.place_type
-        risks[idx] = row.risk
-
-    return np_data, risks
+def _line_chunks(fname: Union[str, os.PathLike], n_chunks: int) -> List[Tuple[int, int]]:
+    # byte ranges of roughly equal size that start at the beginning of a line, skipping the header
+    size = os.path.getsize(fname)
+    with open(fname, "rb") as fin:
+        fin.readline()
+        starts = [fin.tell()]
+        for i in range(1, n_chunks):
+            fin.seek(max(size * i // n_chunks, starts[-1]))
+            fin.readline()
+            starts.append(fin.tell())
+    starts.append(size)
+    return [(start, end) for start, end in zip(starts[:-1], starts[1:]) if end > start]
+
+
+def _load_chunk(fname: Union[str, os.PathLike], start: int, end: int, usecols: List[int], dtype) -> np.array:
+    with open(fname, "rb") as fin:
+        fin.seek(start)
+        text = fin.read(end - start).decode()
+    return np.loadtxt(io.StringIO(text), delimiter=",", usecols=usecols, dtype=dtype, ndmin=2)
+
+
+def read_csv_columns(fname: Union[str, os.PathLike], usecols: List[int], dtype=np.int64,
+                     n_workers: int = 1) -> np.array:
+    # Reads the columns of a csv file with a header into an (n_rows, len(usecols)) array. With
+    # n_workers > 1, line aligned chunks of the file are parsed in parallel processes.
+    usecols = list(usecols)
+    if n_workers <= 1:
+        return np.loadtxt(fname, delimiter=",", skiprows=1, usecols=usecols, dtype=dtype, ndmin=2)
+
+    chunks = _line_chunks(fname, n_workers)
+    if len(chunks) == 0:
+        return np.zeros((0, len(usecols)), dtype=dtype)
+    with ProcessPoolExecutor(min(n_workers, len(chunks))) as pool:
+        futures = [pool.submit(_load_chunk, fname, start, end, usecols, dtype) for start, end in chunks]
+        return np.concatenate([f.result() for f in futures])
+
+
+def lookup_ids(ids: np.array, id_map: Dict[int, int]) -> Tuple[np.array, np.array]:
+    # the indices in id_map of an array of ids, and whether each id was found (if not, its index is arbitrary)
+    keys = np.fromiter(id_map.keys(), dtype=np.int64, count=len(id_map))
+    vals = np.fromiter(id_map.values(), dtype=np.int64, count=len(id_map))
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    vals = vals[order]
+    if keys.shape[0] == 0:
+        return np.zeros(ids.shape, dtype=np.int64), np.zeros(ids.shape, dtype=bool)
+
+    pos = np.minimum(np.searchsorted(keys, ids), keys.shape[0] - 1)
+    return vals[pos], keys[pos] == ids
+
+
+def map_ids(ids: np.array, id_map: Dict[int, int], kind: str) -> np.array:
+    # maps an array of ids to their indices in id_map, raising a PopulationError listing the unknown ids
+    idxs, found = lookup_ids(ids, id_map)
+    validate.check(validate.unknown_ids_problems(ids, found, kind))
+    return idxs
+
+
+def _first_appearance_ranks(vals: np.array) -> Tuple[np.array, np.array]:
+    # unique values ordered by their first appearance, and the rank of each element's value in that order
+    uniq, first_idxs, inverse = np.unique(vals, return_index=True, return_inverse=True)
+    order = np.argsort(first_idxs, kind="stable")
+    ranks = np.empty(order.shape[0], dtype=np.int64)
+    ranks[order] = np.arange(order.shape[0])
+    return uniq[order], ranks[inverse.ravel()]
 
 
-def _parse_schedules(fname: str | os.PathLike) -> Dict[int, List[ScheduleRow]]:
-    schedule_data = {}
-    with open(fname) as fin:
-        reader = csv.reader(fin)
-        next(reader)
-        for row in reader:
-            srow = ScheduleRow(int(row[0]), int(row[1]), 0, SCHEDULE_PLACE_TYPE_MAP[row[2]], float(row[3]))
-            _validate_row(srow)
-            if srow.id in schedule_data:
-                schedule_data[srow.id].append(srow)
-            else:
-                schedule_data[srow.id] = [srow]
-
-    for sid, rows in schedule_data.items():
-        rows.sort(key=lambda x: x.start)
-
-        if rows[0].start != 0:
-            raise ValueError(f"Schedule {sid} does not start time 0")
-        for i, row in enumerate(rows[:-1]):
-            row.end = rows[i + 1].start
-        rows[-1].end = 1440
-
-    return schedule_data
+def create_schedules(fname: str | os.PathLike) -> Tuple[Dict[int, int], np.array]:
+    # schedule_id, start, place_type, risk
+    data = np.loadtxt(fname, delimiter=",", skiprows=1, usecols=(0, 1, 2, 3), dtype=str, ndmin=2)
+    ids = data[:, 0].astype(np.int64)
+    starts = data[:, 1].astype(np.int64)
+    risks = data[:, 3].astype(np.float64).astype(np.float32)
+
+    type_names, type_codes = np.unique(np.char.strip(data[:, 2]), return_inverse=True)
+    validate.check(validate.schedule_problems(ids, starts, type_names[type_codes], list(SCHEDULE_PLACE_TYPE_MAP)))
+    place_types = np.array([SCHEDULE_PLACE_TYPE_MAP[name] for name in type_names], dtype=np.int32)[type_codes]
+
+    # schedules are indexed in order of first appearance, rows sorted by start within a schedule
+    sched_ids, groups = _first_appearance_ranks(ids)
+    n_scheds = sched_ids.shape[0]
+    order = np.lexsort((starts, groups))
+    keys = groups[order] * (MIDNIGHT + 1) + starts[order]
+
+    # each tick gets the last row starting at or before it
+    tick_starts = np.arange(TICKS_PER_DAY) * TICK_DURATION
+    rows = np.searchsorted(keys, (np.arange(n_scheds)[:, None] * (MIDNIGHT + 1) + tick_starts).ravel(),
+                           side="right") - 1
+    sched_places = place_types[order][rows].reshape(n_scheds, TICKS_PER_DAY)
+    sched_risks = risks[order][rows].reshape(n_scheds, TICKS_PER_DAY)
+
+    # identical expanded schedules (place types and risks) share a single index
+    keyed = np.hstack([sched_places, sched_risks.view(np.int32)])
+    _, unique_first, unique_inverse = np.unique(keyed, axis=0, return_index=True, return_inverse=True)
+    unique_order = np.argsort(unique_first)
+    unique_idxs = np.empty(unique_order.shape[0], dtype=np.int64)
+    unique_idxs[unique_order] = np.arange(unique_order.shape[0])
+    keep = unique_first[unique_order]
+
+    id_map = dict(zip(sched_ids.tolist(), unique_idxs[unique_inverse.ravel()].tolist()))
+    return id_map, sched_places[keep].ravel(), sched_risks[keep].ravel()
 
 
-def create_schedules(fname: str | os.PathLike) -> Tuple[Dict[int, int], np.array]:
-    schedule_data = _parse_schedules(fname)
-    schedules = []
-    risks = []
-    id_map = {}
-    i = 0
-    for sid, rows in schedule_data.items():
-        id_map[sid] = i
-        i += 1
-        sched_places, risk = _schedule_rows_to_array(rows)
-        schedules.append(sched_places)
-        risks.append(risk)
-
-    schedule_array = np.concatenate(schedules, axis=0)
-    risks_array = np.concatenate(risks, axis=0)
-    return id_map, schedule_array, risks_array
+@dataclass
+class ScheduleSegments:
+    # Run length encoding of the expanded schedules. The segments of schedule s start at
+    # ticks of day starts[offsets[s]:offsets[s + 1]] with place types (person place column idxs)
+    # place_types[offsets[s]:offsets[s + 1]].
+    offsets: np.array
+    starts: np.array
+    place_types: np.array
+    # schedules whose place type at tick of day t differs from that at t - 1 (wrapping
+    # at midnight) are change_schedules[change_offsets[t]:change_offsets[t + 1]]
+    change_offsets: np.array
+    change_schedules: np.array
+
+    def changes_at(self, tick: int) -> np.array:
+        tod = int(tick) % TICKS_PER_DAY
+        return self.change_schedules[self.change_offsets[tod]:self.change_offsets[tod + 1]]
+
+
+def create_schedule_segments(schedule_data: np.array) -> ScheduleSegments:
+    sched_cols = schedule_data.reshape(-1, TICKS_PER_DAY)
+    n_schedules = sched_cols.shape[0]
+
+    # a segment starts at tick 0 and wherever the place type changes
+    starts_mask = np.ones(sched_cols.shape, dtype=bool)
+    starts_mask[:, 1:] = sched_cols[:, 1:] != sched_cols[:, :-1]
+    sched_idxs, starts = np.nonzero(starts_mask)
+    offsets = np.zeros(n_schedules + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sched_idxs, minlength=n_schedules), out=offsets[1:])
+
+    # the same, but tick 0 is a change only if it differs from the last tick of the day
+    changes_mask = starts_mask.T.copy()
+    changes_mask[0] = sched_cols[:, 0] != sched_cols[:, -1]
+    tods, change_schedules = np.nonzero(changes_mask)
+    change_offsets = np.zeros(TICKS_PER_DAY + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tods, minlength=TICKS_PER_DAY), out=change_offsets[1:])
+
+    return ScheduleSegments(offsets, starts.astype(np.int32), sched_cols[sched_idxs, starts],
+                            change_offsets, change_schedules.astype(np.int64))
+
+
+def csr_move(offsets: np.array, members: np.array, person_idxs: np.array, old_groups: np.array,
+             new_groups: np.array) -> np.array:
+    # Moves persons between the groups of a CSR index whose members are sorted within each group,
+    # updating offsets in place and returning the new members array. Cost is proportional
+    # to the number of persons moved plus a copy of the members.
+    n_groups = offsets.shape[0] - 1
+    person_idxs = person_idxs.astype(members.dtype)
+
+    # remove from the old groups
+    pos = [offsets[g] + np.searchsorted(members[offsets[g]:offsets[g + 1]], p)
+           for p, g in zip(person_idxs, old_groups)]
+    members = np.delete(members, pos)
+    counts = np.diff(offsets) - np.bincount(old_groups, minlength=n_groups)
+    del_offsets = np.zeros_like(offsets)
+    np.cumsum(counts, out=del_offsets[1:])
+
+    # insert into the new groups, keeping them sorted
+    order = np.lexsort((person_idxs, new_groups))
+    person_idxs, new_groups = person_idxs[order], new_groups[order]
+    pos = [del_offsets[g] + np.searchsorted(members[del_offsets[g]:del_offsets[g + 1]], p)
+           for p, g in zip(person_idxs, new_groups)]
+    members = np.insert(members, pos, person_idxs)
+    counts += np.bincount(new_groups, minlength=n_groups)
+    np.cumsum(counts, out=offsets[1:])
+    return members
+
+
+class PersonSet:
+    # Unordered, compact array of person indices (e.g. the currently infectious persons), with
+    # each person's position in that array for constant time membership tests. Adding and
+    # removing costs the number of persons added or removed, plus the set size on removal.
+
+    def __init__(self, n_persons: int):
+        self._members = np.zeros(64, dtype=np.int64)
+        self._size = 0
+        self.positions = np.full(n_persons, -1, dtype=np.int64 if n_persons > np.iinfo(np.int32).max else np.int32)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def idxs(self) -> np.array:
+        return self._members[:self._size]
+
+    def contains(self, person_idxs: np.array) -> np.array:
+        return self.positions[person_idxs] >= 0
+
+    def add(self, person_idxs: np.array):
+        person_idxs = np.unique(person_idxs[self.positions[person_idxs] < 0])
+        new_size = self._size + person_idxs.shape[0]
+        if new_size > self._members.shape[0]:
+            members = np.zeros(max(new_size, 2 * self._members.shape[0]), dtype=np.int64)
+            members[:self._size] = self.idxs
+            self._members = members
+        self._members[self._size:new_size] = person_idxs
+        self.positions[person_idxs] = np.arange(self._size, new_size)
+        self._size = new_size
+
+    def remove(self, person_idxs: np.array):
+        person_idxs = person_idxs[self.positions[person_idxs] >= 0]
+        if person_idxs.shape[0] == 0:
+            return
+        keep = np.ones(self._size, dtype=bool)
+        keep[self.positions[person_idxs]] = False
+        self.positions[person_idxs] = -1
+        remaining = self.idxs[keep]
+        self._size = remaining.shape[0]
+        self._members[:self._size] = remaining
+        self.positions[remaining] = np.arange(self._size)
+
+    def reset(self, person_idxs: np.array):
+        self.positions[self.idxs] = -1
+        self._size = 0
+        self.add(person_idxs)
+
+
+def resident_places(schedule_data: np.array, person_data: np.array, person_idxs: np.array = None) -> np.array:
+    # place row index of each person (all if person_idxs is None) at each tick of the day,
+    # shape is (n persons, TICKS_PER_DAY)
+    if person_idxs is None:
+        person_idxs = np.arange(person_data.shape[0])
+    place_cols = schedule_data.reshape(-1, TICKS_PER_DAY)[person_data[person_idxs, P_SCHEDULE_IDX]]
+    return np.take_along_axis(person_data[person_idxs], place_cols, axis=1)
 
 
 class Places:
 
-    def __init__(self, place_id_map: Dict[int, int], place_data: np.array):
+    def __init__(self, place_id_map: Dict[int, int], place_data: np.array, type_names: np.array = None,
+                 type_codes: np.array = None):
         self.place_data = place_data
         self.place_id_map = place_id_map
+        # each place's type (the places file type column) is type_names[type_codes[place row idx]],
+        # None if the places have no types
+        self.type_names = type_names
+        self.type_codes = type_codes
+        # CSR index of the persons in each place, one per distinct slot of the day, where ticks of the
+        # day at which all the schedules have the same place types share a slot: the persons in place p
+        # at tick of day t are occupancy_members[s, occupancy_offsets[s, p]:occupancy_offsets[s, p + 1]],
+        # where s is occupancy_slots[t]. Built on request (occupancy_index param) for get_occupants
+        # queries; of the model itself, only full placements use it, for their place counts.
+        self.occupancy_slots = None
+        self.occupancy_offsets = None
+        self.occupancy_members = None
+
+    def _build_occupancy_slot(self, slot: int, place_idxs: np.array):
+        n_places = self.place_data.shape[0]
+        np.cumsum(np.bincount(place_idxs, minlength=n_places), out=self.occupancy_offsets[slot, 1:])
+        # stable, so the persons in each place are in ascending order
+        self.occupancy_members[slot] = np.argsort(place_idxs, kind="stable")
+
+    def build_occupancy_index(self, schedule_data: np.array, person_data: np.array):
+        n_persons = person_data.shape[0]
+        sched_cols = schedule_data.reshape(-1, TICKS_PER_DAY)
+        # ticks of the day with the same place type column for every schedule share a slot
+        _, slot_tods, self.occupancy_slots = np.unique(sched_cols.T, axis=0, return_index=True,
+                                                       return_inverse=True)
+        self.occupancy_slots = self.occupancy_slots.ravel()
+        # first tick of the day of each slot
+        self._slot_tods = slot_tods
+        n_slots = slot_tods.shape[0]
+        self.occupancy_offsets = np.zeros((n_slots, self.place_data.shape[0] + 1), dtype=np.int64)
+        self.occupancy_members = np.zeros((n_slots, n_persons), dtype=np.uint32)
+
+        person_scheds = person_data[:, P_SCHEDULE_IDX]
+        row_idxs = np.arange(n_persons)
+        for slot, tod in enumerate(slot_tods):
+            self._build_occupancy_slot(slot, person_data[row_idxs, sched_cols[person_scheds, tod]])
+
+    def schedules_added(self, schedule_data: np.array, person_data: np.array):
+        # Added schedules can only split slots, by changing place type at ticks where the existing
+        # schedules don't, in which case the index is rebuilt (before any persons are reassigned
+        # to the added schedules)
+        n_slots = np.unique(schedule_data.reshape(-1, TICKS_PER_DAY).T, axis=0).shape[0]
+        if n_slots != self.occupancy_offsets.shape[0]:
+            self.build_occupancy_index(schedule_data, person_data)
+
+    def update_occupancy_index(self, person_idxs: np.array, old_places: np.array, new_places: np.array):
+        # Patches the occupancy index for persons whose place assignments have changed.
+        # old_places and new_places are the (n persons, TICKS_PER_DAY) place row indices
+        # of those persons before and after the change (see resident_places). Each slot is
+        # patched once, from its first tick of the day.
+        old_places, new_places = old_places[:, self._slot_tods], new_places[:, self._slot_tods]
+        for slot in np.nonzero(np.any(old_places != new_places, axis=0))[0]:
+            changed = old_places[:, slot] != new_places[:, slot]
+            self.occupancy_members[slot] = csr_move(self.occupancy_offsets[slot], self.occupancy_members[slot],
+                                                    person_idxs[changed], old_places[changed, slot],
+                                                    new_places[changed, slot])
+
+    def get_occupants(self, place_idx: int, tick: int) -> np.array:
+        slot = self.occupancy_slots[int(tick) % TICKS_PER_DAY]
+        return self.occupancy_members[slot, self.occupancy_offsets[slot, place_idx]:
+                                      self.occupancy_offsets[slot, place_idx + 1]]
+
+    def get_occupancy(self, tick: int) -> np.array:
+        # number of persons in each place at tick according to the occupancy index
+        return np.diff(self.occupancy_offsets[self.occupancy_slots[int(tick) % TICKS_PER_DAY]])
 
     def update_counts(self, places: np.array, counts: np.array):
         self.place_data[:, PL_PERSON_COUNT_IDX:] = 0
@@ -136,6 +361,21 @@ class Places:
         self.place_data[:, PL_INFECTED_COUNT_IDX:] = 0
         self.place_data[places, PL_INFECTED_COUNT_IDX] = counts
 
+    def move_persons(self, old_places: np.array, new_places: np.array):
+        # updates the person counts for persons moving from old_places to new_places
+        counts = self.place_data[:, PL_PERSON_COUNT_IDX]
+        if old_places.shape[0] > counts.shape[0]:
+            # many movers, cheaper to count them up
+            n_places = counts.shape[0]
+            delta = np.bincount(new_places, minlength=n_places) - np.bincount(old_places, minlength=n_places)
+            counts[:] = counts + delta
+        else:
+            np.subtract.at(counts, old_places, 1)
+            np.add.at(counts, new_places, 1)
+
+    def set_infected_counts(self, counts: np.array):
+        self.place_data[:, PL_INFECTED_COUNT_IDX] = counts
+
     def get_counts(self, place_idxs: np.array):
         return self.place_data[np.ix_(place_idxs, (PL_PERSON_COUNT_IDX, PL_INFECTED_COUNT_IDX))]
 
@@ -143,25 +383,24 @@ class Places:
         return self.place_data[:, (PL_PERSON_COUNT_IDX, PL_INFECTED_COUNT_IDX)]
 
 
-def create_places(fname: Union[str, os.PathLike]) -> Tuple[Dict[int, int], np.array]:
-    n_places = 0
-    with open(fname) as fin:
-        next(fin)
-        for _ in fin:
-            n_places += 1
+def create_places(fname: Union[str, os.PathLike], n_workers: int = 1) -> Tuple[Dict[int, int], np.array]:
+    place_ids = read_csv_columns(fname, [0], n_workers=n_workers)[:, 0]
+    validate.check(validate.duplicate_id_problems(place_ids, "place"))
 
     # place_id, n_persons, n_infecteds
-    place_data = np.zeros((n_places, 3), dtype=np.uint32)
-    places_id_map = {}
+    place_data = np.zeros((place_ids.shape[0], 3), dtype=np.uint32)
+    place_data[:, 0] = place_ids
+    places_id_map = dict(zip(place_ids.tolist(), range(place_ids.shape[0])))
+
+    type_names = type_codes = None
     with open(fname) as fin:
-        reader = csv.reader(fin)
-        next(reader)
-        for i, row in enumerate(reader):
-            n_id = int(row[0])
-            places_id_map[n_id] = i
-            place_data[i, 0] = n_id
+        header = [h.strip() for h in next(csv.reader(fin))]
+    if "type" in header:
+        types = np.loadtxt(fname, delimiter=",", skiprows=1, usecols=header.index("type"), dtype=str, ndmin=1)
+        type_names, type_codes = np.unique(np.char.strip(types), return_inverse=True)
+        type_codes = type_codes.astype(np.int32)
 
-    return Places(places_id_map, place_data)
+    return Places(places_id_map, place_data, type_names, type_codes)
 
 
 def _parse_resident_place_entry(entry: str):
@@ -170,33 +409,123 @@ def _parse_resident_place_entry(entry: str):
     return [int(v) for v in vals]
 
 
-def create_residents(name: Union[str, os.PathLike], place_id_map: Dict[int, int],
-                     schedule_id_map: Dict[int, int]) -> np.array:
-    n_persons = 0
-    with open(name) as fin:
-        next(fin)
-        for _ in fin:
-            n_persons += 1
-
-    resident_data = np.zeros((n_persons, N_P_ELEMENTS), dtype=np.uint32)
+def read_resident_columns(fname: Union[str, os.PathLike], names: List[str]) -> Dict[str, np.array]:
+    # reads the named (integer) columns from the residents file
+    with open(fname) as fin:
+        header = [h.strip() for h in next(csv.reader(fin))]
+    missing = [name for name in names if name not in header]
+    if len(missing) > 0:
+        raise ValueError(f"Residents file {fname} is missing columns {missing}")
+    data = np.loadtxt(fname, delimiter=",", skiprows=1, usecols=[header.index(name) for name in names],
+                      dtype=np.int64, ndmin=2)
+    return {name: data[:, i] for i, name in enumerate(names)}
+
+
+RESIDENT_FILE_COLUMNS = [P_DATA_ID_IDX, P_DATA_SCHEDULE_IDX, P_DATA_CELL_IDX, P_DATA_CAF_IDX, P_DATA_MACT_IDX,
+                         P_DATA_NACT_IDX, P_DATA_EACT_IDX]
+# names of the place columns P_DATA_CELL_IDX to P_DATA_EACT_IDX
+RESIDENT_PLACE_COLUMNS = ["cell", "cafeteria", "morning_act", "noon_act", "evening_act"]
+
+
+def _residents_from_columns(data: np.array, place_id_map: Dict[int, int], schedule_id_map: Dict[int, int],
+                            out: np.array = None, check_duplicates: bool = True) -> np.array:
+    # check_duplicates: whether to check the person ids for duplicates, False if the caller checks
+    # them across several blocks of rows
+    schedule_idxs, found = lookup_ids(data[:, P_DATA_SCHEDULE_IDX], schedule_id_map)
+    problems = validate.duplicate_id_problems(data[:, P_DATA_ID_IDX], "person") if check_duplicates else []
+    problems += validate.unknown_ids_problems(data[:, P_DATA_SCHEDULE_IDX], found, "schedule")
+    places, found = lookup_ids(data[:, P_DATA_CELL_IDX:], place_id_map)
+    for i, name in enumerate(RESIDENT_PLACE_COLUMNS):
+        problems += validate.unknown_ids_problems(data[:, P_DATA_CELL_IDX + i], found[:, i], "place", f" in {name}")
+    validate.check(problems)
+
+    resident_data = np.zeros((data.shape[0], N_P_ELEMENTS), dtype=np.uint32) if out is None else out
+    resident_data[:, P_ID_IDX] = data[:, P_DATA_ID_IDX]
+    resident_data[:, P_SCHEDULE_IDX] = schedule_idxs
+    # current place starts as the cell
+    resident_data[:, P_CURRENT_PLACE_IDX] = places[:, 0]
+    resident_data[:, P_CELL_IDX:P_EACT_IDX + 1] = places
     resident_data[:, P_STATE_IDX] = SUSCEPTIBLE
     resident_data[:, P_NEXT_STATE_T_IDX] = np.iinfo(np.uint32).max
-    with open(name) as fin:
-        reader = csv.reader(fin)
-        next(reader)
-        for i, row in enumerate(reader):
-            pid = int(row[P_DATA_ID_IDX])
-            sched_id = schedule_id_map[int(row[P_DATA_SCHEDULE_IDX])]
-            cell_id = place_id_map[int(row[P_DATA_CELL_IDX])]
-            caf_id = place_id_map[int(row[P_DATA_CAF_IDX])]
-            mact_id = place_id_map[int(row[P_DATA_MACT_IDX])]
-            nact_id = place_id_map[int(row[P_DATA_NACT_IDX])]
-            eact_id = place_id_map[int(row[P_DATA_EACT_IDX])]
-            resident_data[i, : -2] = pid, sched_id, cell_id, cell_id, caf_id, mact_id, nact_id, eact_id
-
-            # act_ids = [place_id_map[i] for i in _parse_resident_place_entry(row[P_DATA_ACTS_IDX])]
-            # caf_ids = [place_id_map[i] for i in _parse_resident_place_entry(row[P_DATA_CAFS_IDX])]
-            # outdoor_id = place_id_map[int(row[P_DATA_OUT_IDX])]
-            # set current place to cell id
-
     return resident_data
+
+
+def create_residents(name: Union[str, os.PathLike], place_id_map: Dict[int, int],
+                     schedule_id_map: Dict[int, int], n_workers: int = 1) -> np.array:
+    data = read_csv_columns(name, RESIDENT_FILE_COLUMNS, n_workers=n_workers)
+    return _residents_from_columns(data, place_id_map, schedule_id_map)
+
+
+def create_person_store(fname: Union[str, os.PathLike], residents_file: Union[str, os.PathLike],
+                        place_id_map: Dict[int, int], schedule_id_map: Dict[int, int],
+                        chunk_rows: int = 1 << 20) -> np.array:
+    # Writes the residents to a column major .npy file, chunk_rows at a time so the
+    # population never has to fit in memory, and returns it opened with open_person_store.
+    # The store is written to a temporary file that replaces fname only once all the rows
+    # have been written and checked, so a failed write never leaves a store behind.
+    with open(residents_file) as fin:
+        next(fin)
+        n_persons = sum(1 for _ in fin)
+
+    fd, tmp_fname = tempfile.mkstemp(suffix=".npy", dir=os.path.dirname(os.path.abspath(fname)))
+    os.close(fd)
+    try:
+        store = np.lib.format.open_memmap(tmp_fname, mode="w+", dtype=np.uint32, shape=(n_persons, N_P_ELEMENTS),
+                                          fortran_order=True)
+        # the ids of all the chunks, so duplicates in different chunks are found
+        ids = np.zeros(n_persons, dtype=np.int64)
+        with open(residents_file) as fin:
+            next(fin)
+            for start in range(0, n_persons, chunk_rows):
+                end = min(start + chunk_rows, n_persons)
+                data = np.loadtxt(itertools.islice(fin, end - start), delimiter=",", usecols=RESIDENT_FILE_COLUMNS,
+                                  dtype=np.int64, ndmin=2)
+                _residents_from_columns(data, place_id_map, schedule_id_map, store[start:end], False)
+                ids[start:end] = data[:, P_DATA_ID_IDX]
+        validate.check(validate.duplicate_id_problems(ids, "person"))
+        store.flush()
+        del store
+        os.replace(tmp_fname, fname)
+    finally:
+        if os.path.exists(tmp_fname):
+            os.remove(tmp_fname)
+
+    return open_person_store(fname)
+
+
+def _store_sources(files: List[Union[str, os.PathLike]]) -> List[Dict]:
+    return [{"file": os.path.abspath(f), "size": os.path.getsize(f), "mtime_ns": os.stat(f).st_mtime_ns}
+            for f in files]
+
+
+def load_person_store(fname: Union[str, os.PathLike], residents_file: Union[str, os.PathLike],
+                      schedule_file: Union[str, os.PathLike], places_file: Union[str, os.PathLike],
+                      place_id_map: Dict[int, int], schedule_id_map: Dict[int, int]) -> np.array:
+    # Opens the person store if it was created from the current residents, schedules and places
+    # files, whose sizes and modification times are recorded in a .sources.json sidecar, as
+    # the store holds schedule and place row idxs from all three, and otherwise (re)creates it.
+    sidecar = f"{fname}.sources.json"
+    sources = _store_sources([residents_file, schedule_file, places_file])
+    if os.path.exists(fname) and os.path.exists(sidecar):
+        with open(sidecar) as fin:
+            if json.load(fin) == sources:
+                return open_person_store(fname)
+        os.remove(sidecar)
+
+    store = create_person_store(fname, residents_file, place_id_map, schedule_id_map)
+    fd, tmp_fname = tempfile.mkstemp(suffix=".json", dir=os.path.dirname(os.path.abspath(fname)))
+    with os.fdopen(fd, "w") as fout:
+        json.dump(sources, fout)
+    os.replace(tmp_fname, sidecar)
+    return store
+
+
+def open_person_store(fname: Union[str, os.PathLike]) -> np.array:
+    # Copy on write memory map of a person store. Each column is contiguous, so the static columns
+    # (schedule and places) are paged in from the file as needed and can be evicted again,
+    # while the pages of the columns that are written (current place, state and next transition)
+    # become private copies held in memory. The file itself is never modified.
+    store = np.load(fname, mmap_mode="c")
+    if store.ndim != 2 or store.shape[1] != N_P_ELEMENTS or not store.flags.f_contiguous:
+        raise ValueError(f"{fname} is not a person store")
+    return store
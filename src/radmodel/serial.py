@@ -0,0 +1,145 @@
+import heapq
+import itertools
+import os
+from dataclasses import fields
+from typing import Callable, List
+
+import numpy as np
+
+from .common import find_free_filename
+
+# Single process replacements for the parts of repast4py the model uses (the schedule runner,
+# reducing loggers and data set), so a serial run never imports mpi4py or initialises MPI.
+
+
+class SerialComm:
+    # Stands in for a single rank MPI communicator
+
+    def Get_rank(self) -> int:
+        return 0
+
+    def Get_size(self) -> int:
+        return 1
+
+    def Reduce(self, sendbuf: np.array, recvbuf: np.array, op=None, root: int = 0):
+        recvbuf[...] = sendbuf
+
+    def allreduce(self, sendobj, op=None):
+        return sendobj
+
+    def bcast(self, obj, root: int = 0):
+        return obj
+
+    def Barrier(self):
+        pass
+
+
+class SerialScheduleRunner:
+    # Same scheduling interface as repast4py's SharedScheduleRunner. Events scheduled
+    # for the same tick execute in the order they were scheduled, and events scheduled
+    # before the current tick are ignored.
+
+    def __init__(self):
+        self.queue = []
+        self.counter = itertools.count()
+        self.end_evts = []
+        self.go = True
+        self._tick = -1e-39
+
+    def _push(self, at: float, evt: Callable, interval: float = None):
+        if at >= self._tick:
+            heapq.heappush(self.queue, (at, next(self.counter), evt, interval))
+
+    def schedule_event(self, at: float, evt: Callable):
+        self._push(at, evt)
+
+    def schedule_repeating_event(self, at: float, interval: float, evt: Callable):
+        self._push(at, evt, interval)
+
+    def schedule_end_event(self, evt: Callable):
+        self.end_evts.append(evt)
+
+    def schedule_stop(self, at: float):
+        self._push(at, self.stop)
+
+    def stop(self):
+        # the events for the current tick still execute
+        self.go = False
+
+    def tick(self) -> float:
+        return self._tick
+
+    def execute(self):
+        while self.go and len(self.queue) > 0:
+            self._tick = self.queue[0][0]
+            while len(self.queue) > 0 and self.queue[0][0] == self._tick:
+                at, _, evt, interval = heapq.heappop(self.queue)
+                evt()
+                if interval is not None:
+                    self._push(at + interval, evt, interval)
+
+        for evt in self.end_evts:
+            evt()
+
+
+class SerialDataLogger:
+    # Logs a dataclass field, with the same interface as repast4py's ReducingDataLogger
+
+    def __init__(self, data_class, field_name: str, dtype: np.dtype):
+        self.data_class = data_class
+        self.name = field_name
+        self.dtype = dtype
+        self._data = []
+
+    @property
+    def size(self) -> int:
+        return len(self._data)
+
+    def log(self):
+        self._data.append(getattr(self.data_class, self.name))
+
+    def reduce(self, comm=None) -> np.array:
+        vals = np.array(self._data, dtype=self.dtype)
+        self._data.clear()
+        return vals
+
+
+def create_loggers(data_class) -> List[SerialDataLogger]:
+    return [SerialDataLogger(data_class, f.name, np.dtype(f.type)) for f in fields(data_class)]
+
+
+class SerialDataSet:
+    # Writes the logged values in the same csv format as repast4py's ReducingDataSet
+
+    def __init__(self, data_loggers: List[SerialDataLogger], fpath: str, delimiter: str = ",",
+                 buffer_size: int = 1000):
+        self._data_loggers = data_loggers
+        self._delimiter = delimiter
+        self._buffer_size = buffer_size
+        self.ticks = []
+        self.fpath = find_free_filename(fpath)
+        parent = os.path.dirname(fpath)
+        if parent != "":
+            os.makedirs(parent, exist_ok=True)
+
+        with open(self.fpath, "w", newline="") as f_out:
+            f_out.write(self._delimiter.join(["tick"] + [dl.name for dl in data_loggers]))
+            f_out.write("\n")
+
+    def log(self, tick: float):
+        self.ticks.append(tick)
+        for logger in self._data_loggers:
+            logger.log()
+        if self._data_loggers[0].size >= self._buffer_size:
+            self.write()
+
+    def write(self):
+        cols = [self.ticks] + [dl.reduce() for dl in self._data_loggers]
+        with open(self.fpath, "a", newline="") as f_out:
+            for row in zip(*cols):
+                f_out.write(self._delimiter.join(str(v) for v in row))
+                f_out.write("\n")
+        self.ticks.clear()
+
+    def close(self):
+        self.write()
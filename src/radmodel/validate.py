@@ -0,0 +1,107 @@
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from .common import MIDNIGHT
+
+# Checks of the loaded population arrays. Each check returns a list of problems, each summarising
+# all the rows with that problem, so a file's problems are reported together rather than one
+# at a time. The checks are vectorised and cheap enough to always run at load time.
+
+# default place types (the places file type column) allowed in resident place columns,
+# columns not listed can be any type
+DEFAULT_PLACE_TYPE_COLUMNS = {"cell": ["cell"], "cafeteria": ["cafeteria"]}
+
+
+class PopulationError(ValueError):
+
+    def __init__(self, problems: List[str]):
+        self.problems = problems
+        super().__init__(f"{len(problems)} population problem{'s' if len(problems) > 1 else ''}:\n"
+                         + "\n".join(f"  {problem}" for problem in problems))
+
+
+def check(problems: List[str]):
+    if len(problems) > 0:
+        raise PopulationError(problems)
+
+
+def _examples(vals: np.array, n: int = 10) -> List:
+    return vals[:n].tolist()
+
+
+def unknown_ids_problems(ids: np.array, found: np.array, kind: str, where: str = "") -> List[str]:
+    # found: whether each of ids is known
+    if np.all(found):
+        return []
+    unknown = np.unique(ids[~found])
+    return [f"{np.count_nonzero(~found)} {kind} ids{where} are unknown ({unknown.shape[0]} distinct), "
+            f"e.g. {_examples(unknown)}"]
+
+
+def schedule_problems(ids: np.array, starts: np.array, place_types: np.array,
+                      known_types: Sequence[str]) -> List[str]:
+    # schedule file rows, in file order: schedule ids, start minutes and place type names
+    problems = []
+    unknown = ~np.isin(place_types, list(known_types))
+    if np.any(unknown):
+        problems.append(f"{np.count_nonzero(unknown)} schedule rows have unknown place types "
+                        f"{np.unique(place_types[unknown]).tolist()}, expected one of {list(known_types)}")
+
+    bad = (starts < 0) | (starts > MIDNIGHT)
+    if np.any(bad):
+        problems.append(f"{np.count_nonzero(bad)} schedule rows have starts outside 0 - {MIDNIGHT}, "
+                        f"e.g. schedule {ids[bad][0]} start {starts[bad][0]}")
+
+    if ids.shape[0] == 0:
+        return problems
+
+    # each schedule's rows in file order
+    order = np.argsort(ids, kind="stable")
+    ids, starts = ids[order], starts[order]
+    same = ids[1:] == ids[:-1]
+    unsorted = np.unique(ids[1:][same & (starts[1:] < starts[:-1])])
+    if unsorted.shape[0] > 0:
+        problems.append(f"{unsorted.shape[0]} schedules have starts out of order, e.g. {_examples(unsorted)}")
+    overlapping = np.unique(ids[1:][same & (starts[1:] == starts[:-1])])
+    if overlapping.shape[0] > 0:
+        problems.append(f"{overlapping.shape[0]} schedules have more than one row with the same start, "
+                        f"e.g. {_examples(overlapping)}")
+
+    # a row lasts until the next row's start, and the last until midnight, so a schedule
+    # covers the day if it starts at 0
+    firsts = np.nonzero(np.concatenate([[True], ~same]))[0]
+    uncovered = ids[firsts][np.minimum.reduceat(starts, firsts) != 0]
+    if uncovered.shape[0] > 0:
+        problems.append(f"{uncovered.shape[0]} schedules don't start at time 0, e.g. {_examples(uncovered)}")
+    return problems
+
+
+def duplicate_id_problems(ids: np.array, kind: str) -> List[str]:
+    if ids.shape[0] < 2 or np.all(ids[1:] > ids[:-1]):
+        # ids are usually sorted, so the sort is skipped
+        return []
+    sorted_ids = np.sort(ids)
+    dups = np.unique(sorted_ids[1:][sorted_ids[1:] == sorted_ids[:-1]])
+    if dups.shape[0] == 0:
+        return []
+    return [f"{dups.shape[0]} {kind} ids appear more than once, e.g. {_examples(dups)}"]
+
+
+def place_type_problems(place_columns: Dict[str, np.array], type_codes: np.array, type_names: np.array,
+                        column_types: Dict[str, List[str]] = None) -> List[str]:
+    # place_columns: resident place column name -> place row idxs, type_codes: code of each place's type
+    # in type_names, column_types: allowed types of each column's places
+    column_types = DEFAULT_PLACE_TYPE_COLUMNS if column_types is None else column_types
+    problems = []
+    for column, allowed in column_types.items():
+        if column not in place_columns:
+            continue
+        # whether each place is of an allowed type, so there is a single gather per resident
+        bad_places = ~np.isin(type_names, allowed)[type_codes]
+        bad = bad_places[place_columns[column]]
+        if np.any(bad):
+            found = type_names[np.unique(type_codes[place_columns[column][bad]])].tolist()
+            problems.append(f"{np.count_nonzero(bad)} residents' {column} places are of type {found} "
+                            f"rather than {allowed}, e.g. resident row {np.nonzero(bad)[0][0]}")
+    return problems
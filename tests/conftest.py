@@ -0,0 +1,20 @@
+import os
+
+import pytest
+import yaml
+
+
+@pytest.fixture
+def params(tmp_path):
+    # the test params on the ng_* population, logging the counts in memory and not the places,
+    # tests override only what they exercise
+    with open("./test_data/params.yaml") as fin:
+        params = yaml.safe_load(fin)
+    params["schedule_file"] = "./test_data/ng_schedules.csv"
+    params["places_file"] = "./test_data/ng_places.csv"
+    params["residents_file"] = "./test_data/ng_residents.csv"
+    params["counts_log_file"] = os.path.join(tmp_path, "counts.csv")
+    params["places_log_file"] = os.path.join(tmp_path, "counts_by_place.csv")
+    params["counts_log_format"] = "memory"
+    params["places_log_format"] = "none"
+    return params
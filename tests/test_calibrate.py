@@ -0,0 +1,59 @@
+import numpy as np
+import tempfile
+import os
+
+from radmodel import calibrate, core
+
+
+def _target(params, stoe):
+    model = core.create_model(dict(params, stoe=stoe))
+    model.run()
+    series = model.data_set.series()
+    days = series["tick"] % 96 == 0
+    return {"tick": series["tick"][days], "exposed": series["exposed"][days],
+            "recovered": series["recovered"][days]}
+
+
+def test_running_distance():
+    target = {"tick": np.array([96, 192]), "exposed": np.array([10, 20])}
+    distance = calibrate.RunningDistance(target)
+    series = {"tick": np.arange(100), "exposed": np.full(100, 13)}
+    assert 3 == distance.update(series)
+    series = {"tick": np.arange(200), "exposed": np.full(200, 13)}
+    assert np.isclose(np.sqrt(9 + 49), distance.update(series))
+    assert 2 == distance.n_evaluated
+
+
+def test_simulate_early_rejection(params):
+    params["init_exposed"] = 50
+    params["stop.at"] = 960
+    target = _target(params, 0.5)
+    pop = core.load_population(params)
+    full = calibrate.simulate(dict(params, stoe=0.01), target, pop=pop)
+    assert not full.rejected
+    assert 960 == full.tick
+
+    stopped = calibrate.simulate(dict(params, stoe=0.01), target, full.distance / 4, pop=pop)
+    assert stopped.rejected
+    assert stopped.tick < 960
+    assert stopped.distance > full.distance / 4
+
+
+def test_smc_abc(params):
+    params["init_exposed"] = 50
+    params["stop.at"] = 960
+    target = _target(params, 0.5)
+    generations = calibrate.smc_abc(params, target, {"stoe": [0.01, 1.0]}, n_particles=6, n_generations=3,
+                                    seed=1)
+    assert 3 == len(generations)
+    assert np.isinf(generations[0].epsilon)
+    assert generations[2].epsilon <= generations[1].epsilon
+    for gen in generations:
+        assert (6, 1) == gen.particles.shape
+        assert np.isclose(1, gen.weights.sum())
+        assert np.all(gen.distances <= gen.epsilon)
+    assert sum(gen.n_early_rejected for gen in generations[1:]) > 0
+
+    fname = os.path.join(tempfile.mkdtemp(), "posterior.csv")
+    calibrate.write_generations(fname, ["stoe"], generations)
+    assert 19 == len(open(fname).readlines())
@@ -0,0 +1,59 @@
+import numpy as np
+from mpi4py import MPI
+import tempfile
+import os
+
+from radmodel import columnar, core, population
+
+
+def test_columnar_round_trip():
+    fname = os.path.join(tempfile.mkdtemp(), "data.rcol")
+    place_ids = np.array([10, 20, 30, 40], dtype=np.int64)
+    writer = columnar.ColumnarWriter(fname, {"tick": (np.int64, columnar.DELTA),
+                                             "place_id": (np.uint32, columnar.DICT),
+                                             "count": (np.uint32, columnar.PLAIN)},
+                                     dictionaries={"place_id": place_ids}, chunk_rows=10)
+    for tick in range(20):
+        writer.append(tick=np.full(4, tick), place_id=np.arange(4), count=np.arange(4) * tick)
+    writer.close()
+
+    reader = columnar.ColumnarReader(fname)
+    assert 80 == reader.n_rows
+    assert len(reader.blocks) > 1
+
+    data = reader.read()
+    assert np.array_equal(data["tick"], np.repeat(np.arange(20), 4))
+    assert np.array_equal(data["place_id"], np.tile(place_ids, 20))
+    assert np.array_equal(data["count"], (np.arange(4)[None, :] * np.arange(20)[:, None]).ravel())
+    # small counts are narrowed on disk
+    assert reader.blocks[0]["columns"]["count"]["dtype"] == np.dtype(np.uint8).str
+
+    data = reader.read(columns=["place_id", "count"], tick_range=(5, 7))
+    assert ["place_id", "count"] == list(data.keys())
+    assert np.array_equal(data["count"], (np.arange(4)[None, :] * np.arange(5, 8)[:, None]).ravel())
+
+
+def test_columnar_model_logs(params, tmp_path):
+    schedule_id_map, schedule_data, _ = population.create_schedules(params["schedule_file"])
+    places = population.create_places(params["places_file"])
+    residents = population.create_residents(params["residents_file"], places.place_id_map, schedule_id_map)
+    params["counts_log_file"] = os.path.join(tmp_path, "counts.rcol")
+    params["places_log_file"] = os.path.join(tmp_path, "counts_by_place.rcol")
+    params["counts_log_format"] = "columnar"
+    params["places_log_format"] = "columnar"
+    params["init_exposed"] = 10
+
+    model = core.Model(MPI.COMM_WORLD, schedule_data, residents, places, params["stoe"],
+                       core.create_trans_matrix(params["transition_matrix"]), core.create_duration_matrix(params),
+                       params["random_seed"], params)
+    model.run()
+
+    counts = columnar.read_columnar(params["counts_log_file"])
+    assert np.array_equal(counts["tick"], np.arange(0, 11))
+    assert np.all(counts["exposed"][0] == 10)
+    assert np.all(counts["susceptible"] + counts["exposed"] + counts["presymp"] == 1200)
+
+    by_place = columnar.read_columnar_frame(params["places_log_file"], tick_range=(3, 3))
+    assert (504, 4) == by_place.shape
+    assert by_place["person_count"].sum() == 1200
+    assert by_place["place_id"].tolist() == list(range(504))
@@ -3,8 +3,10 @@ import yaml
 from mpi4py import MPI
 import tempfile
 import os
+import pytest
 
-from radmodel import population, common, core
+from radmodel import population, common, core, validate
+from radmodel.multipliers import PersonMultipliers
 
 
 def _create_s1_expected():
@@ -153,17 +155,17 @@ def test_transition_matrix():
 
     model = core.Model(MPI.COMM_WORLD, schedule_data, all_residents, places, 0.0, trans_matrix, duration_matrix,
                        params["random_seed"], params)
-    # test cum sum output
-    np_trans_matrix = model.trans_matrix
-    exp = np.array([[0.0, 0.0, 0., 0., 0., 0., 0., 0., ],
+    # the alias tables sample the matrix, with S and D absorbing
+    np_trans_matrix = model.disease.transition_probs()
+    exp = np.array([[1.0, 0.0, 0., 0., 0., 0., 0., 0., ],
                     [0., 0., 0.8, 0., 0.2, 0., 0., 0.],
                     [0., 0., 0., 1., 0., 0., 0., 0.],
                     [0., 0., 0., 0., 0., 0.9, 0.1, 0.],
                     [0., 0., 0., 0., 0., 1., 0., 0., ],
                     [1., 0., 0., 0., 0., 0., 0., 0., ],
                     [0., 0., 0., 0., 0., 0.95, 0., 0.05],
-                    [0., 0., 0., 0., 0., 0., 0., 0.]], dtype=np.float32).cumsum(1)
-    assert np.array_equal(np_trans_matrix, exp)
+                    [0., 0., 0., 0., 0., 0., 0., 1.]])
+    assert np.allclose(np_trans_matrix, exp)
 
 
 def test_duration_matrix():
@@ -582,3 +584,315 @@ def test_disease_state_paths4():
 
     model.update_disease_state(duration_t)
     assert residents[6, population.P_STATE_IDX] == common.DEAD
+
+
+def test_occupancy_index():
+    schedule_data, _, places, residents, params = _init_data()
+    params["occupancy_index"] = True
+    duration_matrix = core.create_duration_matrix(params)
+    trans_matrix = core.create_trans_matrix(params["transition_matrix"])
+    model = core.Model(MPI.COMM_WORLD, schedule_data, residents, places, 0.0, trans_matrix, duration_matrix,
+                       params["random_seed"], params)
+    for i in range(0, 96, 5):
+        model.select_next_place(i)
+        for place_idx in (0, 17, 500, 501, 502, 503):
+            exp = np.nonzero(residents[:, population.P_CURRENT_PLACE_IDX] == place_idx)[0]
+            assert np.array_equal(places.get_occupants(place_idx, i), exp)
+        # the full placement's counts, taken from the index, agree with the persons' places
+        counts = np.bincount(residents[:, population.P_CURRENT_PLACE_IDX], minlength=504)
+        assert np.array_equal(places.get_occupancy(i), counts)
+        assert np.array_equal(places.get_all_counts()[:, 0], counts)
+    # only the distinct slots of the day are stored
+    n_slots = np.unique(schedule_data.reshape(-1, 96).T, axis=0).shape[0]
+    assert places.occupancy_members.shape == (n_slots, residents.shape[0]) and n_slots < 96
+
+    # move some persons' morning activity and cafeteria
+    idxs = np.array([3, 40, 41, 900])
+    old_places = population.resident_places(schedule_data, residents, idxs)
+    residents[idxs, population.P_MACT_IDX] = 17
+    residents[idxs[:2], population.P_CAF_IDX] = 503
+    new_places = population.resident_places(schedule_data, residents, idxs)
+    places.update_occupancy_index(idxs, old_places, new_places)
+
+    exp = population.Places(places.place_id_map, places.place_data.copy())
+    exp.build_occupancy_index(schedule_data, residents)
+    assert np.array_equal(places.occupancy_offsets, exp.occupancy_offsets)
+    assert np.array_equal(places.occupancy_members, exp.occupancy_members)
+
+    # a schedule changing place type at a tick the others don't splits a slot
+    sched = schedule_data.reshape(-1, 96)[0].copy()
+    tod = np.nonzero(sched[1:] == sched[:-1])[0][0] + 1
+    sched[tod] = population.P_CELL_IDX if sched[tod] != population.P_CELL_IDX else population.P_CAF_IDX
+    model.add_schedules(sched[None, :])
+    assert places.occupancy_members.shape[0] == n_slots + 1
+    model.reassign(idxs, np.full(idxs.shape[0], 1))
+    exp = population.Places(places.place_id_map, places.place_data.copy())
+    exp.build_occupancy_index(model.schedule_data, residents)
+    assert np.array_equal(places.occupancy_offsets, exp.occupancy_offsets)
+    assert np.array_equal(places.occupancy_members, exp.occupancy_members)
+    model.select_next_place(tod)
+    assert np.array_equal(places.get_occupants(17, tod),
+                          np.nonzero(residents[:, population.P_CURRENT_PLACE_IDX] == 17)[0])
+
+
+def test_schedule_dedup_and_segments():
+    fname = os.path.join(tempfile.mkdtemp(), "schedules.csv")
+    with open(fname, "w") as fout:
+        fout.write("schedule_id,start,place_type,risk\n")
+        for sid in (3, 7):
+            fout.write(f"{sid},0,cell,1\n{sid},420,cafeteria,1\n{sid},480,morning_act,1\n{sid},1200,cell,1\n")
+        # same as 3 and 7, but with a different risk
+        fout.write("9,0,cell,1\n9,420,cafeteria,2\n9,480,morning_act,1\n9,1200,cell,1\n")
+        fout.write("11,0,cafeteria,1\n11,60,cell,1\n")
+
+    id_map, schedules, risks = population.create_schedules(fname)
+    assert {3: 0, 7: 0, 9: 1, 11: 2} == id_map
+    assert (3 * common.TICKS_PER_DAY,) == schedules.shape
+    assert (3 * common.TICKS_PER_DAY,) == risks.shape
+
+    segments = population.create_schedule_segments(schedules)
+    assert np.array_equal(segments.offsets, [0, 4, 8, 10])
+    assert np.array_equal(segments.starts[:4], [0, 28, 32, 80])
+    assert np.array_equal(segments.place_types[:4], [population.P_CELL_IDX, population.P_CAF_IDX,
+                                                     population.P_MACT_IDX, population.P_CELL_IDX])
+    # 0 and 1 start and end in a cell so don't change at midnight, 2 does
+    assert np.array_equal(segments.changes_at(0), [2])
+    assert np.array_equal(segments.changes_at(common.TICKS_PER_DAY), [2])
+    assert np.array_equal(segments.changes_at(4), [2])
+    assert np.array_equal(segments.changes_at(28), [0, 1])
+    assert segments.changes_at(29).shape[0] == 0
+
+
+def test_incremental_counts():
+    schedule_data, _, place_data, residents, params = _init_data()
+    residents[:20, population.P_STATE_IDX] = common.INFECTED_SYMP
+    residents[:20, population.P_NEXT_STATE_T_IDX] = np.arange(20) * 20
+    params["stoe"] = 0.05
+    params["exposed_duration_mean"] = 0.5
+    params["presymptomatic_duration_mean"] = 0.5
+    params["symptomatic_duration_mean"] = 1
+    params["asymptomatic_duration_mean"] = 1
+    model = core.Model(MPI.COMM_WORLD, schedule_data, residents, place_data, params["stoe"],
+                       core.create_trans_matrix(params["transition_matrix"]), core.create_duration_matrix(params),
+                       params["random_seed"], params)
+
+    n_places = place_data.place_data.shape[0]
+    for tick in range(400):
+        model.select_next_place(tick)
+        current_places = residents[:, population.P_CURRENT_PLACE_IDX]
+        infected = common.INFECTIOUS_MASK[residents[:, population.P_STATE_IDX]]
+        assert np.array_equal(place_data.place_data[:, population.PL_PERSON_COUNT_IDX],
+                              np.bincount(current_places, minlength=n_places))
+        assert np.array_equal(place_data.place_data[:, population.PL_INFECTED_COUNT_IDX],
+                              np.bincount(current_places[infected], minlength=n_places))
+        model.update_disease_state(tick)
+
+    assert np.count_nonzero(residents[:, population.P_STATE_IDX] != common.SUSCEPTIBLE) > 20
+
+
+def test_person_set():
+    pset = population.PersonSet(100)
+    pset.add(np.array([5, 3, 99, 3]))
+    assert 3 == len(pset)
+    assert np.array_equal(np.sort(pset.idxs), [3, 5, 99])
+    assert np.array_equal(pset.contains(np.array([3, 4, 5, 99])), [True, False, True, True])
+
+    pset.add(np.arange(0, 100, 2))
+    assert 53 == len(pset)
+    pset.remove(np.array([3, 4, 7, 99]))
+    assert 50 == len(pset)
+    exp = set(range(0, 100, 2)) | {5}
+    exp.remove(4)
+    assert set(pset.idxs.tolist()) == exp
+    assert np.array_equal(pset.idxs[pset.positions[pset.idxs]], pset.idxs)
+    assert np.count_nonzero(pset.positions >= 0) == 50
+
+    pset.reset(np.array([1, 2]))
+    assert set(pset.idxs.tolist()) == {1, 2}
+    assert np.count_nonzero(pset.positions >= 0) == 2
+
+
+def test_place_hazard():
+    counts = np.array([[0, 0], [10, 0], [10, 1], [10, 5], [4, 4], [1000, 1000]], dtype=np.uint32)
+
+    hazard = core.PlaceHazard(0.2)
+    assert np.array_equal(hazard.compute(counts), np.array([0, 0, 0.2, 0.2, 0.2, 0.2], dtype=np.float32))
+
+    hazard = core.PlaceHazard(0.2, "density", 1000)
+    # truncated once the probability saturates
+    assert hazard.lut.shape[0] < 1001
+    exp = 1 - np.power(0.8, np.array([0, 0, 1, 5, 4, 1000]))
+    assert np.allclose(hazard.compute(counts), exp)
+
+    hazard = core.PlaceHazard(0.2, "frequency")
+    exp = 1 - np.power(0.8, np.array([0, 0, 0.1, 0.5, 1, 1]))
+    assert np.allclose(hazard.compute(counts), exp)
+
+
+def test_disease_update_schedule_risk():
+    schedule_data, risks, place_data, residents, params = _init_data()
+    residents[0, population.P_STATE_IDX] = common.INFECTED_SYMP
+    params["stoe"] = 0.5
+    params["schedule_risk"] = True
+    model = core.Model(MPI.COMM_WORLD, schedule_data, residents, place_data, params["stoe"],
+                       core.create_trans_matrix(params["transition_matrix"]), core.create_duration_matrix(params),
+                       params["random_seed"], params, risks)
+
+    # noon activity, risk is 2 so stoe * risk is 1
+    tick = 55
+    model.select_next_place(tick)
+    infected_place = residents[0, population.P_CURRENT_PLACE_IDX]
+    colocated = np.nonzero(residents[:, population.P_CURRENT_PLACE_IDX] == infected_place)[0][1:]
+    assert colocated.shape[0] > 0
+    for _ in range(10):
+        model.update_disease_state(tick)
+        assert np.all(residents[colocated, population.P_STATE_IDX] == common.EXPOSED)
+        residents[colocated, population.P_STATE_IDX] = common.SUSCEPTIBLE
+
+    # evening activity, risk 1.5
+    tick = 75
+    model.select_next_place(tick)
+    infected_place = residents[0, population.P_CURRENT_PLACE_IDX]
+    colocated = np.nonzero(residents[:, population.P_CURRENT_PLACE_IDX] == infected_place)[0][1:]
+    n_exposed = 0
+    for _ in range(100):
+        model.update_disease_state(tick)
+        n_exposed += np.count_nonzero(residents[colocated, population.P_STATE_IDX] == common.EXPOSED)
+        residents[colocated, population.P_STATE_IDX] = common.SUSCEPTIBLE
+    assert abs(n_exposed / (100 * colocated.shape[0]) - 0.75) < 0.05
+
+
+def test_hybrid_exposures():
+    schedule_data, _, place_data, residents, params = _init_data()
+    residents[0, population.P_STATE_IDX] = common.INFECTED_SYMP
+    params["hybrid_exposure_threshold"] = 100
+    model = core.Model(MPI.COMM_WORLD, schedule_data, residents, place_data, 0.1,
+                       core.create_trans_matrix(params["transition_matrix"]), core.create_duration_matrix(params),
+                       params["random_seed"], params)
+    # everyone is in the cafeteria, which is resolved with a binomial draw
+    tick = 30
+    model.select_next_place(tick)
+    classes = (np.arange(residents.shape[0]) % 2).astype(np.uint8)
+    for multipliers in (None, PersonMultipliers(classes, np.array([1.0, 0.5], dtype=np.float32))):
+        model.person_multipliers = multipliers
+        n_exposed = np.zeros(2)
+        for _ in range(200):
+            model.update_disease_state(tick)
+            exposed = residents[:, population.P_STATE_IDX] == common.EXPOSED
+            n_exposed += np.bincount(classes[exposed], minlength=2)
+            residents[1:, population.P_STATE_IDX] = common.SUSCEPTIBLE
+        rates = n_exposed / (200 * 600)
+        expected = [0.1, 0.1] if multipliers is None else [0.1, 0.05]
+        assert np.all(np.abs(rates - expected) < 0.01)
+
+    # a threshold above every place's count is the same as individual draws
+    counts = []
+    for threshold in (0, 2000):
+        schedule_data, _, place_data, residents, params = _init_data()
+        params["init_exposed"] = 20
+        params["stop.at"] = 300
+        params["hybrid_exposure_threshold"] = threshold
+        params["counts_log_format"] = "memory"
+        model = core.Model(None, schedule_data, residents, place_data, 0.2,
+                           core.create_trans_matrix(params["transition_matrix"]),
+                           core.create_duration_matrix(params), params["random_seed"], params)
+        model.run()
+        counts.append(model.data_set.series()["exposed"])
+    assert np.array_equal(counts[0], counts[1])
+
+
+def test_bulk_csv_loading():
+    schedule_id_map, _, _ = population.create_schedules("./test_data/ng_schedules.csv")
+    places = population.create_places("./test_data/ng_places.csv")
+    residents = population.create_residents("./test_data/ng_residents.csv", places.place_id_map, schedule_id_map)
+    # chunk parallel parsing gives the same residents
+    parallel = population.create_residents("./test_data/ng_residents.csv", places.place_id_map, schedule_id_map,
+                                           n_workers=3)
+    assert np.array_equal(residents, parallel)
+
+    ids = np.array([[3, 1], [7, 3]])
+    assert np.array_equal(population.map_ids(ids, {1: 10, 3: 30, 7: 70}, "place"), [[30, 10], [70, 30]])
+    with pytest.raises(ValueError, match="3 place ids are unknown \\(2 distinct\\), e.g. \\[2, 9\\]"):
+        population.map_ids(np.array([1, 2, 9, 2]), {1: 10}, "place")
+
+
+def test_person_store():
+    schedule_id_map, schedule_data, _ = population.create_schedules("./test_data/ng_schedules.csv")
+    places = population.create_places("./test_data/ng_places.csv")
+    residents = population.create_residents("./test_data/ng_residents.csv", places.place_id_map, schedule_id_map)
+    fname = os.path.join(tempfile.mkdtemp(), "residents.npy")
+    store = population.create_person_store(fname, "./test_data/ng_residents.csv", places.place_id_map,
+                                           schedule_id_map, chunk_rows=500)
+    assert store.flags.f_contiguous
+    assert np.array_equal(residents, store)
+
+    with open("./test_data/params.yaml") as fin:
+        params = yaml.safe_load(fin)
+    params["counts_log_file"] = os.path.join(tempfile.mkdtemp(), "counts.csv")
+    params["places_log_file"] = os.path.join(tempfile.mkdtemp(), "place_counts.csv")
+    params["init_exposed"] = 20
+    params["stoe"] = 0.5
+    params["stop.at"] = 800
+    models = []
+    for person_data, chunk_size in ((residents.copy(), None), (store, 99)):
+        if chunk_size is not None:
+            params["person_chunk_size"] = chunk_size
+        model = core.Model(MPI.COMM_WORLD, schedule_data, person_data, places, params["stoe"],
+                           core.create_trans_matrix(params["transition_matrix"]),
+                           core.create_duration_matrix(params), params["random_seed"], params)
+        model.run()
+        models.append(model)
+
+    # chunked scans over the store give the same run
+    assert np.array_equal(models[0].person_data, models[1].person_data)
+    assert np.count_nonzero(models[1].person_data[:, population.P_STATE_IDX]) > 20
+    # and the store file is left unchanged
+    assert np.array_equal(np.load(fname), residents)
+
+
+def test_person_store_sources():
+    tmp_dir = tempfile.mkdtemp()
+    files = {}
+    for name in ("schedule_file", "places_file", "residents_file"):
+        src = {"schedule_file": "ng_schedules.csv", "places_file": "ng_places.csv",
+               "residents_file": "ng_residents.csv"}[name]
+        files[name] = os.path.join(tmp_dir, src)
+        with open(os.path.join("./test_data", src)) as fin, open(files[name], "w") as fout:
+            fout.write(fin.read())
+    params = dict(files, person_store_file=os.path.join(tmp_dir, "residents.npy"), random_seed=1)
+    store_file = params["person_store_file"]
+
+    pop = core.load_population(params)
+    assert isinstance(pop.residents, np.memmap)
+    # copies are separate copy on write maps of the store
+    pop_copy = pop.copy()
+    assert isinstance(pop_copy.residents, np.memmap)
+    pop_copy.residents[0, population.P_STATE_IDX] = common.EXPOSED
+    assert pop.residents[0, population.P_STATE_IDX] == common.SUSCEPTIBLE
+    assert np.load(store_file)[0, population.P_STATE_IDX] == common.SUSCEPTIBLE
+    mtime = os.stat(store_file).st_mtime_ns
+    core.load_population(params)
+    assert os.stat(store_file).st_mtime_ns == mtime
+
+    # a changed places file rebuilds the store, with the new place row idxs
+    with open(files["places_file"]) as fin:
+        lines = fin.readlines()
+    with open(files["places_file"], "w") as fout:
+        fout.writelines(lines[:1] + lines[2:] + lines[1:2])
+    pop = core.load_population(params)
+    assert pop.places.place_id_map[0] == 503
+    assert np.all(pop.residents[pop.residents[:, population.P_ID_IDX] == 0, population.P_CELL_IDX] == 503)
+
+    # a failed rebuild leaves no store behind, and a person id duplicated in another chunk is found
+    with open(files["residents_file"]) as fin:
+        lines = fin.readlines()
+    with open(files["residents_file"], "a") as fout:
+        fout.write(lines[1])
+    with pytest.raises(validate.PopulationError, match="1 person ids appear more than once, e.g. \\[0\\]"):
+        population.create_person_store(store_file, files["residents_file"], pop.places.place_id_map, {0: 0},
+                                       chunk_rows=500)
+    assert not any(f.endswith(".npy") and f != "residents.npy" for f in os.listdir(tmp_dir))
+    os.remove(store_file)
+    with pytest.raises(validate.PopulationError):
+        core.load_population(params)
+    assert not os.path.exists(store_file)
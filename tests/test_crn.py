@@ -0,0 +1,45 @@
+import numpy as np
+import tempfile
+import os
+
+from radmodel import columnar, crn
+
+
+def test_counter_based_draws():
+    assert np.allclose(crn.norm_ppf([0.5, 0.975, 0.025, 0.001]), [0, 1.959964, -1.959964, -3.090232], atol=1e-6)
+
+    numbers = crn.CommonRandomNumbers(7)
+    persons = np.arange(100000)
+    u = numbers.uniform(crn.EXPOSURE, 12, persons)
+    assert np.all((u > 0) & (u < 1))
+    assert abs(u.mean() - 0.5) < 0.01
+    # a person's draw doesn't depend on which other persons are drawn for
+    assert np.array_equal(numbers.uniform(crn.EXPOSURE, 12, persons[[5, 99, 3]]), u[[5, 99, 3]])
+    assert not np.array_equal(numbers.uniform(crn.TRANSITION, 12, persons), u)
+    assert not np.array_equal(numbers.uniform(crn.EXPOSURE, 13, persons), u)
+    assert not np.array_equal(crn.CommonRandomNumbers(8).uniform(crn.EXPOSURE, 12, persons), u)
+
+    g = numbers.gamma(6, 0.5, crn.DURATION, 12, persons)
+    assert abs(g.mean() - 3) < 0.02
+    assert abs(g.var() - 1.5) < 0.05
+
+
+def test_paired_runs(params):
+    params["init_exposed"] = 50
+    params["stoe"] = 0.002
+    params["stop.at"] = 600
+    seeds = [1, 2, 3]
+    # identical parameters give identical runs
+    paired = crn.run_pairs(params, {}, {}, seeds)
+    assert 3 == paired.n
+    assert np.all(paired.moments.mean == 0)
+
+    paired = crn.run_pairs(params, {}, {"stoe": 0.004}, seeds)
+    col = paired.names.index("susceptible")
+    assert paired.moments.mean[:, col].sum() < 0
+
+    fname = os.path.join(tempfile.mkdtemp(), "paired.rcol")
+    paired.write(fname)
+    summary = columnar.read_columnar(fname, tick_range=(600, 600))
+    assert ["tick", "name", "n", "mean_diff", "var_diff", "se", "ci_low", "ci_high"] == list(summary)
+    assert np.all(summary["ci_low"] <= summary["ci_high"])
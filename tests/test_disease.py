@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+import yaml
+
+from radmodel import core, disease
+from radmodel.population import P_STATE_IDX
+
+SEIRD = {"exposed": "E",
+         "states": {"S": {"count": "susceptible"},
+                    "E": {"duration": {"distribution": "fixed", "days": 2}, "transitions": {"I": 1.0}},
+                    "I": {"infectious": True, "count": "infected",
+                          "duration": {"distribution": "exponential", "mean": 3},
+                          "transitions": {"R": 0.7, "D": 0.2, "V": 0.1}},
+                    "V": {"duration": {"distribution": "gamma", "mean": 5, "k": 4}, "transitions": {"S": 1.0}},
+                    "R": None,
+                    "D": {"dead": True}}}
+
+
+def test_alias_sampling():
+    model = disease.parse_disease_model(SEIRD)
+    assert ["S", "E", "I", "V", "R", "D"] == model.names
+    assert [False, False, True, False, False, False] == model.infectious.tolist()
+    assert 5 == model.state_map["D"] and model.dead[5]
+    assert np.allclose(model.transition_probs()[2], [0, 0, 0, 0.1, 0.7, 0.2])
+
+    rng = np.random.default_rng(1)
+    n = 200000
+    states = np.full(n, 2)
+    freqs = np.bincount(model.sample_next_states(states, rng.random(n)), minlength=6) / n
+    assert np.allclose(freqs, [0, 0, 0, 0.1, 0.7, 0.2], atol=0.005)
+    # absorbing states stay put
+    assert np.all(model.sample_next_states(np.array([0, 4, 5]), rng.random(3)) == [0, 4, 5])
+
+    counts = model.counts_class()
+    assert "infected" == model.count_names[2]
+    counts.newly_infected = 3
+    counts.reset()
+    assert 0 == counts.newly_infected
+
+
+def test_disease_model_errors():
+    spec = yaml.safe_load(yaml.safe_dump(SEIRD))
+    spec["states"]["I"]["transitions"]["R"] = 0.5
+    with pytest.raises(ValueError, match="I's transition probabilities sum to 0.8"):
+        disease.parse_disease_model(spec)
+    spec["states"]["I"]["transitions"]["R"] = 0.7
+    spec["states"]["I"]["transitions"]["X"] = 0.0
+    with pytest.raises(ValueError, match="unknown state X"):
+        disease.parse_disease_model(spec)
+    del spec["states"]["I"]["transitions"]["X"]
+    del spec["states"]["E"]["duration"]
+    with pytest.raises(ValueError, match="E has transitions but no duration"):
+        disease.parse_disease_model(spec)
+    spec["states"]["E"]["duration"] = {"distribution": "fixed", "days": 2}
+    spec["states"]["R"] = {"duration": {"distribution": "fixed", "days": 5}}
+    with pytest.raises(ValueError, match="R has a duration but no transitions"):
+        disease.parse_disease_model(spec)
+
+
+def test_run_disease_model(params):
+    params["init_exposed"] = 30
+    params["stoe"] = 0.2
+    params["stop.at"] = 96 * 15
+    params["disease_model"] = SEIRD
+    model = core.create_model(params)
+    model.run()
+
+    series = model.data_set.series()
+    assert {"susceptible", "e", "infected", "v", "r", "d", "newly_infected", "newly_d"} <= set(series)
+    totals = sum(series[name] for name in model.disease.count_names)
+    assert np.all(totals == 1200)
+    # persons spend a fixed 2 days exposed, so the first are infectious after 192 ticks
+    assert np.all(series["infected"][:192] == 0)
+    assert series["newly_infected"][192] == 30
+    states = model.person_data[:, P_STATE_IDX]
+    assert np.count_nonzero(states == model.disease.state_map["D"]) == series["d"][-1] > 0
+    assert np.sum(series["newly_e"]) > 0
+    assert np.array_equal(np.sort(model.infectious.idxs), np.nonzero(states == 2)[0])
+
+
+def test_absorbing_states(params):
+    # the built in model's recovered state has a duration, but without its R -> S transition is
+    # absorbing, and the recovered are counted once and never scheduled again
+    del params["transition_matrix"]["R"]
+    model = disease.create_disease_model(params)
+    assert model.absorbing[model.state_map["R"]]
+    assert model.duration_kinds[model.state_map["R"]] == disease.NO_DURATION
+
+    params["init_exposed"] = 50
+    params["stoe"] = 0.0
+    params["stop.at"] = 96 * 40
+    params["recovered_duration_mean"] = 1
+    model = core.create_model(params)
+    model.run()
+    series = model.data_set.series()
+    assert series["recovered"][-1] > 0
+    assert np.sum(series["newly_recovered"]) == series["recovered"][-1]
+
+
+def test_newly_counts(params):
+    # newly_ series count the persons entering each state: the built in model's recovered returning
+    # to S are newly susceptible, and a transition sampled back to the same state isn't counted
+    params["init_exposed"] = 30
+    params["stoe"] = 0.0
+    params["stop.at"] = 96 * 40
+    params["recovered_duration_mean"] = 1
+    model = core.create_model(params)
+    model.run()
+    series = model.data_set.series()
+    assert np.sum(series["newly_susceptible"]) > 0
+    assert np.sum(series["newly_susceptible"][1:]) == series["susceptible"][-1] - series["susceptible"][0]
+
+    spec = yaml.safe_load(yaml.safe_dump(SEIRD))
+    spec["states"]["I"]["transitions"] = {"I": 0.5, "R": 0.5}
+    params["disease_model"] = spec
+    model = core.create_model(params)
+    model.run()
+    series = model.data_set.series()
+    assert np.sum(series["newly_infected"]) == np.sum(series["newly_r"]) == 30
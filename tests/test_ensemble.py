@@ -0,0 +1,50 @@
+import numpy as np
+import tempfile
+import os
+
+from radmodel import columnar, core, ensemble
+
+
+def test_moments_and_sketch():
+    rng = np.random.default_rng(1)
+    vals = rng.integers(0, 1000, (200, 3, 4))
+    moments = [ensemble.Moments((3, 4)) for _ in range(2)]
+    sketches = [ensemble.LogSketch((3, 4), alpha=0.02) for _ in range(2)]
+    for i, v in enumerate(vals):
+        moments[i % 2].add(v)
+        sketches[i % 2].add(v)
+    moments[0].merge(moments[1])
+    sketches[0].merge(sketches[1])
+
+    assert 200 == moments[0].n
+    assert np.allclose(moments[0].mean, vals.mean(axis=0))
+    assert np.allclose(moments[0].variance, vals.var(axis=0, ddof=1))
+    for q in (0.1, 0.5, 0.9):
+        exp = np.sort(vals, axis=0)[int(np.floor(q * 199))]
+        assert np.all(np.abs(sketches[0].quantile(q) - exp) <= 0.02 * exp + 1e-9)
+
+
+def test_run_ensemble(params):
+    params["init_exposed"] = 50
+    params["stoe"] = 0.5
+    params["stop.at"] = 400
+    aggregator = ensemble.run_ensemble(params, 3)
+    assert 3 == aggregator.n
+    assert np.array_equal(aggregator.ticks, np.arange(401))
+
+    exposed = []
+    for seed in range(params["random_seed"], params["random_seed"] + 3):
+        model = core.create_model(dict(params, random_seed=seed))
+        model.run()
+        exposed.append(model.data_set.series()["exposed"])
+    exposed = np.array(exposed)
+    col = aggregator.names.index("exposed")
+    assert np.allclose(aggregator.moments.mean[:, col], exposed.mean(axis=0))
+    assert np.allclose(aggregator.moments.variance[:, col], exposed.var(axis=0, ddof=1))
+    assert np.any(aggregator.moments.variance[:, col] > 0)
+
+    fname = os.path.join(tempfile.mkdtemp(), "ensemble.rcol")
+    aggregator.write(fname)
+    summary = columnar.read_columnar(fname, tick_range=(200, 200))
+    assert ["tick", "name", "n", "mean", "var", "q05", "q50", "q95"] == list(summary)
+    assert summary["mean"][list(summary["name"]).index("exposed")] == exposed[:, 200].mean()
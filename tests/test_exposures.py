@@ -0,0 +1,36 @@
+import numpy as np
+import os
+
+from radmodel import core, exposures
+
+
+def test_exposure_log(params, tmp_path):
+    params["exposure_log_file"] = os.path.join(tmp_path, "exposures.rcol")
+    # small blocks so the buffers are flushed part way through
+    params["log_chunk_rows"] = 64
+    params["init_exposed"] = 20
+    params["stoe"] = 0.05
+    params["stop.at"] = 700
+
+    model = core.create_model(params)
+    model.run()
+    newly_exposed = model.data_set.series()["newly_exposed"]
+
+    events = exposures.read_exposures(params["exposure_log_file"])
+    assert events["tick"].shape[0] == newly_exposed.sum() > 64
+    assert np.array_equal(np.bincount(events["tick"], minlength=701), newly_exposed)
+    # an exposure needs an infected person in the place
+    assert np.all(events["infected_count"] >= 1)
+    assert np.all(events["person_count"] >= events["infected_count"])
+
+    by_place = exposures.exposures_by_place(params["exposure_log_file"])
+    assert by_place["exposures"].sum() == newly_exposed.sum()
+    place = by_place["place_id"][np.argmax(by_place["exposures"])]
+    assert np.isclose(by_place["mean_infected"][np.argmax(by_place["exposures"])],
+                      events["infected_count"][events["place_id"] == place].mean())
+
+    by_tick = exposures.exposures_by_tick(params["exposure_log_file"], tick_range=(0, 300))
+    assert np.array_equal(by_tick["exposures"], newly_exposed[by_tick["tick"]])
+    assert np.all(by_tick["tick"] <= 300)
+    in_place = exposures.exposures_by_tick(params["exposure_log_file"], place_id=place)
+    assert in_place["exposures"].sum() == by_place["exposures"].max()
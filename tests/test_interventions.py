@@ -0,0 +1,85 @@
+import numpy as np
+
+from radmodel import core, population, interventions
+from radmodel.population import P_SCHEDULE_IDX, P_CURRENT_PLACE_IDX, P_CAF_IDX, P_CELL_IDX
+
+
+def _check_consistent(model):
+    # the incrementally patched structures match those built from scratch
+    residents = model.person_data
+    n_places = model.place_data.place_data.shape[0]
+    counts = np.bincount(residents[:, P_CURRENT_PLACE_IDX], minlength=n_places)
+    assert np.array_equal(model.place_data.get_all_counts()[:, 0], counts)
+    exp = population.Places(model.place_data.place_id_map, model.place_data.place_data.copy())
+    exp.build_occupancy_index(model.schedule_data, residents)
+    assert np.array_equal(model.place_data.occupancy_offsets, exp.occupancy_offsets)
+    assert np.array_equal(model.place_data.occupancy_members, exp.occupancy_members)
+    members = np.argsort(residents[:, P_SCHEDULE_IDX], kind="stable")
+    assert np.array_equal(model.schedule_members, members)
+    n_schedules = model.offsets.shape[0]
+    assert np.array_equal(np.diff(model.schedule_member_offsets),
+                          np.bincount(residents[:, P_SCHEDULE_IDX], minlength=n_schedules))
+
+
+def test_module_closure(params):
+    params["occupancy_index"] = True
+    params["init_exposed"] = 10
+    params["stop.at"] = 2 * 96 + 40
+    params["interventions"] = [{"day": 1, "end_day": 2, "persons": {"column": "mod", "values": [3]},
+                                "replace_place_type": {"from": "cafeteria", "to": "cell", "window": [420, 480]}}]
+    pop = core.load_population(params)
+    model = core.create_model(params, None, pop.copy())
+    mod3 = np.nonzero(np.loadtxt("./test_data/ng_residents.csv", delimiter=",", skiprows=1, usecols=7) == 3)[0]
+
+    def during():
+        # during day 1 mod 3 is in their cells rather than the cafeteria at 7:15
+        assert 2 == model.offsets.shape[0]
+        assert np.all(model.person_data[mod3, P_SCHEDULE_IDX] == 1)
+        assert np.count_nonzero(model.person_data[:, P_SCHEDULE_IDX] == 1) == mod3.shape[0]
+        sched = model.schedule_data.reshape(-1, 96)
+        assert np.all(sched[1, 29:32] == P_CELL_IDX)
+        assert np.array_equal(sched[1, 44:48], sched[0, 44:48])
+        assert np.all(model.person_data[mod3, P_CURRENT_PLACE_IDX] == model.person_data[mod3, P_CELL_IDX])
+        others = np.setdiff1d(np.arange(model.person_data.shape[0]), mod3)
+        assert np.all(model.person_data[others, P_CURRENT_PLACE_IDX] == model.person_data[others, P_CAF_IDX])
+        _check_consistent(model)
+        checked.append(1)
+
+    def after():
+        # and back in the cafeteria on day 2
+        assert np.all(model.person_data[:, P_SCHEDULE_IDX] == 0)
+        assert np.all(model.person_data[:, P_CURRENT_PLACE_IDX] == model.person_data[:, P_CAF_IDX])
+        _check_consistent(model)
+        checked.append(2)
+
+    checked = []
+    model.runner.schedule_event(96 + 30.5, during)
+    model.runner.schedule_event(2 * 96 + 30.5, after)
+    model.run()
+    assert [1, 2] == checked
+
+    # the shared population is unchanged
+    assert pop.schedule_data.shape[0] == 96
+    assert np.all(pop.residents[:, P_SCHEDULE_IDX] == 0)
+
+
+def test_set_place_and_fork_reuse(params):
+    params["occupancy_index"] = True
+    params["init_exposed"] = 10
+    params["stop.at"] = 30
+    params["interventions"] = [{"day": 0, "persons": {"column": "mod", "values": [0, 1]},
+                                "set_place": {"place_type": "cafeteria", "place_id": 501}}]
+    model = core.create_model(params)
+    cafeteria = model.place_data.place_id_map[501]
+    model.run()
+    assert 400 == np.count_nonzero(model.person_data[:, P_CURRENT_PLACE_IDX] == cafeteria)
+    _check_consistent(model)
+
+    # forking the same change for two sets of persons adds a single schedule
+    for mod in (4, 5):
+        idxs = interventions.select_persons(model, {"column": "mod", "values": [mod]},
+                                            params["residents_file"])
+        interventions.replace_place_type(model, idxs, P_CAF_IDX, P_CELL_IDX)
+    assert 2 == model.offsets.shape[0]
+    assert 400 == np.count_nonzero(model.person_data[:, P_SCHEDULE_IDX] == 1)
+    _check_consistent(model)
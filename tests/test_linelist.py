@@ -0,0 +1,68 @@
+import numpy as np
+import os
+
+from radmodel import common, core, linelist
+
+
+def test_line_list(params, tmp_path):
+    params["line_list_file"] = os.path.join(tmp_path, "line_list.rcol")
+    params["init_exposed"] = 20
+    params["stoe"] = 0.05
+    params["stop.at"] = 2000
+    model = core.create_model(params)
+    model.run()
+    series = model.data_set.series()
+
+    lines = linelist.read_line_list(params["line_list_file"])
+    exposed = lines["to_state"] == common.EXPOSED
+    assert np.count_nonzero(exposed) == series["newly_exposed"].sum() + 20
+    assert np.count_nonzero(lines["to_state"] == common.DEAD) == series["newly_dead"].sum()
+    assert np.all(lines["from_state"][exposed] == common.SUSCEPTIBLE)
+
+    tl = linelist.timelines(params["line_list_file"])
+    assert tl["offsets"][-1] == lines["tick"].shape[0]
+    for i in range(0, tl["person_ids"].shape[0], 50):
+        start, end = tl["offsets"][i], tl["offsets"][i + 1]
+        assert np.all(tl["person_id"][start:end] == tl["person_ids"][i])
+        assert np.all(np.diff(tl["tick"][start:end]) > 0)
+        # each change starts from the previous one's state, and happens when it was scheduled
+        assert np.array_equal(tl["from_state"][start + 1:end], tl["to_state"][start:end - 1])
+        assert np.array_equal(tl["tick"][start + 1:end], tl["next_tick"][start:end - 1])
+
+    durations = linelist.state_durations(params["line_list_file"], common.EXPOSED)
+    assert np.all(durations["duration"] > 0)
+    # mean duration is exposed_duration_mean days
+    assert abs(durations["duration"].mean() / 96 - params["exposed_duration_mean"]) < 0.5
+
+
+def test_line_list_sample(params, tmp_path):
+    params["line_list_file"] = os.path.join(tmp_path, "line_list.rcol")
+    params["init_exposed"] = 20
+    params["stoe"] = 0.05
+    params["stop.at"] = 2000
+    full = core.create_model(params)
+    full.run()
+    params["line_list_sample"] = 0.25
+    sampled = core.create_model(params)
+    sampled.run()
+
+    # sampling doesn't change the run
+    assert np.array_equal(full.person_data, sampled.person_data)
+    all_lines = linelist.read_line_list(full.line_list.writer.fname)
+    lines = linelist.read_line_list(sampled.line_list.writer.fname)
+    persons = np.unique(lines["person_id"])
+    assert 0 < persons.shape[0] < 0.4 * np.unique(all_lines["person_id"]).shape[0]
+    keep = np.isin(all_lines["person_id"], persons)
+    assert np.array_equal(lines["tick"], all_lines["tick"][keep])
+
+
+def test_many_states(tmp_path):
+    # states are stored in a type large enough for the model's states
+    fname = os.path.join(tmp_path, "line_list.rcol")
+    logger = linelist.LineListLogger(fname, n_states=300)
+    person_data = np.array([[7, 299, 5], [8, 256, 9]], dtype=np.uint32)
+    logger.log(3, np.arange(2), person_data, np.array([0, 298]), 0, 1, 2)
+    logger.close()
+    lines = linelist.read_line_list(fname)
+    assert [0, 298] == lines["from_state"].tolist()
+    assert [299, 256] == lines["to_state"].tolist()
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+import os
+
+from radmodel import core, common, exposures, mixing
+from radmodel.population import P_CURRENT_PLACE_IDX, P_STATE_IDX, P_CELL_IDX
+
+
+def test_group_counts(params):
+    params["init_exposed"] = 100
+    params["stoe"] = 0.01
+    params["mixing_groups"] = {"place_types": ["cafeteria", "yard"], "n_groups": 3, "rule": "random"}
+    params["placement_overrides"] = {"H": "removed"}
+    model = core.create_model(params)
+    groups = model.mixing
+    assert groups.n_cells == 504 + 2 * 2
+    residents = model.person_data
+    for tick in range(1, 96 * 12):
+        model.select_next_place(tick)
+        model.update_disease_state(tick)
+        model.select_next_place(tick)
+        # the cell counts agree with the persons' places and sum to the places' counts
+        placed = np.nonzero(residents[:, P_CURRENT_PLACE_IDX] != mixing.REMOVED)[0]
+        cells = groups.cells(placed, residents[placed, P_CURRENT_PLACE_IDX])
+        assert np.array_equal(groups.counts[:, 0], np.bincount(cells, minlength=groups.n_cells))
+        assert np.array_equal(np.add.reduceat(groups.counts, groups.cell_offsets[:-1]),
+                              model.place_data.get_all_counts())
+    # hospitalized persons were removed along the way
+    assert np.any(residents[:, P_STATE_IDX] == common.HOSPITALIZED)
+
+
+def test_exposure_within_group(params, tmp_path):
+    params["exposure_log_file"] = os.path.join(tmp_path, "exposures.rcol")
+    params["init_exposed"] = 0
+    params["stoe"] = 1.0
+    params["mixing_groups"] = {"place_types": ["cafeteria"], "n_groups": 2, "rule": "cell"}
+    model = core.create_model(params)
+    residents = model.person_data
+    residents[0, P_STATE_IDX] = common.INFECTED_SYMP
+    # everyone is in the cafeteria, and only mixes with those with cells of the same parity
+    model.select_next_place(30)
+    model.update_disease_state(30)
+    exposed = residents[:, P_STATE_IDX] == common.EXPOSED
+    same_group = residents[:, P_CELL_IDX] % 2 == residents[0, P_CELL_IDX] % 2
+    assert np.array_equal(exposed[1:], same_group[1:])
+
+    # the exposures are logged with the group's counts rather than the cafeteria's
+    model.exposure_log.close()
+    events = exposures.read_exposures(params["exposure_log_file"])
+    assert events["person_id"].shape[0] == np.count_nonzero(exposed)
+    assert np.all(events["group"] == residents[0, P_CELL_IDX] % 2)
+    assert np.all(events["infected_count"] == 1)
+    assert np.all(events["person_count"] == np.count_nonzero(same_group))
+
+
+def test_single_group(params):
+    # a single group is the same as mixing within places
+    params["init_exposed"] = 20
+    params["stop.at"] = 96 * 5
+    series = []
+    for mixing_groups in (None, {"place_types": ["cafeteria"], "n_groups": 1, "rule": "schedule"}):
+        if mixing_groups is not None:
+            params["mixing_groups"] = mixing_groups
+        model = core.create_model(params)
+        model.run()
+        series.append(model.data_set.series())
+    for name in series[0]:
+        assert np.array_equal(series[0][name], series[1][name])
+
+
+def test_mixing_errors(params):
+    pop = core.load_population(params)
+    with pytest.raises(ValueError, match="unknown place types \\['canteen'\\]"):
+        mixing.create_mixing_groups({"place_types": ["canteen"], "n_groups": 2}, pop.residents, pop.places)
+    with pytest.raises(ValueError, match="Unknown mixing group rule shift"):
+        mixing.create_mixing_groups({"place_types": ["yard"], "n_groups": 2, "rule": "shift"}, pop.residents,
+                                    pop.places)
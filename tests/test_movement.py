@@ -0,0 +1,52 @@
+import numpy as np
+
+from radmodel import movement
+from radmodel.population import P_SCHEDULE_IDX
+
+
+def _query():
+    return movement.load_movements("./test_data/ng_schedules.csv", "./test_data/ng_places.csv",
+                                   "./test_data/ng_residents.csv")
+
+
+def test_locations_and_occupancy():
+    query = _query()
+    residents = query.residents
+    person_idxs = query.person_idxs([5, 0, 33])
+    assert residents[person_idxs, 0].tolist() == [5, 0, 33]
+
+    locations = query.locations(person_idxs)
+    sched = query.schedule_data.reshape(-1, 96)
+    for i, p in enumerate(person_idxs):
+        for tod in range(96):
+            assert locations[i, tod] == residents[p, sched[residents[p, P_SCHEDULE_IDX], tod]]
+
+    # occupancy agrees with placing everyone tick by tick
+    place_idxs = query.place_idxs([0, 500, 501, 503])
+    query.chunk_size = 7
+    occupancy = query.occupancy(place_idxs)
+    assert occupancy.shape == (4, 96)
+    for tod in (0, 30, 50, 95):
+        cols = sched[residents[:, P_SCHEDULE_IDX], tod]
+        current = residents[np.arange(residents.shape[0]), cols]
+        assert occupancy[:, tod].tolist() == [np.count_nonzero(current == p) for p in place_idxs]
+
+    subset = query.occupancy(place_idxs, person_idxs)
+    assert np.array_equal(subset, np.stack([np.sum(locations == p, axis=0) for p in place_idxs]))
+
+
+def test_stays():
+    query = _query()
+    person_idxs = np.arange(0, query.residents.shape[0], 3)
+    stays = query.stays(person_idxs)
+    assert np.all(stays["start"] < stays["end"])
+
+    # the stays cover each person's day, with a change of place between consecutive stays
+    locations = np.full((person_idxs.shape[0], 96), -1)
+    rows = np.searchsorted(person_idxs, stays["person_idx"])
+    for row, place, start, end in zip(rows, stays["place_idx"], stays["start"], stays["end"]):
+        assert np.all(locations[row, start:end] == -1)
+        locations[row, start:end] = place
+    assert np.array_equal(locations, query.locations(person_idxs))
+    same_person = stays["person_idx"][1:] == stays["person_idx"][:-1]
+    assert np.all(stays["place_idx"][1:][same_person] != stays["place_idx"][:-1][same_person])
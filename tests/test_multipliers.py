@@ -0,0 +1,52 @@
+import numpy as np
+from mpi4py import MPI
+import tempfile
+import os
+
+from radmodel import multipliers, population, core, common
+
+
+def _write_residents():
+    # test residents with an extra vulnerability column
+    fname = os.path.join(tempfile.mkdtemp(), "residents.csv")
+    with open("./test_data/ng_residents.csv") as fin, open(fname, "w") as fout:
+        fout.write(next(fin).strip() + ",vulnerability\n")
+        for i, line in enumerate(fin):
+            fout.write(f"{line.strip()},{i % 3}\n")
+    return fname
+
+
+def test_create_person_multipliers():
+    fname = _write_residents()
+    factors = {"vulnerability": {"values": [1.0, 1.5, 2.0], "column": "vulnerability"},
+               "masking": {"values": [1.0, 0.5], "probs": [0.5, 0.5]}}
+    mults = multipliers.create_person_multipliers(factors, 1200, fname, np.random.default_rng(42))
+    assert mults.classes.dtype == np.uint8
+    assert np.array_equal(mults.lut, np.array([1.0, 1.5, 2.0, 0.5, 0.75, 1.0], dtype=np.float32))
+
+    vuln = np.array([1.0, 1.5, 2.0], dtype=np.float32)[np.arange(1200) % 3]
+    vals = mults.get(np.arange(1200))
+    masked = vals != vuln
+    assert np.allclose(vals[masked], vuln[masked] * 0.5)
+    assert 500 < np.count_nonzero(masked) < 700
+
+
+def test_disease_update_person_multipliers(params):
+    schedule_id_map, schedule_data, _ = population.create_schedules(params["schedule_file"])
+    places = population.create_places(params["places_file"])
+    residents = population.create_residents(params["residents_file"], places.place_id_map, schedule_id_map)
+
+    # only every third person is unshielded and so exposed
+    fname = _write_residents()
+    factors = {"shielding": {"values": [1.0, 0.0, 0.0], "column": "vulnerability"}}
+    mults = multipliers.create_person_multipliers(factors, 1200, fname)
+    residents[0, population.P_STATE_IDX] = common.INFECTED_SYMP
+    model = core.Model(MPI.COMM_WORLD, schedule_data, residents, places, 1.0,
+                       core.create_trans_matrix(params["transition_matrix"]), core.create_duration_matrix(params),
+                       params["random_seed"], params, person_multipliers=mults)
+    model.select_next_place(44)
+    colocated = np.nonzero(residents[:, population.P_CURRENT_PLACE_IDX]
+                           == residents[0, population.P_CURRENT_PLACE_IDX])[0][1:]
+    model.update_disease_state(44)
+    exposed = residents[colocated, population.P_STATE_IDX] == common.EXPOSED
+    assert np.array_equal(exposed, colocated % 3 == 0)
@@ -0,0 +1,122 @@
+import numpy as np
+from mpi4py import MPI
+import os
+import csv
+
+from radmodel import common, core, mixing, network, population
+from radmodel.population import P_SCHEDULE_IDX, P_CURRENT_PLACE_IDX, P_CAF_IDX, P_CELL_IDX, P_STATE_IDX
+
+
+def _facilities():
+    return [{"name": name, "schedule_file": "./test_data/ng_schedules.csv",
+             "places_file": "./test_data/ng_places.csv", "residents_file": "./test_data/ng_residents.csv"}
+            for name in ("a", "b")]
+
+
+def test_load_facilities():
+    schedule_data, risks, places, residents, net = network.load_facilities(_facilities())
+    assert (2400, 10) == residents.shape
+    assert (1008, 3) == places.place_data.shape
+    assert [0, 1200, 2400] == net.person_offsets.tolist()
+    assert [0, 504, 1008] == net.place_offsets.tolist()
+    assert schedule_data.shape[0] == 2 * net.schedule_offsets[1] * 96
+    assert risks.shape == schedule_data.shape
+
+    # the second facility is a copy of the first with offset place and schedule indices
+    assert np.all(residents[1200:, P_CAF_IDX] == residents[:1200, P_CAF_IDX] + 504)
+    assert np.all(residents[1200:, P_SCHEDULE_IDX] == residents[:1200, P_SCHEDULE_IDX] + net.schedule_offsets[1])
+    facility, place_ids = net.split_place_ids(places.place_data[:, 0])
+    assert np.array_equal(facility, np.repeat([0, 1], 504))
+    assert np.array_equal(place_ids[504:], place_ids[:504])
+
+
+def test_facility_transfers(params, tmp_path):
+    params["facility_counts_log_file"] = os.path.join(tmp_path, "facility_counts.csv")
+    schedule_data, risks, places, residents, net = network.load_facilities(_facilities())
+    params["init_exposed"] = 10
+    params["occupancy_index"] = True
+    params["facility_transfers"] = [{"day": 0, "from": "a", "to": "b", "n": 100}]
+    model = core.Model(MPI.COMM_WORLD, schedule_data, residents, places, params["stoe"],
+                       core.create_trans_matrix(params["transition_matrix"]), core.create_duration_matrix(params),
+                       params["random_seed"], params, risks, facility_network=net)
+    model.runner.schedule_stop(2)
+    model.run()
+
+    assert [1100, 1300] == np.bincount(net.person_facility).tolist()
+    moved = np.nonzero(net.person_facility[:1200] == 1)[0]
+    assert np.all(model.person_data[moved, P_SCHEDULE_IDX] >= net.schedule_offsets[1])
+    assert np.all(model.person_data[moved, P_CAF_IDX] >= 504)
+    assert np.all(model.person_data[moved, P_CURRENT_PLACE_IDX] >= 504)
+
+    # incrementally patched schedule members, occupancy and counts match a rebuild
+    members = np.argsort(model.person_data[:, P_SCHEDULE_IDX], kind="stable")
+    assert np.array_equal(np.sort(model.schedule_members), np.arange(2400))
+    for s in np.unique(model.person_data[:, P_SCHEDULE_IDX]):
+        start, end = model.schedule_member_offsets[s], model.schedule_member_offsets[s + 1]
+        assert np.array_equal(np.sort(model.schedule_members[start:end]),
+                              members[model.person_data[members, P_SCHEDULE_IDX] == s])
+    assert np.array_equal(model.place_data.place_data[:, 1],
+                          np.bincount(model.person_data[:, P_CURRENT_PLACE_IDX], minlength=1008))
+    assert np.array_equal(model.place_data.get_occupancy(2), model.place_data.place_data[:, 1])
+
+    with open(params["facility_counts_log_file"]) as fin:
+        rows = list(csv.reader(fin))
+    assert ["tick", "facility", "susceptible"] == rows[0][:3]
+    # ticks 0, 1, 2 for two facilities
+    assert 7 == len(rows)
+    assert ["2", "b"] == rows[-1][:2]
+    assert sum(int(x) for x in rows[-1][2:10]) == 1300
+
+
+def test_transfer_overridden_and_grouped(params, tmp_path):
+    schedule_data, risks, places, residents, net = network.load_facilities(_facilities())
+    params["facility_counts_log_file"] = os.path.join(tmp_path, "facility_counts.csv")
+    params["init_exposed"] = 0
+    params["placement_overrides"] = {"I_S": {"place_type": "cell"}}
+    groups = mixing.create_mixing_groups({"place_types": ["cafeteria"], "n_groups": 3, "rule": "cell"},
+                                         residents, places)
+    model = core.Model(MPI.COMM_WORLD, schedule_data, residents, places, params["stoe"],
+                       core.create_trans_matrix(params["transition_matrix"]), core.create_duration_matrix(params),
+                       params["random_seed"], params, risks, facility_network=net, mixing_groups=groups)
+    model.select_next_place(30)
+    isolated = np.arange(5)
+    old_states = model.person_data[isolated, P_STATE_IDX].copy()
+    model.person_data[isolated, P_STATE_IDX] = common.INFECTED_SYMP
+    model._states_changed(30, isolated, old_states)
+
+    # the isolated aren't transferred with the rest of facility a
+    net.transfer(model, 1200, "a", "b")
+    assert [5, 2395] == np.bincount(net.person_facility).tolist()
+    # when they are, they are isolated in their new cells
+    net.transfer_persons(model, isolated, "b")
+    assert np.all(model.person_data[isolated, P_CELL_IDX] >= 504)
+    assert np.array_equal(model.person_data[isolated, P_CURRENT_PLACE_IDX], model.person_data[isolated, P_CELL_IDX])
+
+    # the transferred persons' groups follow their new cells, and the counts their new places
+    placed = model.person_data[:, P_CURRENT_PLACE_IDX]
+    assert np.array_equal(groups.groups, model.person_data[:, P_CELL_IDX] % 3)
+    assert np.array_equal(model.place_data.place_data[:, 1], np.bincount(placed, minlength=1008))
+    assert np.array_equal(groups.counts[:, 0], np.bincount(groups.cells(np.arange(2400), placed),
+                                                           minlength=groups.n_cells))
+
+
+def test_facility_counts(params, tmp_path):
+    # the facilities' counts sum to the whole population's
+    schedule_data, risks, places, residents, net = network.load_facilities(_facilities())
+    params["facility_counts_log_file"] = os.path.join(tmp_path, "facility_counts.csv")
+    params["init_exposed"] = 50
+    params["stoe"] = 0.5
+    params["stop.at"] = 96 * 4
+    model = core.Model(MPI.COMM_WORLD, schedule_data, residents, places, params["stoe"],
+                       core.create_trans_matrix(params["transition_matrix"]), core.create_duration_matrix(params),
+                       params["random_seed"], params, risks, facility_network=net)
+    model.run()
+    series = model.data_set.series()
+
+    with open(params["facility_counts_log_file"]) as fin:
+        rows = list(csv.reader(fin))
+    header, rows = rows[0], np.array([[int(x) for x in row[2:]] for row in rows[1:]])
+    totals = rows[0::2] + rows[1::2]
+    for i, name in enumerate(header[2:]):
+        assert np.array_equal(totals[:, i], series[name])
+    assert np.sum(series["newly_exposed"]) > 0
@@ -0,0 +1,73 @@
+import numpy as np
+
+from radmodel import core
+from radmodel.common import HOSPITALIZED, DEAD, RECOVERED, INFECTED_SYMP
+from radmodel.overrides import REMOVED
+from radmodel.population import P_CURRENT_PLACE_IDX, P_STATE_IDX, P_CELL_IDX, P_CAF_IDX
+
+
+def _check_counts(model):
+    places = model.person_data[:, P_CURRENT_PLACE_IDX]
+    n_places = model.place_data.place_data.shape[0]
+    counts = np.bincount(places[places != REMOVED], minlength=n_places)
+    assert np.array_equal(model.place_data.get_all_counts()[:, 0], counts)
+
+
+def _set_states(model, tick, idxs, state):
+    old_states = model.person_data[idxs, P_STATE_IDX].copy()
+    model.person_data[idxs, P_STATE_IDX] = state
+    model._states_changed(tick, idxs, old_states)
+
+
+def test_state_rules(params):
+    params["placement_overrides"] = {"H": {"place_id": 503}, "I_S": {"place_type": "cell"}, "D": "removed"}
+    params["stoe"] = 0.0
+    model = core.create_model(params)
+    medical = model.place_data.place_id_map[503]
+    model.select_next_place(30)
+    assert np.all(model.person_data[:, P_CURRENT_PLACE_IDX] == model.person_data[:, P_CAF_IDX])
+
+    hosp, dead, isolated = np.arange(0, 10), np.arange(10, 15), np.arange(15, 30)
+    _set_states(model, 30, hosp, HOSPITALIZED)
+    _set_states(model, 30, dead, DEAD)
+    _set_states(model, 30, isolated, INFECTED_SYMP)
+    assert 30 == len(model.overrides)
+    assert np.all(model.person_data[hosp, P_CURRENT_PLACE_IDX] == medical)
+    assert np.all(model.person_data[dead, P_CURRENT_PLACE_IDX] == REMOVED)
+    assert np.all(model.person_data[isolated, P_CURRENT_PLACE_IDX] == model.person_data[isolated, P_CELL_IDX])
+    _check_counts(model)
+
+    # the overridden persons stay put as the others follow their schedules, incrementally and in full
+    for tick in list(range(31, 60)) + [75, 2]:
+        model.select_next_place(tick)
+        assert np.all(model.person_data[hosp, P_CURRENT_PLACE_IDX] == medical)
+        assert np.all(model.person_data[dead, P_CURRENT_PLACE_IDX] == REMOVED)
+        _check_counts(model)
+    assert 1200 - 5 == model.place_data.get_all_counts()[:, 0].sum()
+
+    # leaving the rule states returns persons to their schedules
+    model.select_next_place(30)
+    _set_states(model, 30, hosp[:5], RECOVERED)
+    _set_states(model, 30, isolated, HOSPITALIZED)
+    assert np.all(model.person_data[hosp[:5], P_CURRENT_PLACE_IDX] == model.person_data[hosp[:5], P_CAF_IDX])
+    assert np.all(model.person_data[isolated, P_CURRENT_PLACE_IDX] == medical)
+    assert 25 == len(model.overrides)
+    _check_counts(model)
+
+
+def test_removed_not_exposed(params):
+    params["placement_overrides"] = {"H": {"place_id": 503}, "I_S": {"place_type": "cell"}, "D": "removed"}
+    params["stoe"] = 1.0
+    params["init_exposed"] = 0
+    del params["placement_overrides"]["I_S"]
+    model = core.create_model(params)
+    model.select_next_place(30)
+    _set_states(model, 30, np.arange(100, 120), INFECTED_SYMP)
+    model.infectious.add(np.arange(100, 120))
+    _set_states(model, 30, np.arange(0, 50), DEAD)
+    model.person_data[np.arange(0, 50), P_STATE_IDX] = 0
+    model.select_next_place(31)
+    model.update_disease_state(31)
+    # everyone in the cafeteria with the infectious persons but the removed is exposed
+    assert np.all(model.person_data[:50, P_STATE_IDX] == 0)
+    assert np.all(model.person_data[120:, P_STATE_IDX] == 1)
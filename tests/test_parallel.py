@@ -0,0 +1,58 @@
+import numpy as np
+
+from radmodel import core, common
+from radmodel.parallel import ChunkPool
+from radmodel.population import P_CURRENT_PLACE_IDX, P_STATE_IDX
+
+
+def test_chunk_pool():
+    pool = ChunkPool(3, 10, 4, 42)
+    assert [0, 4, 8] == pool.starts.tolist()
+    assert [4, 8, 10] == pool.ends.tolist()
+    assert [(0, 0, 4), (1, 4, 8), (2, 8, 10)] == pool.map(lambda i, start, end: (i, start, end))
+    # chunk 1 has none of the persons
+    assert [0, 2, 2, 4] == pool.split(np.array([1, 3, 9, 9])).tolist()
+    # independent substreams
+    draws = [rng.random(4) for rng in pool.rngs]
+    assert not np.array_equal(draws[0], draws[1])
+    pool.close()
+
+
+def test_threaded_model(params):
+    params["init_exposed"] = 20
+    params["stop.at"] = 96 * 5
+    params["threads"] = 3
+    pop = core.load_population(params)
+    series = []
+    for _ in range(2):
+        model = core.create_model(params, None, pop.copy())
+        assert 3 == model.pool.n_chunks
+        model.run()
+        series.append(model.data_set.series())
+        # the merged place counts match the persons' places
+        places = model.person_data[:, P_CURRENT_PLACE_IDX]
+        counts = np.bincount(places, minlength=model.place_data.place_data.shape[0])
+        assert np.array_equal(model.place_data.get_all_counts()[:, 0], counts)
+
+    # deterministic for a fixed number of threads
+    for name in series[0]:
+        assert np.array_equal(series[0][name], series[1][name])
+    assert series[0]["susceptible"][-1] < 1200 - 20
+
+
+def test_threaded_exposure_rate(params):
+    params["stop.at"] = 96 * 5
+    params["threads"] = 4
+    params["init_exposed"] = 0
+    params["stoe"] = 0.25
+    model = core.create_model(params)
+    residents = model.person_data
+    residents[0, P_STATE_IDX] = common.INFECTED_SYMP
+    # everyone is in the cafeteria
+    model.select_next_place(30)
+    n_exposed = 0
+    for _ in range(100):
+        model.update_disease_state(30)
+        n_exposed += np.count_nonzero(residents[:, P_STATE_IDX] == common.EXPOSED)
+        residents[1:, P_STATE_IDX] = common.SUSCEPTIBLE
+    assert abs(n_exposed / (100 * 1199) - 0.25) < 0.01
@@ -0,0 +1,49 @@
+import numpy as np
+from mpi4py import MPI
+import os
+
+from radmodel import core, population, serial
+
+
+def _run(comm, params, out_dir, name):
+    schedule_id_map, schedule_data, risks = population.create_schedules(params["schedule_file"])
+    places = population.create_places(params["places_file"])
+    residents = population.create_residents(params["residents_file"], places.place_id_map, schedule_id_map)
+    # both logs are written to csv files, to compare the runs' files
+    params = dict(params, counts_log_format="csv", places_log_format="csv",
+                  counts_log_file=os.path.join(out_dir, f"{name}_counts.csv"),
+                  places_log_file=os.path.join(out_dir, f"{name}_place_counts.csv"))
+    params["init_exposed"] = 20
+    params["stoe"] = 0.5
+    params["stop.at"] = 500
+
+    model = core.Model(comm, schedule_data, residents, places, params["stoe"],
+                       core.create_trans_matrix(params["transition_matrix"]), core.create_duration_matrix(params),
+                       params["random_seed"], params, risks)
+    model.run()
+    return model, params
+
+
+def test_serial_schedule_runner():
+    runner = serial.SerialScheduleRunner()
+    evts = []
+    runner.schedule_repeating_event(1, 2, lambda: evts.append(("r", runner.tick())))
+    runner.schedule_event(3, lambda: evts.append(("a", runner.tick())))
+    runner.schedule_event(2.5, lambda: runner.schedule_event(1, lambda: evts.append(("past", runner.tick()))))
+    runner.schedule_stop(5)
+    runner.schedule_end_event(lambda: evts.append(("end", runner.tick())))
+    runner.execute()
+    # the repeat is rescheduled after "a" was scheduled, so runs after it
+    assert [("r", 1), ("a", 3), ("r", 3), ("r", 5), ("end", 5)] == evts
+
+
+def test_serial_matches_mpi(params, tmp_path):
+    mpi_model, mpi_params = _run(MPI.COMM_WORLD, params, tmp_path, "mpi")
+    serial_model, serial_params = _run(None, params, tmp_path, "serial")
+    assert serial_model.serial
+    assert isinstance(serial_model.runner, serial.SerialScheduleRunner)
+    assert np.array_equal(mpi_model.person_data, serial_model.person_data)
+
+    for key in ("counts_log_file", "places_log_file"):
+        with open(mpi_params[key]) as f1, open(serial_params[key]) as f2:
+            assert f1.read() == f2.read()
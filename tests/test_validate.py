@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+import tempfile
+import os
+
+from radmodel import population, validate, core
+
+
+def _write(lines):
+    fd, fname = tempfile.mkstemp(suffix=".csv")
+    with os.fdopen(fd, "w") as fout:
+        fout.write("\n".join(lines) + "\n")
+    return fname
+
+
+def test_schedule_problems():
+    fname = _write(["schedule_id,start,place_type,risk",
+                    "0,0,cell,1", "0,600,cafeteria,1", "0,420,gym,1",
+                    "1,30,cell,1", "1,1500,cell,1",
+                    "2,0,cell,1", "2,60,cell,1", "2,60,cafeteria,1",
+                    "3,0,cell,1", "3,700,noon_act,1"])
+    with pytest.raises(validate.PopulationError) as e:
+        population.create_schedules(fname)
+    problems = e.value.problems
+    assert 5 == len(problems)
+    assert problems[0].startswith("1 schedule rows have unknown place types ['gym']")
+    assert problems[1].startswith("1 schedule rows have starts outside 0 - 1440, e.g. schedule 1 start 1500")
+    assert problems[2] == "1 schedules have starts out of order, e.g. [0]"
+    assert problems[3] == "1 schedules have more than one row with the same start, e.g. [2]"
+    assert problems[4] == "1 schedules don't start at time 0, e.g. [1]"
+
+
+def test_resident_problems():
+    id_map, _, _ = population.create_schedules("./test_data/ng_schedules.csv")
+    places = population.create_places("./test_data/ng_places.csv")
+    assert ["cafeteria", "cell", "education", "gym", "yard"] == places.type_names.tolist()
+    assert "cafeteria" == places.type_names[places.type_codes[places.place_id_map[500]]]
+
+    fname = _write(["person_id,schedule_id,cell,cafeteria,morning_act,noon_act,evening_act",
+                    "0,0,0,500,501,503,502", "1,0,1,500,9999,503,502", "1,0,2,500,9998,503,9999",
+                    "3,7,3,500,501,503,502"])
+    with pytest.raises(validate.PopulationError) as e:
+        population.create_residents(fname, places.place_id_map, id_map)
+    assert e.value.problems == ["1 person ids appear more than once, e.g. [1]",
+                                "1 schedule ids are unknown (1 distinct), e.g. [7]",
+                                "2 place ids in morning_act are unknown (2 distinct), e.g. [9998, 9999]",
+                                "1 place ids in evening_act are unknown (1 distinct), e.g. [9999]"]
+
+
+def test_place_types():
+    params = {"schedule_file": "./test_data/ng_schedules.csv", "places_file": "./test_data/ng_places.csv",
+              "residents_file": "./test_data/ng_residents.csv", "random_seed": 1}
+    pop = core.load_population(params)
+    assert pop.places.type_codes.shape[0] == 504
+
+    # gyms (501) are only some of the morning activities
+    params["place_type_columns"] = {"cell": ["cell"], "morning_act": ["gym"]}
+    with pytest.raises(validate.PopulationError,
+                       match="800 residents' morning_act places are of type \\['education', 'yard'\\]"):
+        core.load_population(params)